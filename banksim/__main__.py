@@ -0,0 +1,31 @@
+"""
+Command line tools of banksim
+
+    python -m banksim db merge result_archive.sqlite result_shards/
+"""
+import argparse
+
+from banksim.db.sqlitedb.shard import merge_shards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m banksim", description="banksim tools")
+    # required is set afterwards, add_subparsers only takes it as a keyword from Python 3.7
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    db = commands.add_parser("db", help="result databases").add_subparsers(dest="db_command")
+    db.required = True
+    merge = db.add_parser("merge", help="merge SQLite shards into an indexed archive")
+    merge.add_argument("archive", help="archive database, created if missing")
+    merge.add_argument("shards", nargs="+", help="shard files or directories of shards")
+    merge.add_argument("--init-query", default="conf/banksim_sqlite.sql", help="SQL script of a new archive")
+    merge.add_argument("--remove", action="store_true", help="delete shards once merged")
+    args = parser.parse_args(argv)
+
+    if args.command == "db" and args.db_command == "merge":
+        count = merge_shards(args.archive, args.shards, args.init_query, args.remove)
+        print("{} shards merged into {}".format(count, args.archive))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Struct-of-arrays agent populations
+"""
+
+import numpy as np
+
+
+class ColumnarAgents:
+    """
+    Base class of agent populations stored as NumPy columns
+
+    Rows are agents in creation order and bank_id holds the position of the agent's bank, so per-bank
+    totals are grouped reductions instead of scans over agent objects. Subclasses set view_class, the
+    object view returned for a single row, and define the columns.
+
+    Per-bank aggregates declared by _aggregate_groups are kept up to date as deltas: every state change goes
+    through a book method that unbooks the rows it touches, changes them and books them again. The same
+    bookings record the rows that move to another bank, and members_of merges them into the row indices of
+    a bank when it is looked up, so the rows of one bank are found without a scan of the whole store. Setting
+    debug_aggregates cross-checks the aggregates and members against a full recomputation after every change.
+    """
+
+    view_class = None
+
+    def __init__(self, n_banks):
+        self.n_banks = n_banks
+        self.debug_aggregates = False
+        self._members = None  # row-index arrays indexed by bank position, may hold rows that left the bank
+        self._joined = list()  # row-index arrays that moved to another bank since the last lookup
+        self._unbooked_bank_id = None  # bank_id of the rows between the unbooking and the booking of a change
+
+    def __len__(self):
+        return len(self.unique_id)
+
+    def __getitem__(self, idx):
+        return self.view_class(self, idx)
+
+    def __iter__(self):
+        return (self.view_class(self, idx) for idx in range(len(self)))
+
+    def group_by_bank(self, mask):
+        """
+        Split the rows selected by mask per bank
+
+        :param mask: boolean row mask that only selects rows assigned to a bank
+        :return: list indexed by bank position of row-index arrays in creation order
+        """
+        idx = np.flatnonzero(mask)
+        idx = idx[np.argsort(self.bank_id[idx], kind="stable")]
+        counts = np.bincount(self.bank_id[idx], minlength=self.n_banks)
+        return np.split(idx, np.cumsum(counts)[:-1])
+
+    def bank_sum(self, values, mask):
+        """
+        Per-bank sum of values over the rows selected by mask (boolean mask or row indices), indexed by
+        bank position
+        """
+        return np.bincount(self.bank_id[mask], weights=values[mask], minlength=self.n_banks)
+
+    def _aggregate_groups(self, rows):
+        """
+        Aggregates of the given rows, as (count name, mask of counted rows, {total name: row values}) triplets
+        """
+        return []
+
+    def recompute_aggregates(self):
+        """
+        Per-bank aggregates computed from scratch, keyed by name
+        """
+        res = dict()
+        rows = np.arange(len(self))
+        for count_name, counted, totals in self._aggregate_groups(rows):
+            bank_id = self.bank_id[rows[counted]]
+            res[count_name] = np.bincount(bank_id, minlength=self.n_banks)
+            for name, values in totals.items():
+                res[name] = np.bincount(bank_id, weights=values[counted], minlength=self.n_banks).astype(float)
+        return res
+
+    def recompute_members(self):
+        """
+        Row indices of every bank computed from scratch, indexed by bank position
+        """
+        return self.group_by_bank((self.bank_id >= 0) & (self.bank_id < self.n_banks))
+
+    def reset_aggregates(self):
+        for name, values in self.recompute_aggregates().items():
+            setattr(self, name, values)
+        self._members = self.recompute_members()
+        self._joined = list()
+
+    def members_of(self, bank_id):
+        """
+        Row indices of the bank at position bank_id in creation order
+
+        Rows that joined a bank since the last lookup are merged into the members of their bank first, and rows
+        that left a bank are dropped from it then or at its own lookup, so a lookup costs the members of the
+        banks and the moves since the last one instead of a scan of the store.
+        """
+        if self._joined:
+            joined = np.concatenate(self._joined)
+            self._joined = list()
+            joined = joined[(self.bank_id[joined] >= 0) & (self.bank_id[joined] < self.n_banks)]
+            joined = joined[np.lexsort((joined, self.bank_id[joined]))]
+            banks, starts = np.unique(self.bank_id[joined], return_index=True)
+            for bank, rows in zip(banks, np.split(joined, starts[1:])):
+                # both are ascending, a row that left and joined again is in both; rows that left are dropped
+                rows = np.sort(np.concatenate([self._members[bank], rows]))
+                rows = rows[np.concatenate([[True], rows[1:] != rows[:-1]])]
+                self._members[bank] = rows[self.bank_id[rows] == bank]
+        rows = self._members[bank_id]
+        rows = rows[self.bank_id[rows] == bank_id]
+        self._members[bank_id] = rows
+        return rows
+
+    def check_aggregates(self):
+        """
+        Cross-check the incrementally maintained aggregates and members against a full recomputation
+        """
+        for name, expected in self.recompute_aggregates().items():
+            if not np.allclose(getattr(self, name), expected, rtol=1e-9, atol=1e-9):
+                raise Exception("{} aggregate {} differs from its recomputation".format(type(self).__name__, name))
+        for bank_id, expected in enumerate(self.recompute_members()):
+            if not np.array_equal(self.members_of(bank_id), expected):
+                raise Exception("{} members of bank {} differ from their recomputation".format(
+                    type(self).__name__, bank_id))
+
+    def update(self, idx, name, values):
+        """
+        Set column name of rows idx and rebook their aggregates, e.g. for assignments through an agent view
+        """
+        rows = np.atleast_1d(idx)
+        self._book(rows, -1)
+        getattr(self, name)[rows] = values
+        self._book(rows, 1)
+
+    def _book(self, idx, sign):
+        """
+        Add (sign 1) or remove (sign -1) the contribution of unique rows idx to the aggregates
+        """
+        rows = np.asarray(idx, dtype=np.int64)
+        if sign < 0:
+            self._unbooked_bank_id = self.bank_id[rows].copy()
+        else:
+            self._record_moves(rows)
+        for count_name, counted, totals in self._aggregate_groups(rows):
+            bank_id = self.bank_id[rows[counted]]
+            count = getattr(self, count_name)
+            np.add.at(count, bank_id, sign)
+            for name, values in totals.items():
+                total = getattr(self, name)
+                np.add.at(total, bank_id, sign * values[counted])
+                # keep totals of banks left without rows at exactly zero
+                total[count == 0] = 0
+        if sign > 0 and self.debug_aggregates:
+            self.check_aggregates()
+
+    def _record_moves(self, rows):
+        """
+        Record the rows whose bank_id changed since they were unbooked, for members_of
+        """
+        rows = np.atleast_1d(rows)
+        moved = np.atleast_1d(self._unbooked_bank_id) != self.bank_id[rows]
+        self._unbooked_bank_id = None
+        if moved.any():
+            self._joined.append(rows[moved])
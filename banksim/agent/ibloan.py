@@ -2,50 +2,58 @@
 Inter-bank loan agent
 """
 
-from mesa import Agent
 
+class Ibloan:
+    """
+    Ibloan-like view of one edge of an IbloanBook
 
-class Ibloan(Agent):
+    Attributes read and write the edge buffer directly; creditor and debtor are resolved to the
+    Bank agents at the stored positions.
+    """
 
-    def __init__(self, params):
-        super().__init__(params.get("unique_id"), params.get("model"))
-        self.ib_rate = params.get("libor_rate")
-        self.ib_amount = 0
-        self.ib_last_color = None  # used to create visual effects
-        self.ib_creditor = None
-        self.ib_debtor = None
+    ib_last_color = None  # used to create visual effects
+
+    __slots__ = ("__ibloan_book", "__idx")
+
+    def __init__(self, ibloan_book, idx):
+        self.__ibloan_book = ibloan_book
+        self.__idx = idx
+
+    @property
+    def unique_id(self):
+        return int(self.__ibloan_book.unique_id[self.__idx])
 
     @property
     def ib_rate(self):
-        return self.__ib_rate
+        return float(self.__ibloan_book.rate[self.__idx])
 
     @ib_rate.setter
     def ib_rate(self, ib_rate):
-        self.__ib_rate = ib_rate
+        self.__ibloan_book.rate[self.__idx] = ib_rate
 
     @property
     def ib_amount(self):
-        return self.__ib_amount
+        return float(self.__ibloan_book.amount[self.__idx])
 
     @ib_amount.setter
     def ib_amount(self, ib_amount):
-        self.__ib_amount = ib_amount
+        self.__ibloan_book.amount[self.__idx] = ib_amount
 
     @property
     def ib_creditor(self):
-        return self.__ib_creditor
+        return self.__ibloan_book.banks[self.__ibloan_book.creditor[self.__idx]]
 
     @ib_creditor.setter
     def ib_creditor(self, ib_creditor):
-        self.__ib_creditor = ib_creditor
+        self.__ibloan_book.creditor[self.__idx] = ib_creditor.pos
 
     @property
     def ib_debtor(self):
-        return self.__ib_debtor
+        return self.__ibloan_book.banks[self.__ibloan_book.debtor[self.__idx]]
 
     @ib_debtor.setter
     def ib_debtor(self, ib_debtor):
-        self.__ib_debtor = ib_debtor
+        self.__ibloan_book.debtor[self.__idx] = ib_debtor.pos
 
     def get_all_variables(self):
         res = [
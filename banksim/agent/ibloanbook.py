@@ -0,0 +1,86 @@
+"""
+Edge buffer of inter-bank loans
+"""
+
+import numpy as np
+
+from banksim.agent.ibloan import Ibloan
+
+
+class IbloanBook:
+    """
+    Growable edge list of the inter-bank loans granted in the current step
+
+    Each loan is an edge from creditor to debtor bank position with an amount and a rate. The arrays are
+    preallocated and doubled when full; clear() only resets the edge count, so the buffer is reused every
+    step. Columns are exposed as views of the filled part and ibloan_book[idx] gives an Ibloan view.
+    """
+
+    def __init__(self, banks, capacity=64):
+        self.banks = banks  # Bank agents indexed by position
+        self.size = 0
+        self._unique_id = np.zeros(capacity, dtype=np.int64)
+        self._creditor = np.zeros(capacity, dtype=np.int64)
+        self._debtor = np.zeros(capacity, dtype=np.int64)
+        self._amount = np.zeros(capacity, dtype=float)
+        self._rate = np.zeros(capacity, dtype=float)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        return Ibloan(self, idx)
+
+    def __iter__(self):
+        return (Ibloan(self, idx) for idx in range(self.size))
+
+    @property
+    def unique_id(self):
+        return self._unique_id[:self.size]
+
+    @property
+    def creditor(self):
+        return self._creditor[:self.size]
+
+    @property
+    def debtor(self):
+        return self._debtor[:self.size]
+
+    @property
+    def amount(self):
+        return self._amount[:self.size]
+
+    @property
+    def rate(self):
+        return self._rate[:self.size]
+
+    def _grow(self):
+        capacity = 2 * len(self._amount)
+        for name in ("_unique_id", "_creditor", "_debtor", "_amount", "_rate"):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def add(self, unique_id, creditor, debtor, amount, rate):
+        """
+        Append a loan from the bank at position creditor to the bank at position debtor
+        """
+        if self.size == len(self._amount):
+            self._grow()
+        idx = self.size
+        self._unique_id[idx] = unique_id
+        self._creditor[idx] = creditor
+        self._debtor[idx] = debtor
+        self._amount[idx] = amount
+        self._rate[idx] = rate
+        self.size += 1
+
+    def clear(self):
+        self.size = 0
+
+    def edges(self):
+        """
+        (creditor, debtor) position pairs, e.g. to materialize the network graph
+        """
+        return list(zip(self.creditor.tolist(), self.debtor.tolist()))
@@ -0,0 +1,60 @@
+"""
+Per-bank agent index
+"""
+
+import numpy as np
+
+from banksim.agent.saverpool import UNASSIGNED_BANK_ID
+
+
+class AgentIndex:
+    """
+    Index of the bank members kept on BankSim
+
+    Loans are looked up by (pos, loan_approved, loan_solvent), savers by (pos, owns_account) and inter-bank
+    loans by creditor and debtor position. The members live in the columnar stores of the model, loan_book,
+    saver_pool and ibloan_book. Loans and savers of a bank come from the members the stores keep per bank
+    with every booking, so a lookup costs the size of the bank, not of the store; unassigned savers and
+    inter-bank loans, a small buffer of the current step, are found by a scan. Lookups return row indices of
+    the store in creation order, i.e. in unique_id order; store[idx] gives the agent view of a row.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    @property
+    def banks(self):
+        return self.model.banks
+
+    def loans(self, pos=None, approved=None, solvent=None):
+        """
+        Rows of loan_book lent by the bank at pos (all loans if pos is None), optionally filtered by state
+        """
+        if pos is None:
+            return np.flatnonzero(self.model.loan_book.mask(approved, solvent))
+        return self.model.loan_book.bank_members(pos, approved, solvent)
+
+    def savers(self, pos, owns_account=None):
+        """
+        Rows of saver_pool placed at the bank at pos, optionally filtered by account ownership
+        """
+        return self.model.saver_pool.bank_members(pos, owns_account)
+
+    def unassigned_savers(self):
+        """
+        Rows of saver_pool that withdrew and wait for reassignment
+        """
+        return np.flatnonzero(self.model.saver_pool.bank_id == UNASSIGNED_BANK_ID)
+
+    def ibloans(self, creditor=None, debtor=None):
+        """
+        Rows of ibloan_book lent by the bank at position creditor and borrowed by the bank at position debtor,
+        either filter matches every bank when None
+        """
+        ibloan_book = self.model.ibloan_book
+        res = np.ones(len(ibloan_book), dtype=bool)
+        if creditor is not None:
+            res &= ibloan_book.creditor == creditor
+        if debtor is not None:
+            res &= ibloan_book.debtor == debtor
+        return np.flatnonzero(res)
@@ -2,206 +2,162 @@
 Loan agent
 """
 
-from mesa import Agent
-from numpy.random import uniform
-
-
-class Loan(Agent):
-
-    def __init__(self, params):
-        super().__init__(params.get("unique_id"), params.get("model"))
-        # amount of loan - set to unity
-        self.amount = params.get("amount")
-        # is loan solvent?
-        self.loan_solvent = params.get("loan_solvent")
-        # is loan loan-approved?
-        self.loan_approved = params.get("loan_approved")
-        # loan dumped during risk-weighted-optimization
-        self.loan_dumped = params.get("loan_dumped")
-        # loan liquidated owing to bank-bankruptcy
-        self.loan_liquidated = params.get("loan_liquidated")
-        # true probability of default
-        self.pdef = uniform(high=params.get("pdf_upper"))
-        # true risk-weight of the loan
-        self.rweight = 0.5 + (self.pdef * 5.0)
-        # recovery rate in case of default
-        self.rcvry_rate = params.get("rcvry_rate")
-        # rate quoted by lending bank
-        self.rate_quote = (((1 + params.get("rfree")) - (self.rcvry_rate * self.pdef)) / (1 - self.pdef) - 1) * 1.2
-        # loss given default (1-rcvry-rate) * amount
-        self.lgdamount = (1 - self.rcvry_rate) * self.amount
-        # rcvry-rate * amount
-        self.loan_recovery = self.rcvry_rate * self.amount
-        # amount * (1 + rate-quote)
-        self.loan_plus_rate = (1 + self.rate_quote) * self.amount
-        # amount * rate-quote
-        self.interest_payment = self.rate_quote * self.amount
-        # amount * rweight
-        self.rwamount = self.rweight * self.amount
-        # loss percent if sold or removed from bank book
-        self.fire_sale_loss = uniform(high=params.get("firesale_upper"))
-        # loan rating - we can specify the rating and then assign pdef from a table - not used
-        self.rating = None
-        # Identity of loan's neighborhood - useful for analyzing cross-country/ regional lending patterns
-        self.region_id = None
-        # identity of lending bank
-        self.bank_id = None
-        # maximum rate borrower is willing to pay [not used here]
-        self.rate_reservation = None
-        # used to create visual effects
-        self.loan_last_color = None
+
+class Loan:
+    """
+    Loan-like view of one row of a LoanBook
+
+    Attributes read the columns of the book directly, so views never go stale and can be created on demand,
+    e.g. for logging agent variables. Assignments go through LoanBook.update, which keeps the per-bank
+    aggregates in step.
+    """
+
+    # loan rating - we can specify the rating and then assign pdef from a table - not used
+    rating = None
+    # Identity of loan's neighborhood - useful for analyzing cross-country/ regional lending patterns
+    region_id = None
+    # maximum rate borrower is willing to pay [not used here]
+    rate_reservation = None
+    # used to create visual effects
+    loan_last_color = None
+
+    __slots__ = ("__loan_book", "__idx")
+
+    def __init__(self, loan_book, idx):
+        self.__loan_book = loan_book
+        self.__idx = idx
+
+    @property
+    def unique_id(self):
+        return int(self.__loan_book.unique_id[self.__idx])
 
     @property
     def pdef(self):
-        return self.__pdef
+        return float(self.__loan_book.pdef[self.__idx])
 
     @pdef.setter
     def pdef(self, pdef):
-        self.__pdef = pdef
+        self.__loan_book.update(self.__idx, "pdef", pdef)
 
     @property
     def amount(self):
-        return self.__amount
+        return float(self.__loan_book.amount[self.__idx])
 
     @amount.setter
     def amount(self, amount):
-        self.__amount = amount
+        self.__loan_book.update(self.__idx, "amount", amount)
 
     @property
     def rweight(self):
-        return self.__rweight
+        return float(self.__loan_book.rweight[self.__idx])
 
     @rweight.setter
     def rweight(self, rweight):
-        self.__rweight = rweight
+        self.__loan_book.update(self.__idx, "rweight", rweight)
+
+    @property
+    def rwamount(self):
+        return float(self.__loan_book.rwamount[self.__idx])
+
+    @rwamount.setter
+    def rwamount(self, rwamount):
+        self.__loan_book.update(self.__idx, "rwamount", rwamount)
 
     @property
     def lgdamount(self):
-        return self.__lgdamount
+        return float(self.__loan_book.lgdamount[self.__idx])
 
     @lgdamount.setter
     def lgdamount(self, lgdamount):
-        self.__lgdamount = lgdamount
+        self.__loan_book.update(self.__idx, "lgdamount", lgdamount)
 
     @property
     def loan_recovery(self):
-        return self.__loan_recovery
+        return float(self.__loan_book.loan_recovery[self.__idx])
 
     @loan_recovery.setter
     def loan_recovery(self, loan_recovery):
-        self.__loan_recovery = loan_recovery
+        self.__loan_book.update(self.__idx, "loan_recovery", loan_recovery)
 
     @property
     def rcvry_rate(self):
-        return self.__rcvry_rate
+        return float(self.__loan_book.rcvry_rate[self.__idx])
 
     @rcvry_rate.setter
     def rcvry_rate(self, rcvry_rate):
-        self.__rcvry_rate = rcvry_rate
+        self.__loan_book.update(self.__idx, "rcvry_rate", rcvry_rate)
 
     @property
     def fire_sale_loss(self):
-        return self.__fire_sale_loss
+        return float(self.__loan_book.fire_sale_loss[self.__idx])
 
     @fire_sale_loss.setter
     def fire_sale_loss(self, fire_sale_loss):
-        self.__fire_sale_loss = fire_sale_loss
-
-    @property
-    def rating(self):
-        return self.__rating
-
-    @rating.setter
-    def rating(self, rating):
-        self.__rating = rating
-
-    @property
-    def region_id(self):
-        return self.__region_id
-
-    @region_id.setter
-    def region_id(self, region_id):
-        self.__region_id = region_id
+        self.__loan_book.update(self.__idx, "fire_sale_loss", fire_sale_loss)
 
     @property
     def loan_approved(self):
-        return self.__loan_approved
+        return bool(self.__loan_book.loan_approved[self.__idx])
 
     @loan_approved.setter
     def loan_approved(self, loan_approved):
-        self.__loan_approved = loan_approved
+        self.__loan_book.update(self.__idx, "loan_approved", loan_approved)
 
     @property
     def loan_solvent(self):
-        return self.__loan_solvent
+        return bool(self.__loan_book.loan_solvent[self.__idx])
 
     @loan_solvent.setter
     def loan_solvent(self, loan_solvent):
-        self.__loan_solvent = loan_solvent
+        self.__loan_book.update(self.__idx, "loan_solvent", loan_solvent)
 
     @property
     def loan_dumped(self):
-        return self.__loan_dumped
+        return bool(self.__loan_book.loan_dumped[self.__idx])
 
     @loan_dumped.setter
     def loan_dumped(self, loan_dumped):
-        self.__loan_dumped = loan_dumped
+        self.__loan_book.update(self.__idx, "loan_dumped", loan_dumped)
 
     @property
     def loan_liquidated(self):
-        return self.__loan_liquidated
+        return bool(self.__loan_book.loan_liquidated[self.__idx])
 
     @loan_liquidated.setter
     def loan_liquidated(self, loan_liquidated):
-        self.__loan_liquidated = loan_liquidated
+        self.__loan_book.update(self.__idx, "loan_liquidated", loan_liquidated)
 
     @property
     def bank_id(self):
-        return self.__bank_id
+        return int(self.__loan_book.bank_id[self.__idx])
 
     @bank_id.setter
     def bank_id(self, bank_id):
-        self.__bank_id = bank_id
+        self.__loan_book.update(self.__idx, "bank_id", bank_id)
 
     @property
     def rate_quote(self):
-        return self.__rate_quote
+        return float(self.__loan_book.rate_quote[self.__idx])
 
     @rate_quote.setter
     def rate_quote(self, rate_quote):
-        self.__rate_quote = rate_quote
-
-    @property
-    def rate_reservation(self):
-        return self.__rate_reservation
-
-    @rate_reservation.setter
-    def rate_reservation(self, rate_reservation):
-        self.__rate_reservation = rate_reservation
+        self.__loan_book.update(self.__idx, "rate_quote", rate_quote)
 
     @property
     def loan_plus_rate(self):
-        return self.__loan_plus_rate
+        return float(self.__loan_book.loan_plus_rate[self.__idx])
 
     @loan_plus_rate.setter
     def loan_plus_rate(self, loan_plus_rate):
-        self.__loan_plus_rate = loan_plus_rate
+        self.__loan_book.update(self.__idx, "loan_plus_rate", loan_plus_rate)
 
     @property
     def interest_payment(self):
-        return self.__interest_payment
+        return float(self.__loan_book.interest_payment[self.__idx])
 
     @interest_payment.setter
     def interest_payment(self, interest_payment):
-        self.__interest_payment = interest_payment
-
-    @property
-    def loan_last_color(self):
-        return self.__loan_last_color
-
-    @loan_last_color.setter
-    def loan_last_color(self, loan_last_color):
-        self.__loan_last_color = loan_last_color
+        self.__loan_book.update(self.__idx, "interest_payment", interest_payment)
 
     def get_all_variables(self):
         res = [
@@ -0,0 +1,132 @@
+"""
+Columnar loan book
+"""
+
+import numpy as np
+
+from banksim.agent.columnar import ColumnarAgents
+from banksim.agent.loan import Loan
+
+LIQUIDATED_BANK_ID = 9999  # bank_id of loans liquidated with an insolvent bank
+
+
+class LoanBook(ColumnarAgents):
+    """
+    Struct-of-arrays store of every loan in the banking system
+
+    Each Loan attribute is a NumPy column indexed by loan position, and bank_id is the position of the
+    lending bank, so per-bank totals are grouped reductions (np.bincount) instead of scans over Loan agents.
+    Rows of a bank keep their creation order, which is the order the former Loan agents had in the schedule.
+    loan_book[idx] gives a Loan view of a single row for code that still wants agents.
+    """
+
+    view_class = Loan
+
+    def __init__(self, params):
+        super().__init__(params.get("n_banks"))
+        size = params.get("size")
+        rng = params.get("rng")
+        self.unique_id = np.arange(params.get("unique_id"), params.get("unique_id") + size)
+        # amount of loan - set to unity
+        self.amount = np.full(size, params.get("amount"), dtype=float)
+        # is loan solvent?
+        self.loan_solvent = np.full(size, params.get("loan_solvent"), dtype=bool)
+        # is loan loan-approved?
+        self.loan_approved = np.full(size, params.get("loan_approved"), dtype=bool)
+        # loan dumped during risk-weighted-optimization
+        self.loan_dumped = np.full(size, params.get("loan_dumped"), dtype=bool)
+        # loan liquidated owing to bank-bankruptcy
+        self.loan_liquidated = np.full(size, params.get("loan_liquidated"), dtype=bool)
+        # true probability of default
+        self.pdef = rng.uniform(high=params.get("pdf_upper"), size=size)
+        # true risk-weight of the loan
+        self.rweight = 0.5 + (self.pdef * 5.0)
+        # recovery rate in case of default
+        self.rcvry_rate = np.full(size, params.get("rcvry_rate"), dtype=float)
+        # rate quoted by lending bank
+        self.rate_quote = (((1 + params.get("rfree")) - (self.rcvry_rate * self.pdef)) / (1 - self.pdef) - 1) * 1.2
+        # loss given default (1-rcvry-rate) * amount
+        self.lgdamount = (1 - self.rcvry_rate) * self.amount
+        # rcvry-rate * amount
+        self.loan_recovery = self.rcvry_rate * self.amount
+        # amount * (1 + rate-quote)
+        self.loan_plus_rate = (1 + self.rate_quote) * self.amount
+        # amount * rate-quote
+        self.interest_payment = self.rate_quote * self.amount
+        # amount * rweight
+        self.rwamount = self.rweight * self.amount
+        # loss percent if sold or removed from bank book
+        self.fire_sale_loss = rng.uniform(high=params.get("firesale_upper"), size=size)
+        # identity of lending bank
+        self.bank_id = np.full(size, LIQUIDATED_BANK_ID, dtype=np.int64)
+        # per-bank count, amount, rwamount and provision (pdef * lgdamount) of approved, solvent loans
+        self.approved_count = None
+        self.approved_amount = None
+        self.approved_rwamount = None
+        self.approved_provision = None
+        self.reset_aggregates()
+
+    def _aggregate_groups(self, rows):
+        counted = self.loan_approved[rows] & self.loan_solvent[rows] & (self.bank_id[rows] != LIQUIDATED_BANK_ID)
+        return [("approved_count", counted, {"approved_amount": self.amount[rows],
+                                             "approved_rwamount": self.rwamount[rows],
+                                             "approved_provision": self.pdef[rows] * self.lgdamount[rows]})]
+
+    def mask(self, approved=None, solvent=None):
+        """
+        Boolean row mask of loans in the given approval and solvency state (None matches both)
+        """
+        res = np.ones(len(self), dtype=bool)
+        if approved is not None:
+            res &= self.loan_approved if approved else ~self.loan_approved
+        if solvent is not None:
+            res &= self.loan_solvent if solvent else ~self.loan_solvent
+        return res
+
+    def bank_members(self, bank_id, approved=None, solvent=None):
+        """
+        Row indices of a single bank's loans in the given state, filtered from the members of the bank
+        """
+        rows = self.members_of(bank_id)
+        if approved is not None:
+            rows = rows[self.loan_approved[rows] == approved]
+        if solvent is not None:
+            rows = rows[self.loan_solvent[rows] == solvent]
+        return rows.copy()
+
+    def assign(self, idx, bank_id):
+        self._book(idx, -1)
+        self.bank_id[idx] = bank_id
+        self._book(idx, 1)
+
+    def approve(self, idx, bank_id=None):
+        self._book(idx, -1)
+        self.loan_approved[idx] = True
+        if bank_id is not None:
+            self.bank_id[idx] = bank_id
+        self._book(idx, 1)
+
+    def default(self, idx):
+        self._book(idx, -1)
+        self.loan_solvent[idx] = False
+        self._book(idx, 1)
+
+    def dump(self, idx):
+        self._book(idx, -1)
+        self.loan_dumped[idx] = True
+        self.loan_approved[idx] = False
+        self._book(idx, 1)
+
+    def reset(self, idx):
+        self._book(idx, -1)
+        self.loan_solvent[idx] = True
+        self.loan_approved[idx] = False
+        self._book(idx, 1)
+
+    def liquidate(self, idx):
+        self._book(idx, -1)
+        self.bank_id[idx] = LIQUIDATED_BANK_ID
+        self.loan_approved[idx] = False
+        self.loan_solvent[idx] = False
+        self.loan_liquidated[idx] = True
+        self._book(idx, 1)
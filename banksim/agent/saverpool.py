@@ -0,0 +1,100 @@
+"""
+Columnar saver population
+"""
+
+import numpy as np
+
+from banksim.agent.columnar import ColumnarAgents
+from banksim.agent.saver import Saver
+
+UNASSIGNED_BANK_ID = 9999  # bank_id of savers who withdrew and wait for reassignment
+
+
+class SaverPool(ColumnarAgents):
+    """
+    Struct-of-arrays store of every saver in the banking system
+
+    bank_id is the position of the saver's bank, or 9999 between a withdrawal and the reassignment
+    to a new bank. saver_pool[idx] gives a Saver view of a single row.
+    """
+
+    view_class = Saver
+
+    def __init__(self, params):
+        super().__init__(params.get("n_banks"))
+        size = params.get("size")
+        rng = params.get("rng")
+        self.unique_id = np.arange(params.get("unique_id"), params.get("unique_id") + size)
+        # deposit balance with bank
+        self.balance = np.full(size, params.get("balance"), dtype=float)
+        # owns account with bank-id
+        self.owns_account = np.full(size, params.get("owns_account"), dtype=bool)
+        # solvent if bank returns principal, may become insolvent if bank is bankrupt
+        self.saver_solvent = np.full(size, params.get("saver_solvent"), dtype=bool)
+        # probability of withdrawing deposit and shift to other bank
+        self.withdraw_prob = rng.uniform(high=params.get("withdraw_upperbound"), size=size)
+        # probability that saver withdraws and exits banking system
+        self.exit_prob = rng.uniform(high=params.get("exitprob_upperbound"), size=size)
+        # saver exits the banking system?
+        self.saver_exit = np.full(size, params.get("saver_exit"), dtype=bool)
+        # identity of saver's bank
+        self.bank_id = np.full(size, UNASSIGNED_BANK_ID, dtype=np.int64)
+        # per-bank count and balance of all savers assigned to the bank, and of those owning an account
+        self.assigned_count = None
+        self.assigned_balance = None
+        self.account_count = None
+        self.account_balance = None
+        self.reset_aggregates()
+
+    def _aggregate_groups(self, rows):
+        assigned = self.bank_id[rows] != UNASSIGNED_BANK_ID
+        return [("assigned_count", assigned, {"assigned_balance": self.balance[rows]}),
+                ("account_count", assigned & self.owns_account[rows], {"account_balance": self.balance[rows]})]
+
+    def mask(self, owns_account=None, saver_solvent=None):
+        """
+        Boolean row mask of savers assigned to a bank, in the given account and solvency state
+        """
+        res = self.bank_id != UNASSIGNED_BANK_ID
+        if owns_account is not None:
+            res &= self.owns_account if owns_account else ~self.owns_account
+        if saver_solvent is not None:
+            res &= self.saver_solvent if saver_solvent else ~self.saver_solvent
+        return res
+
+    def bank_members(self, bank_id, owns_account=None):
+        """
+        Row indices of a single bank's savers, filtered from the members of the bank
+        """
+        rows = self.members_of(bank_id)
+        if owns_account is not None:
+            rows = rows[self.owns_account[rows] == owns_account]
+        return rows.copy()
+
+    def assign(self, idx, bank_id):
+        self._book(idx, -1)
+        self.bank_id[idx] = bank_id
+        self._book(idx, 1)
+
+    def open_account(self, idx, bank_id):
+        self._book(idx, -1)
+        self.bank_id[idx] = bank_id
+        self.owns_account[idx] = True
+        self._book(idx, 1)
+
+    def close_account(self, idx):
+        self._book(idx, -1)
+        self.owns_account[idx] = False
+        self._book(idx, 1)
+
+    def withdraw(self, idx):
+        self._book(idx, -1)
+        self.bank_id[idx] = UNASSIGNED_BANK_ID
+        self.owns_account[idx] = False
+        self._book(idx, 1)
+
+    def default(self, idx):
+        self._book(idx, -1)
+        self.saver_solvent[idx] = False
+        self.balance[idx] = 0
+        self._book(idx, 1)
@@ -1,56 +1,54 @@
-from banksim.agent.bank import Bank
-from banksim.agent.loan import Loan
-from banksim.agent.saver import Saver
+import numpy as np
 
 
-def initialize_deposit_base(schedule):
-    for bank in [x for x in schedule.agents if isinstance(x, Bank)]:
-        savers = [x for x in schedule.agents if isinstance(x, Saver) and x.pos == bank.pos]
-        for saver in savers:
-            saver.bank_id = bank.pos
-            saver.owns_account = True
-        bank.bank_deposits = sum([x.balance for x in savers])
+def initialize_deposit_base(model):
+    saver_pool = model.saver_pool
+    savers = np.flatnonzero(saver_pool.mask())
+    saver_pool.open_account(savers, saver_pool.bank_id[savers])
+    for bank in model.banks:
+        bank.bank_deposits = float(saver_pool.account_balance[bank.pos])
         bank.bank_reserves = bank.bank_deposits + bank.equity
 
 
-def initialize_loan_book(schedule, car, min_reserves_ratio):
-    for bank in [x for x in schedule.agents if isinstance(x, Bank)]:
+def initialize_loan_book(model, car, min_reserves_ratio):
+    loan_book = model.loan_book
+    avail_loans = loan_book.group_by_bank(loan_book.mask(approved=False))
+    for bank in model.banks:
         bank.bank_reserves = bank.equity + bank.bank_deposits
         bank.calculate_reserve_ratio()
         bank.max_rwa = bank.equity / (1.1 * car)
-        interim_reserves = bank.bank_reserves
-        interim_deposits = bank.bank_deposits
-        interim_reserves_ratio = bank.reserves_ratio
-        rwa = 0
-        unit_loan = 0
-        available_loans = True
+        loans = avail_loans[bank.pos]
+        amount = loan_book.amount[loans]
 
-        for i, loan in enumerate([x for x in schedule.agents if
-                     isinstance(x, Loan) and bank.pos == x.pos and not x.loan_approved]):
-            # This is original script on netlogo. But it spends a lot of time to calculate
-            #
-            # while available_loans and rwa < bank.max_rwa and \
-            #
-            #         interim_reserves_ratio > bank.buffer_reserves_ratio * self.min_reserves_ratio:
-            #     loans = [x for x in self.schedule.agents if
-            #              isinstance(x, Loan) and bank.pos == x.pos and not x.loan_approved]
-            #     if len(loans) > 0:
-            #         loan = random.choice(loans)
-            if available_loans and rwa < bank.max_rwa and \
-                    interim_reserves_ratio > bank.buffer_reserves_ratio * min_reserves_ratio:
-                interim_reserves = interim_reserves - loan.amount
-                interim_reserves_ratio = interim_reserves / interim_deposits if interim_deposits != 0 else 0
-                loan.loan_approved = True
-                unit_loan = unit_loan + loan.amount
-                rwa = rwa + loan.rweight * loan.amount
-                # TO DO: Change bank node color to yellow
-        bank.bank_loans = unit_loan
-        bank.rwassets = rwa
+        # This is original script on netlogo. But it spends a lot of time to calculate
+        #
+        # while available_loans and rwa < bank.max_rwa and \
+        #
+        #         interim_reserves_ratio > bank.buffer_reserves_ratio * self.min_reserves_ratio:
+        #     loans = [x for x in self.schedule.agents if
+        #              isinstance(x, Loan) and bank.pos == x.pos and not x.loan_approved]
+        #     if len(loans) > 0:
+        #         loan = random.choice(loans)
+        #
+        # Loans are taken in order while the rwa and reserves ratio before taking the next loan are
+        # within bounds. Both only move towards their bound, so the loans taken are a prefix whose
+        # running totals are cumulative sums (np.cumsum adds in the same order as the loop did).
+        rwa = np.cumsum(np.concatenate(([0], loan_book.rweight[loans] * amount)))
+        interim_reserves = np.cumsum(np.concatenate(([bank.bank_reserves], -amount)))
+        interim_reserves_ratio = interim_reserves / bank.bank_deposits if bank.bank_deposits != 0 else \
+            np.zeros(len(interim_reserves))
+        interim_reserves_ratio[0] = bank.reserves_ratio
+        within_bounds = (rwa[:-1] < bank.max_rwa) & \
+                        (interim_reserves_ratio[:-1] > bank.buffer_reserves_ratio * min_reserves_ratio)
+        n_approved = len(loans) if within_bounds.all() else int(np.argmin(within_bounds))
+        loan_book.approve(loans[:n_approved])
+        # TO DO: Change bank node color to yellow
+        bank.bank_loans = float(np.cumsum(np.concatenate(([0], amount)))[n_approved]) if n_approved else 0
+        bank.rwassets = float(rwa[n_approved]) if n_approved else 0
         bank.bank_reserves = bank.bank_deposits + bank.equity - bank.bank_loans
         bank.calculate_reserve_ratio()
         bank.calculate_capital_ratio()
-        bank.bank_provisions = sum([x.pdef * x.lgdamount for x in schedule.agents if isinstance(x, Loan) and
-                                    bank.pos == x.pos and x.loan_approved and x.loan_solvent])
+        bank.bank_provisions = float(loan_book.approved_provision[bank.pos])
         bank.bank_solvent = True
         bank.calculate_total_assets()
-        bank.calculate_leverage_ratio()
\ No newline at end of file
+        bank.calculate_leverage_ratio()
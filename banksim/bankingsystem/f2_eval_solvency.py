@@ -1,76 +1,86 @@
 import logging
-import random
 
 import numpy as np
 
-from banksim.agent.bank import Bank
-from banksim.agent.loan import Loan
-from banksim.agent.saver import Saver
 
-
-def calculate_credit_loss_loan_book(schedule, solvent_bank):
-    loans_with_bank = [x for x in schedule.agents if isinstance(x, Loan) and x.pos == solvent_bank.pos and
-                       x.loan_approved and x.loan_solvent]
-    for loan in loans_with_bank:
-        if loan.pdef > random.random():
-            loan.loan_solvent = False
-            # TO DO: change color to magenta
-        loan.rwamount = loan.rweight * loan.amount
-    loans_with_bank_default = [x for x in loans_with_bank if not x.loan_solvent]
+def draw_loan_defaults(model, solvent_banks, rng):
+    """
+    Draw defaults of every approved, solvent loan lent by the solvent banks in one pass
+
+    :param model: BankSim model
+    :param solvent_banks: banks whose loan book is evaluated
+    :param rng: numpy Generator of the solvency phase
+    :return: dict of arrays indexed by bank position, holding rwamount, lgdamount, loan_recovery and amount
+             summed over the defaulted loans, and the new provisions and interest_payment of the loans
+             that remain solvent
+    """
+    loan_book = model.loan_book
+    bank_solvent = np.zeros(loan_book.n_banks, dtype=bool)
+    bank_solvent[[x.pos for x in solvent_banks]] = True
+    loans = np.flatnonzero(loan_book.mask(approved=True, solvent=True))
+    loans = loans[bank_solvent[loan_book.bank_id[loans]]]
+    defaulted = loans[loan_book.pdef[loans] > rng.random(len(loans))]
+    loan_book.default(defaulted)
+    # TO DO: change color to magenta
+    performing = loans[loan_book.loan_solvent[loans]]
+    credit_loss = {name: loan_book.bank_sum(getattr(loan_book, name), defaulted)
+                   for name in ("rwamount", "lgdamount", "loan_recovery", "amount")}
+    credit_loss["provisions"] = loan_book.approved_provision.copy()
+    credit_loss["interest_payment"] = loan_book.bank_sum(loan_book.interest_payment, performing)
+    return credit_loss
+
+
+def calculate_credit_loss_loan_book(solvent_bank, credit_loss):
+    pos = solvent_bank.pos
     # notice that deposits do not change when loans are defaulting
-    solvent_bank.rwassets = solvent_bank.rwassets - sum([x.rwamount for x in loans_with_bank_default])
+    solvent_bank.rwassets = solvent_bank.rwassets - float(credit_loss["rwamount"][pos])
     # Add provision to equity to obtain the total buffer against credit losses,
     # substract losses, and calculate the equity amount before new provisions
-    solvent_bank.equity = solvent_bank.equity - sum([x.lgdamount for x in loans_with_bank_default])
+    solvent_bank.equity = solvent_bank.equity - float(credit_loss["lgdamount"][pos])
     # Calculate the new required level of provisions and substract of equity
     # equity may be negative but do not set the bank to default yet until
     # net income is calculated
     # Notice that banks with negative equity are not allowed to optimize risk-weights
     # - in principle, reducing the loan book could release provisions and make the bank
     # solvent again
-    solvent_bank.bank_new_provisions = sum(
-        [x.pdef * x.lgdamount for x in schedule.agents if isinstance(x, Loan)
-         and x.pos == solvent_bank.pos and x.loan_approved and x.loan_solvent])
+    solvent_bank.bank_new_provisions = float(credit_loss["provisions"][pos])
 
     change_in_provisions = solvent_bank.bank_new_provisions - solvent_bank.bank_provisions
 
     solvent_bank.bank_provisions = solvent_bank.bank_new_provisions
     solvent_bank.equity = solvent_bank.equity - change_in_provisions
-    solvent_bank.bank_reserves = solvent_bank.bank_reserves + sum([x.loan_recovery for x in loans_with_bank_default])
+    solvent_bank.bank_reserves = solvent_bank.bank_reserves + float(credit_loss["loan_recovery"][pos])
     solvent_bank.bank_reserves = solvent_bank.bank_reserves - change_in_provisions
-    solvent_bank.bank_loans = solvent_bank.bank_loans - sum([x.amount for x in loans_with_bank_default])
-    solvent_bank.defaulted_loans = solvent_bank.defaulted_loans + sum([x.amount for x in loans_with_bank_default])
+    defaulted_amount = float(credit_loss["amount"][pos])
+    solvent_bank.bank_loans = solvent_bank.bank_loans - defaulted_amount
+    solvent_bank.defaulted_loans = solvent_bank.defaulted_loans + defaulted_amount
     solvent_bank.calculate_total_assets()
 
 
-def calculate_interest_income_loans(schedule, reserve_rates, solvent_bank):
-    loans_with_bank = [x for x in schedule.agents if isinstance(x, Loan) and x.pos == solvent_bank.pos and
-                       x.loan_approved and x.loan_solvent]
-    solvent_bank.interest_income = sum([x.interest_payment for x in loans_with_bank])
+def calculate_interest_income_loans(reserve_rates, solvent_bank, credit_loss):
+    solvent_bank.interest_income = float(credit_loss["interest_payment"][solvent_bank.pos])
     solvent_bank.interest_income = solvent_bank.interest_income + \
                                    (solvent_bank.bank_reserves + solvent_bank.bank_provisions) * reserve_rates
 
 
-def calculate_interest_expense_deposits(schedule, solvent_bank):
-    savers = [x for x in schedule.agents if isinstance(x, Saver) and x.pos == solvent_bank.pos]
-    solvent_bank.interest_expense = sum([x.balance for x in savers]) * solvent_bank.rdeposits
+def calculate_interest_expense_deposits(solvent_bank, savers_balance):
+    solvent_bank.interest_expense = savers_balance * solvent_bank.rdeposits
 
 
 def calculate_net_interest_income(solvent_bank):
     solvent_bank.net_interest_income = solvent_bank.interest_income - solvent_bank.interest_expense
 
 
-def process_unwind_loans_insolvent_bank(schedule, bankrupt_liquidation, solvent_bank):
+def process_unwind_loans_insolvent_bank(model, bankrupt_liquidation, solvent_bank, rng):
     logging.info('Insolvent bank: %d', solvent_bank.pos)
     # Remember bank enters with negative equity after posting the required provisions
     # so the money available from provisions is:
     # bank-provisions + equity (the latter is negative)
-    loans_with_insolvent_bank = [x for x in schedule.agents if isinstance(x, Loan) and
-                                 x.pos == solvent_bank.pos and x.loan_approved and x.loan_solvent]
-    savers_with_insolvent_bank = [x for x in schedule.agents if isinstance(x, Saver) and
-                                  x.pos == solvent_bank.pos and x.owns_account]
-    for saver in savers_with_insolvent_bank:
-        saver.owns_account = False
+    loan_book = model.loan_book
+    loans_with_insolvent_bank = model.agent_index.loans(solvent_bank.pos, approved=True, solvent=True)
+    saver_pool = model.saver_pool
+    savers_with_insolvent_bank = model.agent_index.savers(solvent_bank.pos, owns_account=True)
+    saver_pool.close_account(savers_with_insolvent_bank)
     # Two possible options when bank is insolvent:
     # 0. loans become insolvent, bank recovers recovery from loans
     # is lgdamount the right amount?
@@ -79,10 +89,11 @@ def process_unwind_loans_insolvent_bank(schedule, bankrupt_liquidation, solvent_
     #  let proceeds-from-liquidated-loans sum [ lgdamount] of
     #    loans-with-insolvent-bank
     if bankrupt_liquidation == 0:
-        proceed_from_loans = sum([x.loan_recovery for x in loans_with_insolvent_bank])
+        proceed_from_loans = float(loan_book.loan_recovery[loans_with_insolvent_bank].sum())
     # 1. loans are sold in the bankingsystem, and banks suffer fire-sale losses
     elif bankrupt_liquidation == 1:
-        proceed_from_loans = sum([(1 - x.fire_sale_loss) * x.amount for x in loans_with_insolvent_bank])
+        proceed_from_loans = float(((1 - loan_book.fire_sale_loss[loans_with_insolvent_bank]) *
+                                    loan_book.amount[loans_with_insolvent_bank]).sum())
 
     # Notice in this calculation that bank-provisions + equity < bank-provisions
     # since equity is negative for banks forced to unwind loan portfolio
@@ -91,28 +102,20 @@ def process_unwind_loans_insolvent_bank(schedule, bankrupt_liquidation, solvent_
     # Note that when bank is illiquid, recovered-funds may be negative
     # in this case, the bank cannot pay any of the savers
     if recovered_funds < 0:
-        for saver in savers_with_insolvent_bank:
-            saver.saver_solvent = False
-            saver.balance = 0
-            # TO DO: change color to BROWN
+        saver_pool.default(savers_with_insolvent_bank)
+        # TO DO: change color to BROWN
     # WHY it counts numbers of savers instead of balance sum???
     if 0 < recovered_funds < len(savers_with_insolvent_bank):
-        for saver in random.sample(savers_with_insolvent_bank, int(np.ceil(len(savers_with_insolvent_bank) - recovered_funds))):
-            saver.saver_solvent = False
-            saver.balance = 0
-            # TO DO: change colour to brown
-
-    for loan in loans_with_insolvent_bank:
-        loan.bank_id = 9999
-        loan.loan_approved = False
-        loan.loan_solvent = False
-        loan.loan_liquidated = True
-        # TO DO: change colour to turquoise
+        saver_pool.default(rng.choice(savers_with_insolvent_bank,
+                                      int(np.ceil(len(savers_with_insolvent_bank) - recovered_funds)),
+                                      replace=False))
+        # TO DO: change colour to brown
+
+    loan_book.liquidate(loans_with_insolvent_bank)
+    # TO DO: change colour to turquoise
     # they should add to zero 0
-    solvent_bank.bank_loans = sum([x.amount for x in schedule.agents if isinstance(x, Loan) and
-                                   x.pos == solvent_bank.pos and x.loan_approved and x.loan_solvent])
-    solvent_bank.bank_deposits = sum([x.balance for x in schedule.agents if isinstance(x, Saver) and
-                                      x.pos == solvent_bank.pos and x.owns_account])
+    solvent_bank.bank_loans = float(loan_book.approved_amount[solvent_bank.pos])
+    solvent_bank.bank_deposits = float(saver_pool.account_balance[solvent_bank.pos])
     solvent_bank.equity = 0
     solvent_bank.bank_reserves = 0
     solvent_bank.reserves_ratio = 0
@@ -125,11 +128,15 @@ def process_unwind_loans_insolvent_bank(schedule, bankrupt_liquidation, solvent_
     # TO DO: change colour to red
 
 
-def main_evaluate_solvency(schedule, reserve_rates, bankrupt_liquidation, car):
-    for solvent_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]:
-        calculate_credit_loss_loan_book(schedule, solvent_bank)
-        calculate_interest_income_loans(schedule, reserve_rates, solvent_bank)
-        calculate_interest_expense_deposits(schedule, solvent_bank)
+def main_evaluate_solvency(model, reserve_rates, bankrupt_liquidation, car, rng):
+    solvent_banks = [x for x in model.banks if x.bank_solvent]
+    # loan defaults only depend on the bank that lent the loan, so they are drawn for all banks up front
+    credit_loss = draw_loan_defaults(model, solvent_banks, rng)
+    savers_balance = model.saver_pool.assigned_balance
+    for solvent_bank in solvent_banks:
+        calculate_credit_loss_loan_book(solvent_bank, credit_loss)
+        calculate_interest_income_loans(reserve_rates, solvent_bank, credit_loss)
+        calculate_interest_expense_deposits(solvent_bank, float(savers_balance[solvent_bank.pos]))
         calculate_net_interest_income(solvent_bank)
 
         solvent_bank.equity = solvent_bank.equity + solvent_bank.net_interest_income
@@ -143,7 +150,7 @@ def main_evaluate_solvency(schedule, reserve_rates, bankrupt_liquidation, car):
             solvent_bank.bank_capitalized = False
             solvent_bank.credit_failure = True
             # Change color to Red
-            process_unwind_loans_insolvent_bank(schedule, bankrupt_liquidation, solvent_bank)
+            process_unwind_loans_insolvent_bank(model, bankrupt_liquidation, solvent_bank, rng)
 
         else:
             if 0 < solvent_bank.capital_ratio < car:
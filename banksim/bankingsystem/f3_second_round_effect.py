@@ -1,60 +1,126 @@
 import logging
 
-from banksim.agent.bank import Bank
-from banksim.agent.ibloan import Ibloan
-from banksim.bankingsystem.f2_eval_solvency import process_unwind_loans_insolvent_bank
+import numpy as np
 
-def calculate_interbank_credit_loss(schedule, solvent_bank):
-    solvent_bank.ib_credit_loss = sum([x.ib_amount for x in schedule.agents if isinstance(x, Ibloan) and
-                                       x.ib_creditor == solvent_bank and not x.ib_debtor.bank_solvent])
+from banksim.bankingsystem.f2_eval_solvency import process_unwind_loans_insolvent_bank
 
 
-def calculate_interbank_interest_income(schedule, solvent_bank):
+class InterbankExposures:
+    """
+    Interbank loans as sparse creditor x debtor matrices
+
+    principal[c, d] is the amount bank c lent to bank d and interest[c, d] the interest on it (amount * ib_rate).
+    Loans between the same pair of banks are summed. Bank totals that do not depend on the solvency of the
+    counterparties are computed once; credit loss and interest income of a creditor are read from its CSR row,
+    and the creditors exposed to a debtor from the CSC column.
+    """
+
+    def __init__(self, n_banks, creditor, debtor, amount, rate):
+        from scipy import sparse
+        shape = (n_banks, n_banks)
+        self.principal = sparse.csr_matrix((amount, (creditor, debtor)), shape=shape)
+        self.interest = sparse.csr_matrix((amount * rate, (creditor, debtor)), shape=shape)
+        self.creditors_of = self.principal.tocsc()
+        self.principal_lent = np.asarray(self.principal.sum(axis=1)).ravel()
+        self.interest_lent = np.asarray(self.interest.sum(axis=1)).ravel()
+        self.principal_borrowed = np.asarray(self.principal.sum(axis=0)).ravel()
+        self.interest_borrowed = np.asarray(self.interest.sum(axis=0)).ravel()
+
+    @classmethod
+    def from_ibloan_book(cls, ibloan_book):
+        return cls(len(ibloan_book.banks), ibloan_book.creditor, ibloan_book.debtor, ibloan_book.amount,
+                   ibloan_book.rate)
+
+    def lent_to(self, creditor, debtor_solvent):
+        """
+        Principal and interest lent by creditor to solvent debtors, and principal lent to insolvent ones
+        """
+        row = slice(self.principal.indptr[creditor], self.principal.indptr[creditor + 1])
+        solvent = debtor_solvent[self.principal.indices[row]]
+        principal = self.principal.data[row]
+        interest = self.interest.data[row]
+        return float(principal[solvent].sum() + interest[solvent].sum()), float(principal[~solvent].sum())
+
+    def creditors(self, debtor):
+        col = slice(self.creditors_of.indptr[debtor], self.creditors_of.indptr[debtor + 1])
+        return self.creditors_of.indices[col]
+
+
+def calculate_interbank_credit_loss(solvent_bank, credit_loss):
+    solvent_bank.ib_credit_loss = credit_loss
+
+
+def calculate_interbank_interest_income(solvent_bank, interest_income):
     # QUESTION: in netlogo script, it is (1 + x.ib_rate). But it looks wrong because it is interest income
-    solvent_bank.ib_interest_income = sum(
-        [x.ib_amount * (1 + x.ib_rate) for x in schedule.agents if isinstance(x, Ibloan) and
-         x.ib_creditor == solvent_bank and x.ib_debtor.bank_solvent])
+    solvent_bank.ib_interest_income = interest_income
 
 
-def calculate_interbank_interest_expense(schedule, solvent_bank):
+def calculate_interbank_interest_expense(exposures, solvent_bank):
     # QUESTION: in netlogo script, it is (1 + x.ib_rate). But it looks wrong because it is interest income
-    solvent_bank.ib_interest_expense = sum(
-        [x.ib_amount * (1 + x.ib_rate) for x in schedule.agents if isinstance(x, Ibloan) and
-         x.ib_debtor == solvent_bank])
+    solvent_bank.ib_interest_expense = float(exposures.principal_borrowed[solvent_bank.pos] +
+                                             exposures.interest_borrowed[solvent_bank.pos])
 
 
 def calculate_interbank_net_interest_income(solvent_bank):
     solvent_bank.ib_net_interest_income = solvent_bank.ib_interest_income - solvent_bank.ib_interest_expense
 
+
+def settle_interbank_loans(exposures, solvent_bank, bank_solvent):
+    """
+    Equity and reserves change of a bank when its interbank loans are settled
+
+    A bank with positive net interbank income collects principal and interest of its loans less the credit
+    loss on insolvent debtors, otherwise it repays what it borrowed.
+    """
+    pos = solvent_bank.pos
+    interest_income, credit_loss = exposures.lent_to(pos, bank_solvent)
+    calculate_interbank_credit_loss(solvent_bank, credit_loss)
+    calculate_interbank_interest_income(solvent_bank, interest_income)
+    calculate_interbank_interest_expense(exposures, solvent_bank)
+    calculate_interbank_net_interest_income(solvent_bank)
+
+    if solvent_bank.ib_net_interest_income > 0:
+        principal_only = float(exposures.principal_lent[pos])
+        interest_only = float(exposures.interest_lent[pos])
+        return interest_only - solvent_bank.ib_credit_loss, \
+            principal_only + interest_only - solvent_bank.ib_credit_loss
+    principal_only = float(exposures.principal_borrowed[pos])
+    interest_only = float(exposures.interest_borrowed[pos])
+    return -interest_only, -principal_only - interest_only
+
+
 # evaluate second round effects owing to cross-bank linkages
 # only interbank loans to cover shortages in reserves requirements are included
-def main_second_round_effects(schedule, bankrupt_liquidation, car, G):
-    solvent_banks = [x for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]
-    insolvent_banks = [x for x in schedule.agents if isinstance(x, Bank) and not x.bank_solvent]
-    solvent_banks_afterwards = list()
-    while len(set(solvent_banks).intersection(solvent_banks_afterwards)) != len(solvent_banks):
-        logging.debug('while looping')
-        for solvent_bank in solvent_banks:
-            calculate_interbank_credit_loss(schedule, solvent_bank)
-            calculate_interbank_interest_income(schedule, solvent_bank)
-            calculate_interbank_interest_expense(schedule, solvent_bank)
-            calculate_interbank_net_interest_income(solvent_bank)
-
-            if solvent_bank.ib_net_interest_income > 0:
-                my_ibloans = [x for x in schedule.agents if
-                              isinstance(x, Ibloan) and x.ib_creditor == solvent_bank]
-                principal_only = sum([x.ib_amount for x in my_ibloans])
-                interest_only = sum([x.ib_amount * x.ib_rate for x in my_ibloans])
-                solvent_bank.equity = solvent_bank.equity + interest_only - solvent_bank.ib_credit_loss
-                solvent_bank.bank_reserves = solvent_bank.bank_reserves + principal_only + interest_only - \
-                                             solvent_bank.ib_credit_loss
-            else:
-                my_ibloans = [x for x in schedule.agents if
-                              isinstance(x, Ibloan) and x.ib_debtor == solvent_bank]
-                principal_only = sum([x.ib_amount for x in my_ibloans])
-                interest_only = sum([x.ib_amount * x.ib_rate for x in my_ibloans])
-                solvent_bank.equity = solvent_bank.equity - interest_only
-                solvent_bank.bank_reserves = solvent_bank.bank_reserves - principal_only - interest_only
+def main_second_round_effects(model, bankrupt_liquidation, car, rng):
+    """
+    Settle interbank loans until no further bank fails
+
+    Every solvent bank is settled once against the current solvency of its debtors. When a bank fails, only
+    its creditors are put on the worklist of the next iteration and re-settled; they book the difference to
+    the settlement applied before. Banks only ever turn insolvent, so the worklist empties after at most one
+    iteration per bank.
+
+    :return: number of iterations and whether the worklist emptied
+    """
+    banks = model.banks
+    n_banks = len(banks)
+    exposures = InterbankExposures.from_ibloan_book(model.ibloan_book)
+    bank_solvent = np.array([x.bank_solvent for x in banks], dtype=bool)
+    applied = np.zeros((n_banks, 2))  # settlement booked so far: equity, reserves
+    worklist = [x.pos for x in banks if x.bank_solvent]
+    iterations = 0
+    while worklist and iterations <= n_banks:
+        iterations += 1
+        logging.debug('second round effects iteration %d: %d banks', iterations, len(worklist))
+        affected = set()
+        for pos in worklist:
+            solvent_bank = banks[pos]
+            if not solvent_bank.bank_solvent:
+                continue
+            settlement = settle_interbank_loans(exposures, solvent_bank, bank_solvent)
+            solvent_bank.equity = solvent_bank.equity + settlement[0] - applied[pos, 0]
+            solvent_bank.bank_reserves = solvent_bank.bank_reserves + settlement[1] - applied[pos, 1]
+            applied[pos] = settlement
 
             solvent_bank.calculate_total_assets()
             solvent_bank.calculate_leverage_ratio()
@@ -64,8 +130,10 @@ def main_second_round_effects(schedule, bankrupt_liquidation, car, G):
             if solvent_bank.equity < 0 or solvent_bank.bank_reserves < 0:
                 solvent_bank.bank_solvent = False
                 solvent_bank.bank_capitalized = False
+                bank_solvent[pos] = False
+                affected.update(exposures.creditors(pos).tolist())
                 # TO DO: change colour to RED
-                process_unwind_loans_insolvent_bank(schedule, bankrupt_liquidation, solvent_bank)
+                process_unwind_loans_insolvent_bank(model, bankrupt_liquidation, solvent_bank, rng)
 
             if 0 < solvent_bank.capital_ratio < car:
                 solvent_bank.bank_capitalized = False
@@ -84,17 +152,18 @@ def main_second_round_effects(schedule, bankrupt_liquidation, car, G):
                 solvent_bank.calculate_leverage_ratio()
                 solvent_bank.calculate_capital_ratio()
                 solvent_bank.calculate_reserve_ratio()
+        worklist = sorted(x for x in affected if bank_solvent[x])
 
-        solvent_banks_afterwards = [x for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]
-        if len(solvent_banks) != len(set(solvent_banks_afterwards).intersection(solvent_banks)):
-            solvent_banks = solvent_banks_afterwards
-            solvent_banks_afterwards = list()
-        logging.debug('while looping -end')
+    converged = not worklist
+    if not converged:
+        logging.warning('second round effects did not converge after %d iterations', iterations)
+    logging.debug('second round effects: %d iterations, converged %s', iterations, converged)
+    model.ib_clearing_iterations = iterations
+    model.ib_clearing_converged = converged
 
     # To clear all ibloan activities
     # Question: Why all banks should initialize inter-bank related variables? Bank might lose their equity without reason
-    for bank in [x for x in schedule.agents if isinstance(x, Bank)]:
+    for bank in model.banks:
         bank.initialize_ib_variables()
-    for ibloan in [x for x in schedule.agents if isinstance(x, Ibloan)]:
-        schedule.remove(ibloan)
-        G.remove_edge(ibloan.ib_creditor.pos, ibloan.ib_debtor.pos)
+    model.ibloan_book.clear()
+    return iterations, converged
@@ -1,13 +1,9 @@
-import random
-
-from banksim.agent.bank import Bank
-from banksim.agent.loan import Loan
-from banksim.agent.saver import Saver
-
-
-def main_risk_weight_optimization(schedule, car):
-    for uncap_bank in [x for x in schedule.agents if
-                       isinstance(x, Bank) and not x.bank_capitalized and x.bank_solvent]:
+def main_risk_weight_optimization(model, car, rng):
+    loan_book = model.loan_book
+    loans_by_bank = loan_book.group_by_bank(loan_book.mask(approved=True, solvent=True))
+    saver_pool = model.saver_pool
+    savers_by_bank = saver_pool.group_by_bank(saver_pool.mask(owns_account=True))
+    for uncap_bank in [x for x in model.banks if not x.bank_capitalized and x.bank_solvent]:
         interim_equity = uncap_bank.equity
         interim_rwassets = uncap_bank.rwassets
         interim_reserves = uncap_bank.bank_reserves
@@ -20,14 +16,19 @@ def main_risk_weight_optimization(schedule, car):
         current_equity = uncap_bank.equity
         current_rwassets = uncap_bank.rwassets
         n_dumped_loans = 0
+        loans = loans_by_bank[uncap_bank.pos]
+        dumped_loans = list()
 
-        for loan in [x for x in schedule.agents if isinstance(x, Loan) and x.pos == uncap_bank.pos and x.loan_approved and x.loan_solvent]:
-            loan_equity = interim_equity - loan.amount * loan.fire_sale_loss + loan.pdef * loan.lgdamount
-            loan_rwassets = interim_rwassets - loan.rwamount
+        for idx, amount, fire_sale_loss, pdef, lgdamount, rwamount in zip(
+                loans.tolist(), loan_book.amount[loans].tolist(), loan_book.fire_sale_loss[loans].tolist(),
+                loan_book.pdef[loans].tolist(), loan_book.lgdamount[loans].tolist(),
+                loan_book.rwamount[loans].tolist()):
+            loan_equity = interim_equity - amount * fire_sale_loss + pdef * lgdamount
+            loan_rwassets = interim_rwassets - rwamount
             loan_capital_ratio = loan_equity / loan_rwassets if loan_rwassets != 0 else 0
-            loan_reserves = interim_reserves - loan.amount * loan.fire_sale_loss + + loan.pdef * loan.lgdamount
-            loan_total_balance = interim_loans - loan.amount
-            loan_provisions = interim_provisions - loan.pdef * loan.lgdamount
+            loan_reserves = interim_reserves - amount * fire_sale_loss + + pdef * lgdamount
+            loan_total_balance = interim_loans - amount
+            loan_provisions = interim_provisions - pdef * lgdamount
             loan_deposits = interim_deposits
 
             if loan_capital_ratio > interim_capital_ratio and loan_equity > 0 and loan_rwassets > 0:
@@ -37,11 +38,11 @@ def main_risk_weight_optimization(schedule, car):
                 interim_reserves = loan_reserves
                 interim_loans = loan_total_balance
                 interim_provisions = loan_provisions
-                interim_deposits = interim_deposits - loan.amount
-                loan.loan_dumped = True
-                loan.loan_approved = False
+                interim_deposits = interim_deposits - amount
+                dumped_loans.append(idx)
                 # TO DO: color gray
                 n_dumped_loans = n_dumped_loans + 1
+        loan_book.dump(dumped_loans)
         # calculate new balance sheet after risk weight optimization
         # you can check if they are right with the following commands
         #
@@ -73,15 +74,12 @@ def main_risk_weight_optimization(schedule, car):
             # TO DO: colour Green
             uncap_bank.bank_capitalized = True
 
-        savers_in_bank = [x for x in schedule.agents if isinstance(x, Saver) and
-                          x.pos == uncap_bank.pos and x.owns_account]
+        savers_in_bank = savers_by_bank[uncap_bank.pos]
         if n_dumped_loans < len(savers_in_bank):
-            for saver in random.sample(savers_in_bank, n_dumped_loans):
-                saver.owns_account = False
-                # TO DO: colour White
+            saver_pool.close_account(rng.choice(savers_in_bank, n_dumped_loans, replace=False))
+            # TO DO: colour White
         else:
-            for saver in savers_in_bank:
-                saver.owns_account = False
-                # TO DO: colour White
+            saver_pool.close_account(savers_in_bank)
+            # TO DO: colour White
             uncap_bank.equity = uncap_bank.equity - (n_dumped_loans - len(savers_in_bank))
-        uncap_bank.bank_deposits = sum([x.balance for x in savers_in_bank if x.owns_account])
\ No newline at end of file
+        uncap_bank.bank_deposits = float(saver_pool.account_balance[uncap_bank.pos])
\ No newline at end of file
@@ -1,9 +1,7 @@
-from banksim.agent.bank import Bank
-from banksim.agent.loan import Loan
-
-
-def main_pay_dividends(schedule, car, min_reserves_ratio):
-    for cap_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.capital_ratio > car]:
+def main_pay_dividends(model, car, min_reserves_ratio):
+    loan_book = model.loan_book
+    loans_by_bank = loan_book.group_by_bank(loan_book.mask(approved=True, solvent=True))
+    for cap_bank in [x for x in model.banks if x.capital_ratio > car]:
         if cap_bank.capital_ratio >= cap_bank.upper_bound_cratio:
             # reduce excess capital
             # first by drawing reserves down to the floor
@@ -38,22 +36,24 @@ def main_pay_dividends(schedule, car, min_reserves_ratio):
                 # let interim-reserve-ratio reserves-ratio
                 interim_loans = cap_bank.bank_loans
 
-                for loan in [x for x in schedule.agents if isinstance(x, Loan) and
-                                                           cap_bank.pos == x.pos and x.loan_approved and x.loan_solvent]:
+                loans = loans_by_bank[cap_bank.pos]
+                dumped_loans = list()
+                for idx, amount, rwamount in zip(loans.tolist(), loan_book.amount[loans].tolist(),
+                                                 loan_book.rwamount[loans].tolist()):
                     loan_discount = 0  # no fire_sale of assets when paying dividends, bank is not distressed
-                    loan_equity = interim_equity - loan.amount * loan_discount
-                    loan_rwassets = interim_rwassets - loan.rwamount
+                    loan_equity = interim_equity - amount * loan_discount
+                    loan_rwassets = interim_rwassets - rwamount
                     loan_capital_ratio = loan_equity / loan_rwassets if loan_rwassets != 0 else 0
-                    loan_total_balance = interim_loans - loan.amount
+                    loan_total_balance = interim_loans - amount
 
                     if cap_bank.upper_bound_cratio <= loan_capital_ratio < interim_capital_ratio and loan_equity > 0 and loan_rwassets > 0:
                         interim_equity = loan_equity
                         interim_rwassets = loan_rwassets
                         interim_capital_ratio = loan_capital_ratio
                         interim_loans = loan_total_balance
-                        loan.loan_dumped = True
-                        loan.loan_approved = False
+                        dumped_loans.append(idx)
                         # TO DO: change color 86  ; light blue
+                loan_book.dump(dumped_loans)
 
                 cap_bank.bank_dividend = cap_bank.equity - interim_equity
                 cap_bank.bank_cum_dividend = cap_bank.bank_cum_dividend + cap_bank.bank_dividend
@@ -1,109 +1,185 @@
-from banksim.agent.bank import Bank
-from banksim.agent.loan import Loan
-
-
-def main_reset_insolvent_loans(schedule):
-    for loan in [x for x in schedule.agents if isinstance(x, Loan) and x.loan_approved and not x.loan_solvent]:
-        loan.loan_solvent = True
-        loan.loan_approved = False
-        # TO DO: set color 107
-
-
-def main_build_loan_book_locally(schedule, min_reserves_ratio, car):
-    for solvent_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.bank_capitalized]:
+import numpy as np
+
+
+def main_reset_insolvent_loans(model):
+    loan_book = model.loan_book
+    loan_book.reset(np.flatnonzero(loan_book.mask(approved=True, solvent=False)))
+    # TO DO: set color 107
+
+
+def _passes(interim, amount, rwamount, provision, car, desired_reserves_ratio):
+    """
+    Whether the capital ratio and reserves ratio after taking each loan on its own exceed the bounds
+    """
+    denominator = interim["rwa"] + rwamount
+    capital_ratio = np.divide(interim["equity"] - provision, denominator,
+                              out=np.zeros(len(amount)), where=denominator != 0)
+    reserves_ratio = (interim["reserves"] - provision - amount) / interim["deposits"] \
+        if interim["deposits"] != 0 else np.zeros(len(amount))
+    return (capital_ratio > car) & (reserves_ratio > desired_reserves_ratio)
+
+
+class LoanMarket:
+    """
+    Candidate loans offered to banks in a fixed order
+
+    Banks take loans greedily: a loan is taken when the capital ratio and reserves ratio after taking it
+    exceed the bank's bounds. Taken loans leave the market, so later banks only see what is still on offer.
+    Taking a loan only lowers both ratios (loans have non-negative amount, rwamount and provision), hence
+    a loan that fails against a bank's current balance sheet is skipped for good, and a bank stops as soon
+    as the smallest loan on offer would break its bounds. A bank's pass therefore costs in the order of
+    the loans it takes rather than the size of the market.
+    """
+
+    def __init__(self, loan_book, loans):
+        self.loans = loans  # loan book rows in offer order
+        self.amount = loan_book.amount[loans]
+        self.rwamount = loan_book.rwamount[loans]
+        self.provision = loan_book.pdef[loans] * loan_book.lgdamount[loans]
+        self.available = np.ones(len(loans), dtype=bool)
+        self.n_available = len(loans)
+        self.monotone = bool((self.amount >= 0).all() and (self.rwamount >= 0).all() and
+                             (self.provision >= 0).all())
+        # a loan at least as small as every loan on offer
+        self.smallest = (self.amount.min(keepdims=True), self.rwamount.min(keepdims=True),
+                         self.provision.min(keepdims=True)) if len(loans) else None
+
+    def __len__(self):
+        return self.n_available
+
+    def _run(self, interim, candidates, car, desired_reserves_ratio):
+        """
+        Take the candidates up to the first one that fails and return how many were taken
+
+        np.cumsum gives the balance sheet before every candidate as if all earlier ones were taken. It adds
+        in the same order as a loan-by-loan loop, so the interim balance sheet stays identical bit for bit.
+        """
+        amount, rwamount, provision = self.amount[candidates], self.rwamount[candidates], self.provision[candidates]
+        equity = np.cumsum(np.concatenate(([interim["equity"]], -provision)))
+        rwa = np.cumsum(np.concatenate(([interim["rwa"]], rwamount)))
+        reserves = np.cumsum(np.concatenate(([interim["reserves"]], np.column_stack(
+            (-amount, -provision)).ravel())))[::2]
+        loans = np.cumsum(np.concatenate(([interim["loans"]], amount)))
+        provisions = np.cumsum(np.concatenate(([interim["provisions"]], provision)))
+        before = {"equity": equity[:-1], "rwa": rwa[:-1], "reserves": reserves[:-1], "deposits": interim["deposits"]}
+        ok = _passes(before, amount, rwamount, provision, car, desired_reserves_ratio)
+        run = len(candidates) if ok.all() else int(np.argmin(ok))
+        if run > 0:
+            interim["equity"] = float(equity[run])
+            interim["rwa"] = float(rwa[run])
+            interim["reserves"] = float(reserves[run])
+            interim["loans"] = float(loans[run])
+            interim["provisions"] = float(provisions[run])
+        return run
+
+    def originate(self, interim, car, desired_reserves_ratio, window=1024):
+        """
+        Greedy pass of one bank over the loans on offer
+
+        :param interim: dict with equity, rwa, reserves, deposits, loans and provisions of the bank, updated in place
+        :param car: capital adequacy ratio to exceed
+        :param desired_reserves_ratio: reserves ratio to exceed
+        :param window: number of loans scanned at first, doubled every time the window is exhausted
+        :return: loan book rows of the taken loans, in offer order
+        """
+        monotone = self.monotone and car >= 0 and interim["deposits"] > 0
+        taken = list()
+        pending = np.empty(0, dtype=np.int64)
+        scanned = 0
+        while True:
+            if len(pending) == 0:
+                if scanned >= len(self.loans) or \
+                        (monotone and not _passes(interim, *self.smallest, car, desired_reserves_ratio)[0]):
+                    break
+                pending = np.arange(scanned, min(scanned + window, len(self.loans)))
+                pending = pending[self.available[pending]]
+                scanned, window = scanned + window, window * 2
+            elif monotone:
+                # loans failing now fail for good, taking loans only lowers the ratios
+                pending = pending[_passes(interim, self.amount[pending], self.rwamount[pending],
+                                          self.provision[pending], car, desired_reserves_ratio)]
+            if len(pending) > 0:
+                run = self._run(interim, pending, car, desired_reserves_ratio)
+                taken.append(pending[:run])
+                pending = pending[run + 1:]
+
+        taken = np.concatenate(taken) if taken else np.empty(0, dtype=np.int64)
+        res = self.loans[taken]
+        self.available[taken] = False
+        self.n_available -= len(taken)
+        if self.n_available * 2 < len(self.loans):
+            self._compact()
+        return res
+
+    def _compact(self):
+        keep = self.available
+        self.loans, self.amount = self.loans[keep], self.amount[keep]
+        self.rwamount, self.provision = self.rwamount[keep], self.provision[keep]
+        self.available = np.ones(len(self.loans), dtype=bool)
+
+
+def _interim_balance_sheet(bank):
+    return {"equity": bank.equity,
+            "rwa": bank.rwassets,
+            "reserves": bank.bank_reserves,
+            "deposits": bank.bank_deposits,
+            "loans": bank.bank_loans,
+            "provisions": bank.bank_provisions}
+
+
+def _book_balance_sheet(bank, interim):
+    bank.rwassets = interim["rwa"]
+    bank.bank_reserves = interim["reserves"]
+    bank.bank_loans = interim["loans"]
+    bank.equity = interim["equity"]
+    bank.bank_provisions = interim["provisions"]
+    bank.total_assets = bank.bank_reserves + bank.bank_loans
+
+    # ratio has to be calculated since the last calculation in the available_loans loop
+    # reports the first instance of the capital ratio that does not meet the CAR
+
+    bank.capital_ratio = interim["equity"] / interim["rwa"] if interim["rwa"] != 0 else 0
+    bank.calculate_reserve_ratio()
+    bank.calculate_total_assets()
+    bank.calculate_leverage_ratio()
+
+    # assets=liabilities? (equity + bank-deposits + IB-debits) - (bank-loans + bank-reserves + IB-credits)
+
+
+def market_order(model, banks, rng):
+    """
+    Order in which banks visit the global loan market
+
+    Banks visit in position order unless the model was created with random_market_order, in which case
+    the order is shuffled every step to give all banks an equal chance at the loans on offer.
+    """
+    if model.random_market_order:
+        return [banks[i] for i in rng.permutation(len(banks))]
+    return list(banks)
+
+
+def main_build_loan_book_locally(model, min_reserves_ratio, car):
+    loan_book = model.loan_book
+    avail_loans = loan_book.group_by_bank(loan_book.mask(approved=False, solvent=True))
+    for solvent_bank in [x for x in model.banks if x.bank_capitalized]:
         desired_reserves_ratio = min_reserves_ratio * solvent_bank.buffer_reserves_ratio
-        interim_equity = solvent_bank.equity
-        interim_rwa = solvent_bank.rwassets
-        interim_reserves = solvent_bank.bank_reserves
-        interim_deposits = solvent_bank.bank_deposits
-        interim_capital_ratio = solvent_bank.capital_ratio
-        interim_reserves_ratio = solvent_bank.reserves_ratio
-        interim_loans = solvent_bank.bank_loans
-        interim_provisions = solvent_bank.bank_provisions
-
-        for avail_loan in [x for x in schedule.agents if isinstance(x, Loan) and x.pos == solvent_bank.pos and
-                                                         not x.loan_approved and x.loan_solvent]:
-
-            interim_capital_ratio = (interim_equity - avail_loan.pdef * avail_loan.lgdamount) / \
-                                    (interim_rwa + avail_loan.rwamount) if (interim_rwa + avail_loan.rwamount) != 0 else 0
-            interim_reserves_ratio = (interim_reserves - avail_loan.pdef * avail_loan.lgdamount - avail_loan.amount) / \
-                                    interim_deposits if interim_deposits != 0 else 0
-            if interim_capital_ratio > car and interim_reserves_ratio > desired_reserves_ratio:
-                interim_rwa = interim_rwa + avail_loan.rwamount
-                interim_equity = interim_equity - avail_loan.pdef * avail_loan.lgdamount
-                interim_reserves = interim_reserves - avail_loan.amount - avail_loan.pdef * avail_loan.lgdamount
-                interim_loans = interim_loans + avail_loan.amount
-                interim_provisions = interim_provisions + avail_loan.pdef * avail_loan.lgdamount
-                avail_loan.loan_approved = True
-                # TO DO: change color yellow
-        solvent_bank.rwassets = interim_rwa
-        solvent_bank.bank_reserves = interim_reserves
-        solvent_bank.bank_loans = interim_loans
-        solvent_bank.equity = interim_equity
-        solvent_bank.bank_provisions = interim_provisions
-        solvent_bank.total_assets = solvent_bank.bank_reserves + solvent_bank.bank_loans
-
-        # ratio has to be calculated since the last calculation in the available_loans loop
-        # reports the first instance of the capital ratio that does not meet the CAR
-
-        solvent_bank.capital_ratio = interim_equity / interim_rwa if interim_rwa != 0 else 0
-        solvent_bank.calculate_reserve_ratio()
-        solvent_bank.calculate_total_assets()
-        solvent_bank.calculate_leverage_ratio()
-
-        # assets=liabilities? (equity + bank-deposits + IB-debits) - (bank-loans + bank-reserves + IB-credits)
-
-
-def main_build_loan_book_globally(schedule, car, min_reserves_ratio):
-    solvent_banks = [x for x in schedule.agents if isinstance(x, Bank) and x.bank_capitalized]
-    weak_banks = [x for x in schedule.agents if isinstance(x, Bank) and
-                  not x.bank_capitalized and not x.bank_solvent]
-    avail_loans = list()
-    for weak_bank in weak_banks:
-        avail_loans.extend([x for x in schedule.agents if isinstance(x, Loan) and x.pos == weak_bank.pos and
-                            not x.loan_approved and x.loan_solvent])
-    for solvent_bank in solvent_banks:
-        # TO DO: To give equal change to all solvent banks, change bank randomly
-
-        interim_equity = solvent_bank.equity
-        interim_rwa = solvent_bank.rwassets
-        interim_reserves = solvent_bank.bank_reserves
-        interim_deposits = solvent_bank.bank_deposits
-        interim_capital_ratio = 0
-        interim_reserve_ratio = solvent_bank.reserves_ratio
-        interim_loans = solvent_bank.bank_loans
-        interim_provisions = solvent_bank.bank_provisions
-        for avail_loan in avail_loans:
-            interim_capital_ratio = (interim_equity - avail_loan.pdef * avail_loan.lgdamount) / \
-                                    (interim_rwa + avail_loan.rwamount) if (
-                                                                                       interim_rwa + avail_loan.rwamount) != 0 else 0
-            interim_reserve_ratio = (
-                                                interim_reserves - avail_loan.pdef * avail_loan.lgdamount - avail_loan.amount) / \
-                                    interim_deposits if interim_deposits != 0 else 0
-            if interim_capital_ratio > car and interim_reserve_ratio > min_reserves_ratio:
-                interim_rwa = interim_rwa + avail_loan.rwamount
-                interim_reserves = interim_reserves - avail_loan.amount - avail_loan.pdef * avail_loan.lgdamount
-                interim_loans = interim_loans + avail_loan.amount
-                interim_equity = interim_equity - avail_loan.pdef * avail_loan.lgdamount
-                interim_provisions = interim_provisions + avail_loan.pdef * avail_loan.lgdamount
-                avail_loan.loan_approved = True
-                avail_loan.bank_id = solvent_bank.pos
-                avail_loan.pos = solvent_bank.pos
-
-                # TO DO: change color yellow
-        solvent_bank.rwassets = interim_rwa
-        solvent_bank.bank_reserves = interim_reserves
-        solvent_bank.bank_loans = interim_loans
-        solvent_bank.equity = interim_equity
-        solvent_bank.bank_provisions = interim_provisions
-        solvent_bank.total_assets = solvent_bank.bank_reserves + solvent_bank.bank_loans
-
-        # ratio has to be calculated since the last calculation in the available_loans loop
-        # reports the first instance of the capital ratio that does not meet the CAR
-
-        solvent_bank.capital_ratio = interim_equity / interim_rwa if interim_rwa != 0 else 0
-        solvent_bank.calculate_reserve_ratio()
-        solvent_bank.calculate_total_assets()
-        solvent_bank.calculate_leverage_ratio()
-
-        # assets=liabilities? (equity + bank-deposits + IB-debits) - (bank-loans + bank-reserves + IB-credits)
\ No newline at end of file
+        interim = _interim_balance_sheet(solvent_bank)
+        loan_market = LoanMarket(loan_book, avail_loans[solvent_bank.pos])
+        loan_book.approve(loan_market.originate(interim, car, desired_reserves_ratio))
+        # TO DO: change color yellow
+        _book_balance_sheet(solvent_bank, interim)
+
+
+def main_build_loan_book_globally(model, car, min_reserves_ratio, rng):
+    loan_book = model.loan_book
+    solvent_banks = [x for x in model.banks if x.bank_capitalized]
+    weak_banks = [x for x in model.banks if not x.bank_capitalized and not x.bank_solvent]
+    loans_by_bank = loan_book.group_by_bank(loan_book.mask(approved=False, solvent=True))
+    avail_loans = np.concatenate([loans_by_bank[x.pos] for x in weak_banks]) if weak_banks else \
+        np.empty(0, dtype=np.int64)
+    loan_market = LoanMarket(loan_book, avail_loans)
+    for solvent_bank in market_order(model, solvent_banks, rng):
+        interim = _interim_balance_sheet(solvent_bank)
+        loan_book.approve(loan_market.originate(interim, car, min_reserves_ratio), bank_id=solvent_bank.pos)
+        # TO DO: change color yellow
+        _book_balance_sheet(solvent_bank, interim)
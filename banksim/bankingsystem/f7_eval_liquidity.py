@@ -1,53 +1,51 @@
 import logging
-import random
 
-from banksim.agent.bank import Bank
-from banksim.agent.saver import Saver
-from banksim.agent.ibloan import Ibloan
+import numpy as np
+
 from banksim.bankingsystem.f2_eval_solvency import process_unwind_loans_insolvent_bank
 
 
-def process_deposit_withdrawal(schedule):
+def process_deposit_withdrawal(model, rng):
     # savers withdraw funds from solvent banks
     # banks that are insolvent have already liquidated their loan portfolio and
     # returned their deposits to savers
-    for solvent_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]:
-        savers = [x for x in schedule.agents if isinstance(x, Saver) and x.pos == solvent_bank.pos and
-                  x.saver_solvent and x.owns_account]
-        logging.debug('process_deposit_withdrawal- num savers: %d of bank %d', len(savers), solvent_bank.pos)
-        for saver in savers:
-            if random.random() < saver.withdraw_prob:
-                saver.bank_id = 9999
-                saver.owns_account = False
-                # TO DO: saver.saver_last_color = color
-                # TO DO: change color Red
-                solvent_bank.deposit_outflow = solvent_bank.deposit_outflow + saver.balance
-            # solvent_bank.deposit_outflow = sum([x.balance for x in self.schedule.agents if isinstance(x, Saver) and
-            #                                    x.pos == solvent_bank.pos and x.bank_id == 9999])
-
-
-def process_deposit_reassignment(schedule):
-    cap_bankpos = [x.pos for x in schedule.agents if
-                   isinstance(x, Bank) and x.bank_solvent and x.bank_capitalized]
+    saver_pool = model.saver_pool
+    solvent_banks = [x for x in model.banks if x.bank_solvent]
+    bank_solvent = np.zeros(saver_pool.n_banks, dtype=bool)
+    bank_solvent[[x.pos for x in solvent_banks]] = True
+    savers = np.flatnonzero(saver_pool.mask(owns_account=True, saver_solvent=True))
+    savers = savers[bank_solvent[saver_pool.bank_id[savers]]]
+    n_savers = np.bincount(saver_pool.bank_id[savers], minlength=saver_pool.n_banks)
+    # one Bernoulli draw per saver decides who withdraws
+    withdrawn = savers[rng.random(len(savers)) < saver_pool.withdraw_prob[savers]]
+    deposit_outflow = saver_pool.bank_sum(saver_pool.balance, withdrawn)
+    saver_pool.withdraw(withdrawn)
+    # TO DO: saver.saver_last_color = color
+    # TO DO: change color Red
+    for solvent_bank in solvent_banks:
+        logging.debug('process_deposit_withdrawal- num savers: %d of bank %d', n_savers[solvent_bank.pos],
+                      solvent_bank.pos)
+        solvent_bank.deposit_outflow = solvent_bank.deposit_outflow + float(deposit_outflow[solvent_bank.pos])
+
+
+def process_deposit_reassignment(model, rng):
+    cap_bankpos = [x.pos for x in model.banks if x.bank_solvent and x.bank_capitalized]
     if len(cap_bankpos) == 0:
-        cap_bankpos = [x.pos for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]
-
-    savers = [x for x in schedule.agents if isinstance(x, Saver) and x.bank_id == 9999]
-    for saver in savers:
-        bankpos = random.choice(cap_bankpos)
-        saver.bank_id = bankpos
-        saver.pos = bankpos
-        saver.owns_account = True
-        # TO DO: saver.saver_last_color = color
-
-    for solvent_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]:
-        solvent_bank.deposit_inflow = sum(
-            [x.balance for x in savers if x.pos == solvent_bank.pos and x.owns_account])
+        cap_bankpos = [x.pos for x in model.banks if x.bank_solvent]
+
+    saver_pool = model.saver_pool
+    savers = model.agent_index.unassigned_savers()
+    saver_pool.open_account(savers, rng.choice(cap_bankpos, len(savers)))
+    # TO DO: saver.saver_last_color = color
+    deposit_inflow = saver_pool.bank_sum(saver_pool.balance, savers)
+
+    for solvent_bank in [x for x in model.banks if x.bank_solvent]:
+        solvent_bank.deposit_inflow = float(deposit_inflow[solvent_bank.pos])
         solvent_bank.net_deposit_flow = solvent_bank.deposit_inflow - solvent_bank.deposit_outflow
 
 
-def process_deposit_flow_rebalancing(schedule):
-    for solvent_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]:
+def process_deposit_flow_rebalancing(model):
+    for solvent_bank in [x for x in model.banks if x.bank_solvent]:
         solvent_bank.calculate_bank_deposits()
         solvent_bank.calculate_reserve()
         solvent_bank.calculate_reserve_ratio()
@@ -57,8 +55,8 @@ def process_deposit_flow_rebalancing(schedule):
         solvent_bank.net_deposit_flow = 0
 
 
-def process_access_interbank_market(schedule, car, min_reserves_ratio, bank):
-    liq_banks = [x for x in schedule.agents if isinstance(x, Bank) and x.capital_ratio >= car and
+def process_access_interbank_market(model, car, min_reserves_ratio, bank):
+    liq_banks = [x for x in model.banks if x.capital_ratio >= car and
                  x.reserves_ratio > x.buffer_reserves_ratio * min_reserves_ratio]
     # for liq_bank in liq_banks:
     # print('Remove this print after implementing below to do')
@@ -77,14 +75,7 @@ def process_access_interbank_market(schedule, car, min_reserves_ratio, bank):
         liq_bank.ib_credits = liq_bank.ib_credits + liquidity_contribution
         liq_bank.calculate_reserve_ratio()
 
-        ibloan = Ibloan({"unique_id": schedule.model.next_id(),
-                        "model": schedule.model,
-                        "libor_rate": schedule.model.libor_rate})
-        ibloan.ib_creditor = liq_bank
-        ibloan.ib_amount = liquidity_contribution
-        ibloan.ib_debtor = bank
-        schedule.add(ibloan)
-        schedule.model.G.add_edge(ibloan.ib_creditor.pos, ibloan.ib_debtor.pos)
+        model.ibloan_book.add(model.next_id(), liq_bank.pos, bank.pos, liquidity_contribution, model.libor_rate)
         # TO DO: change color Red
         # TO DO: set line to thickness 3
 
@@ -96,20 +87,20 @@ def process_access_interbank_market(schedule, car, min_reserves_ratio, bank):
     # TO DO: set assets=liabilities? (equity + bank-deposits + IB-debits) - (bank-loans + bank-reserves + IB-credits)
 
 
-def process_evaluate_liquidity_needs(schedule, car, min_reserves_ratio, bankrupt_liquidation):
-    for solvent_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.bank_solvent]:
+def process_evaluate_liquidity_needs(model, car, min_reserves_ratio, bankrupt_liquidation, rng):
+    for solvent_bank in [x for x in model.banks if x.bank_solvent]:
         solvent_bank.calculate_reserve_ratio()
-    liq_cap_banks = [x for x in schedule.agents if isinstance(x, Bank) and x.capital_ratio > car and
+    liq_cap_banks = [x for x in model.banks if x.capital_ratio > car and
                      x.reserves_ratio > min_reserves_ratio]
-    for bankrun_bank in [x for x in schedule.agents if isinstance(x, Bank) and x.reserves_ratio < 0]:
-        process_unwind_loans_insolvent_bank(schedule, bankrupt_liquidation, bankrun_bank)
+    for bankrun_bank in [x for x in model.banks if x.reserves_ratio < 0]:
+        process_unwind_loans_insolvent_bank(model, bankrupt_liquidation, bankrun_bank, rng)
         # TO DO: change color Brown
         bankrun_bank.liquidity_failure = True
 
-    for noliqcap_bank in [x for x in schedule.agents if isinstance(x, Bank) and
-                                                        x.reserves_ratio < min_reserves_ratio and x.capital_ratio >= car]:
+    for noliqcap_bank in [x for x in model.banks if
+                          x.reserves_ratio < min_reserves_ratio and x.capital_ratio >= car]:
         # TO DO: change color Yellow
-        process_access_interbank_market(schedule, car, min_reserves_ratio, noliqcap_bank)
+        process_access_interbank_market(model, car, min_reserves_ratio, noliqcap_bank)
 
     # Recalculate the number of banks experiencing shortages of reserves
     # it could be the case that some banks attempting to find resources were not
@@ -121,7 +112,7 @@ def process_evaluate_liquidity_needs(schedule, car, min_reserves_ratio, bankrupt
     # TO DO: change colour to Yellow
 
 
-def main_evaluate_liquidity(schedule, car, min_reserves_ratio, bankrupt_liquidation):
+def main_evaluate_liquidity(model, car, min_reserves_ratio, bankrupt_liquidation, rng):
     # the four procedures will cause some banks to have:
     #
     # excess reserves: bank-reserves > minimum-reserves
@@ -143,8 +134,8 @@ def main_evaluate_liquidity(schedule, car, min_reserves_ratio, bankrupt_liquidat
     #   process-deposit-flow-rebalancing: all bank-deposits and bank-reserves are
     #     adjusted to reflect the movement in reserves
 
-    process_deposit_withdrawal(schedule)
+    process_deposit_withdrawal(model, rng)
     logging.debug('process_deposit_withdrawal')
-    process_deposit_reassignment(schedule)
-    process_deposit_flow_rebalancing(schedule)
-    process_evaluate_liquidity_needs(schedule, car, min_reserves_ratio, bankrupt_liquidation)
+    process_deposit_reassignment(model, rng)
+    process_deposit_flow_rebalancing(model)
+    process_evaluate_liquidity_needs(model, car, min_reserves_ratio, bankrupt_liquidation, rng)
@@ -24,3 +24,54 @@ class DBHandler(ABC):
     @abstractmethod
     def aggregate(self):
         pass
+
+    def insert_rows(self, table, fields, rows):
+        """
+        Insert tuples of fields into a table, as documents with these fields unless a handler has a bulk path
+        """
+        return self.insert_items([dict(zip(fields, x)) for x in rows], collection_name=table)
+
+
+class ResultSink(ABC):
+    """
+    Destination of the per-step results of a BankSim run
+
+    The model calls open once at step 0, write_step after every step, flush when the run stops and close at
+    the end. Sinks that set background can be wrapped in a BackgroundWriter; they also implement snapshot,
+    which copies the state of a step, and write_snapshot, which writes such a copy. Runs with time_phases
+    hand their PhaseTiming rows to write_timings before close; sinks without such a table ignore them.
+
+    Sinks that store results in a database write through a DBHandler, handler: SQLiteHandler for sqlite and
+    MongoDBHandler for mongodb. A ResultSink decides what is written when, the handler how it is stored.
+    """
+    background = False
+    handler = None  # DBHandler the sink writes through, None for sinks without a database
+
+    def insert_rows(self, table, fields, rows):
+        """
+        Insert rows, tuples of fields, into a table through handler
+        """
+        return self.handler.insert_rows(table, fields, rows)
+
+    @abstractmethod
+    def open(self, simid, title, simdate):
+        pass
+
+    @abstractmethod
+    def write_step(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        pass
+
+    @abstractmethod
+    def flush(self):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def write_timings(self, simid, rows):
+        """
+        :param simid: simulation id
+        :param rows: PhaseTiming rows, (SimId, StepCnt, Phase, Seconds, Calls, Agents)
+        """
+        pass
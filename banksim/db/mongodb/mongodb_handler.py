@@ -1,9 +1,40 @@
 import configparser
+import os
+import threading
 
 from pymongo import MongoClient
 from pymongo.cursor import CursorType
 from banksim.db.base_handler import DBHandler
 
+_clients = dict()  # (process id, uri) -> MongoClient shared by the handlers of a process
+_clients_lock = threading.Lock()
+
+
+def get_client(uri):
+    """
+    Pooled MongoClient of this process for a connection string
+
+    A MongoClient keeps its own connection pool and is thread-safe, so all handlers of a process share one.
+    Clients are keyed by process id as well, since a client must not be used across a fork.
+
+    :param uri: mongodb connection string
+    """
+    key = (os.getpid(), uri)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = MongoClient(uri)
+        return _clients[key]
+
+
+def close_clients():
+    """
+    Close the pooled clients of this process
+    """
+    with _clients_lock:
+        for key in [x for x in _clients if x[0] == os.getpid()]:
+            _clients.pop(key).close()
+
+
 class MongoDBHandler(DBHandler):
     """
     PyMongo wrapper
@@ -11,7 +42,7 @@ class MongoDBHandler(DBHandler):
     
     Original source code: https://gitlab.com/hyunny88/auto-trading/tree/master/autotrading/db
     """
-    def __init__(self, mode="local", db_name=None, collection_name=None):
+    def __init__(self, mode="local", db_name=None, collection_name=None, client=None):
         """
         MongoDBHandler __init__ 
 
@@ -19,6 +50,7 @@ class MongoDBHandler(DBHandler):
             mode (str): local or remove DB ex) local, remote
             db_name (str): 
             collection_name (str): 
+            client (MongoClient): client to use instead of the pooled one of mode
 
         Returns:
             None
@@ -38,10 +70,12 @@ class MongoDBHandler(DBHandler):
         self.db_config["user"] = config['MONGODB']['user']
         self.db_config["password"] = config['MONGODB']['password']
 
-        if mode == "remote":
-            self._client = MongoClient("mongodb://{user}:{password}@{remote_host}:{remote_port}".format(**self.db_config))
+        if client is not None:
+            self._client = client
+        elif mode == "remote":
+            self._client = get_client("mongodb://{user}:{password}@{remote_host}:{remote_port}".format(**self.db_config))
         elif mode == "local":
-            self._client = MongoClient("mongodb://{local_ip}:{port}".format(**self.db_config))
+            self._client = get_client("mongodb://{local_ip}:{port}".format(**self.db_config))
 
         self._db = self._client[db_name]
         self._collection = self._db[collection_name]
@@ -116,9 +150,50 @@ class MongoDBHandler(DBHandler):
         if db_name is not None:
             self._db = self._client[db_name]
         if collection_name is not None:
-            self._collection_name = self._db[collection_name]
+            self._collection = self._db[collection_name]
         return self._collection.insert_many(datas).inserted_ids
 
+    def insert_batches(self, datas, batch_size=1000, db_name=None, collection_name=None):
+        """
+        To insert documents to MongoDB with unordered insert_many in batches of at most batch_size
+        
+        Args:
+            datas (list): documents
+            batch_size (int): documents per insert_many
+            db_name (str):
+            collection_name (str):
+
+        Returns:
+            int : number of inserted documents
+        """
+        if db_name is not None:
+            self._db = self._client[db_name]
+        if collection_name is not None:
+            self._collection = self._db[collection_name]
+        count = 0
+        for i in range(0, len(datas), batch_size):
+            # unordered, the server may apply a batch in parallel and goes on after a failed document
+            count += len(self._collection.insert_many(datas[i:i + batch_size], ordered=False).inserted_ids)
+        return count
+
+    def create_index(self, keys, db_name=None, collection_name=None):
+        """
+        To create an ascending compound index in MongoDB, nothing is done if it exists
+        
+        Args:
+            keys (list): field names
+            db_name (str):
+            collection_name (str):
+
+        Returns:
+            str : index name
+        """
+        if db_name is not None:
+            self._db = self._client[db_name]
+        if collection_name is not None:
+            self._collection = self._db[collection_name]
+        return self._collection.create_index([(x, 1) for x in keys])
+
     def find_items(self, condition=None, db_name=None, collection_name=None):
         """
         To search documents in MongoDB
@@ -0,0 +1,83 @@
+from banksim.db.base_handler import ResultSink
+from banksim.db.mongodb.mongodb_handler import MongoDBHandler
+from banksim.util.write_sqlitedb import (step_snapshot, saver_rows, loan_rows, ibloan_rows,
+                                         AGTBANK_FIELDS, AGTSAVER_FIELDS, AGTLOAN_FIELDS, AGTIBLOAN_FIELDS,
+                                         PHASETIMING_FIELDS)
+
+# collection -> bank field of its (SimId, StepCnt, bank) index
+INDEXES = {"AgtBank": "BankId", "AgtSaver": "SaverBankId", "AgtLoan": "LoanBankId", "AgtIbLoan": "IbLoanCreditor"}
+
+
+class MongoSink(ResultSink):
+    """
+    Result sink writing agent states as MongoDB documents
+
+    Each table of banksim_sqlite.sql is a collection and each row a document with the same fields.
+    Documents are buffered per collection and written with unordered insert_many once batch_size of them
+    are pending, and on flush or close. Every collection gets an index on SimId, StepCnt and its bank field.
+    """
+
+    background = True
+
+    def __init__(self, handler=None, db_name=None, write_agents=False, batch_size=1000):
+        """
+        :param handler: MongoDBHandler to write with, one on the pooled local client by default
+        :param db_name: database of the results
+        :param write_agents: False: bank documents only, True: saver, loan and interbank loan documents as well
+        :param batch_size: documents per insert_many
+        """
+        db_name = "banksim" if db_name is None else db_name
+        self.handler = MongoDBHandler(db_name=db_name, collection_name="Simulation") if handler is None else handler
+        self.write_agents = write_agents
+        self.batch_size = batch_size
+        self.buffers = dict()  # collection -> documents not inserted yet
+        self.indexed = False
+
+    def open(self, simid, title, simdate):
+        if not self.indexed:
+            for table, bank_field in INDEXES.items():
+                self.handler.create_index(["SimId", "StepCnt", bank_field], collection_name=table)
+            self.indexed = True
+        self.handler.insert_item({"SimId": simid, "Title": title, "SimDate": simdate}, collection_name="Simulation")
+
+    def snapshot(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        return step_snapshot(simid, numstep, banks, saver_pool, loan_book, ibloan_book, self.write_agents)
+
+    def write_step(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        snapshot = step_snapshot(simid, numstep, banks)
+        snapshot.update(savers=saver_pool, loans=loan_book, ibloans=ibloan_book)
+        self.write_snapshot(snapshot)
+
+    def write_snapshot(self, snapshot):
+        simid, numstep, col_date = snapshot["simid"], snapshot["numstep"], snapshot["col_date"]
+        self._insert("AgtBank", AGTBANK_FIELDS, snapshot["banks"])
+        if self.write_agents:
+            for name, table, fields, rows in (("savers", "AgtSaver", AGTSAVER_FIELDS, saver_rows),
+                                              ("loans", "AgtLoan", AGTLOAN_FIELDS, loan_rows),
+                                              ("ibloans", "AgtIbLoan", AGTIBLOAN_FIELDS, ibloan_rows)):
+                if snapshot.get(name) is not None:
+                    self._insert(table, fields, rows(simid, numstep, snapshot[name], col_date))
+
+    def write_timings(self, simid, rows):
+        self._insert("PhaseTiming", PHASETIMING_FIELDS, rows)
+
+    def _insert(self, table, fields, rows):
+        buffer = self.buffers.setdefault(table, list())
+        buffer.extend(dict(zip(fields, x)) for x in rows)
+        if len(buffer) >= self.batch_size:
+            # full batches now, the remainder waits for the next step
+            size = len(buffer) - len(buffer) % self.batch_size
+            self.handler.insert_batches(buffer[:size], self.batch_size, collection_name=table)
+            del buffer[:size]
+
+    def flush(self):
+        """
+        Insert the buffered documents of all collections
+        """
+        for table, buffer in self.buffers.items():
+            if buffer:
+                self.handler.insert_batches(buffer, self.batch_size, collection_name=table)
+        self.buffers = dict()
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,104 @@
+"""
+Result sinks of BankSim runs
+"""
+
+from banksim.db.base_handler import ResultSink
+from banksim.util.write_sqlitedb import (SQLiteWriter, step_snapshot, saver_rows, loan_rows, ibloan_rows,
+                                         AGTBANK_FIELDS, AGTSAVER_FIELDS, AGTLOAN_FIELDS, AGTIBLOAN_FIELDS,
+                                         PHASETIMING_FIELDS)
+
+SINKS = ("sqlite", "mongodb", "parquet", "memory", "null")
+
+
+class NullSink(ResultSink):
+    """
+    Discards all results, e.g. for benchmarks
+    """
+
+    def open(self, simid, title, simdate):
+        pass
+
+    def write_step(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemorySink(ResultSink):
+    """
+    Keeps a copy of every step in memory; frame() returns a table as a DataFrame
+    """
+
+    def __init__(self, write_agents=False):
+        self.write_agents = write_agents
+        self.simulations = list()  # (simid, title, simdate)
+        self.steps = list()  # step snapshots in write order
+        self.timings = list()  # PhaseTiming rows
+
+    def open(self, simid, title, simdate):
+        self.simulations.append((simid, title, simdate))
+
+    def write_step(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        self.steps.append(step_snapshot(simid, numstep, banks, saver_pool, loan_book, ibloan_book,
+                                        self.write_agents))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write_timings(self, simid, rows):
+        self.timings.extend(rows)
+
+    def frame(self, table="AgtBank"):
+        """
+        Rows of a table over all steps, with the columns of banksim_sqlite.sql
+
+        :param table: AgtBank, AgtSaver, AgtLoan, AgtIbLoan or PhaseTiming
+        """
+        import pandas as pd
+        if table == "PhaseTiming":
+            return pd.DataFrame(self.timings, columns=PHASETIMING_FIELDS)
+        if table == "AgtBank":
+            return pd.DataFrame([x for snapshot in self.steps for x in snapshot["banks"]], columns=AGTBANK_FIELDS)
+        name, rows, fields = {"AgtSaver": ("savers", saver_rows, AGTSAVER_FIELDS),
+                              "AgtLoan": ("loans", loan_rows, AGTLOAN_FIELDS),
+                              "AgtIbLoan": ("ibloans", ibloan_rows, AGTIBLOAN_FIELDS)}[table]
+        return pd.DataFrame([x for snapshot in self.steps if snapshot.get(name) is not None
+                             for x in rows(snapshot["simid"], snapshot["numstep"], snapshot[name],
+                                           snapshot["col_date"])], columns=fields)
+
+
+def create_sink(name, write_agents=False, commit_every=10, sqlite_db=None, parquet_dir=None, parquet_float32=False,
+                mongo_db=None, mongo_batch_size=1000):
+    """
+    Result sink by name
+
+    :param name: one of SINKS
+    :param write_agents: False: bank rows only, True: saver, loan and interbank loan rows as well
+    :param commit_every: steps per transaction of sqlite, steps per file of parquet
+    :param sqlite_db: database file of sqlite
+    :param parquet_dir: dataset directory of parquet
+    :param parquet_float32: store float columns of parquet as float32
+    :param mongo_db: database name of mongodb
+    :param mongo_batch_size: documents per insert_many of mongodb
+    """
+    if name == "sqlite":
+        return SQLiteWriter(sqlite_db, commit_every, write_agents)
+    if name == "parquet":
+        # pyarrow is only needed for Parquet output
+        from banksim.util.write_parquet import ParquetWriter
+        return ParquetWriter(parquet_dir, commit_every, write_agents, parquet_float32)
+    if name == "mongodb":
+        from banksim.db.mongodb.mongodb_sink import MongoSink
+        return MongoSink(db_name=mongo_db, write_agents=write_agents, batch_size=mongo_batch_size)
+    if name == "memory":
+        return MemorySink(write_agents)
+    if name == "null":
+        return NullSink()
+    raise Exception("Unknown result sink {}, expected one of {}".format(name, ", ".join(SINKS)))
@@ -0,0 +1,123 @@
+import glob
+import os
+import sqlite3
+
+from banksim.util.write_sqlitedb import BULK_LOAD_PRAGMAS, PHASETIMING_DDL
+
+SHARD_TABLES = ("Simulation", "AgtBank", "AgtSaver", "AgtLoan", "AgtIbLoan", "PhaseTiming")
+# indexes of a merged archive, the same keys as the collections of the mongodb sink
+ARCHIVE_INDEXES = ("CREATE INDEX IF NOT EXISTS [IX_AgtBank_Step] ON [AgtBank] ([SimId], [StepCnt], [BankId])",
+                   "CREATE INDEX IF NOT EXISTS [IX_AgtSaver_Step] ON [AgtSaver] ([SimId], [StepCnt], [SaverBankId])",
+                   "CREATE INDEX IF NOT EXISTS [IX_AgtLoan_Step] ON [AgtLoan] ([SimId], [StepCnt], [LoanBankId])",
+                   "CREATE INDEX IF NOT EXISTS [IX_AgtIbLoan_Step] ON [AgtIbLoan] ([SimId], [StepCnt], [IbLoanCreditor])")
+
+
+def shard_path(shard_dir, simid):
+    """
+    File of the shard of a simulation, unique per simulation id and process
+    """
+    return os.path.join(shard_dir, "{}_{}.sqlite".format(simid, os.getpid()))
+
+
+def create_shard(path, init_query="conf/banksim_sqlite.sql"):
+    """
+    Create an empty result database with the tables of init_query
+
+    Unlike init_database nothing is archived or vacuumed, so the cost does not depend on earlier results.
+
+    :param path: file of the shard, must not exist
+    :param init_query: SQL script creating the tables
+    """
+    if os.path.exists(path):
+        raise Exception("SQLite shard {} exists".format(path))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(init_query, 'r') as fin:
+        script = fin.read()
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(script)
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def list_shards(shards):
+    """
+    Shard files of a directory, or the given list of files and directories
+    """
+    if isinstance(shards, str):
+        shards = [shards]
+    res = list()
+    for shard in shards:
+        if os.path.isdir(shard):
+            res.extend(sorted(glob.glob(os.path.join(shard, "*.sqlite"))))
+        else:
+            res.append(shard)
+    return res
+
+
+def merge_shards(archive, shards, init_query="conf/banksim_sqlite.sql", remove=False):
+    """
+    Copy the rows of shards into an indexed archive database
+
+    Every shard is attached to the archive and its tables are copied with INSERT ... SELECT in one transaction,
+    so rows never pass through Python. The archive is created with init_query and ARCHIVE_INDEXES if it does
+    not exist.
+
+    :param archive: file of the archive database
+    :param shards: shard files or directories of shards
+    :param init_query: SQL script creating the tables of a new archive
+    :param remove: delete every shard once it is merged
+    :return: number of merged shards
+    """
+    shards = list_shards(shards)
+    if not os.path.isfile(archive):
+        create_shard(archive, init_query)
+    conn = sqlite3.connect(archive)
+    try:
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        for sql in (PHASETIMING_DDL,) + ARCHIVE_INDEXES:
+            conn.execute(sql)
+        for shard in shards:
+            conn.execute("ATTACH DATABASE ? AS shard", (shard,))
+            try:
+                # shards made before PhaseTiming existed do not have it
+                tables = {x[0] for x in conn.execute("SELECT name FROM shard.sqlite_master WHERE type = 'table'")}
+                with conn:
+                    for table in [x for x in SHARD_TABLES if x in tables]:
+                        conn.execute("INSERT INTO main.[{0}] SELECT * FROM shard.[{0}]".format(table))
+            except sqlite3.IntegrityError as e:
+                raise Exception("SQLite shard {} overlaps the archive {}: {}".format(shard, archive, e))
+            finally:
+                conn.execute("DETACH DATABASE shard")
+            if remove:
+                os.remove(shard)
+    finally:
+        conn.close()
+    return len(shards)
+
+
+def query_shards(shards, sql, params=()):
+    """
+    Run a query on every shard, read-only, and concatenate the results
+
+    The query sees one shard at a time, so aggregates are per shard; merge_shards gives a single database.
+
+    :param shards: shard files or directories of shards
+    :param sql: SQL query
+    :param params: parameters of the query
+    :return: DataFrame
+    """
+    import pandas as pd
+    frames = list()
+    for shard in list_shards(shards):
+        conn = sqlite3.connect("file:{}?mode=ro".format(shard), uri=True)
+        try:
+            frames.append(pd.read_sql_query(sql, conn, params=params))
+        finally:
+            conn.close()
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
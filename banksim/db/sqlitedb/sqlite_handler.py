@@ -0,0 +1,157 @@
+import sqlite3
+
+from banksim.db.base_handler import DBHandler
+
+
+def _where(condition):
+    if not condition:
+        return "", []
+    return " WHERE " + " AND ".join("{}=?".format(x) for x in condition), list(condition.values())
+
+
+class SQLiteHandler(DBHandler):
+    """
+    sqlite3 counterpart of MongoDBHandler
+
+    Tables take the place of collections and rows that of documents: conditions are dicts of column -> value
+    joined with AND, and update values are dicts of column -> value, optionally wrapped in {"$set": ...}.
+    Writes are not committed until commit() or close().
+    """
+    def __init__(self, sqlite_db=None, table_name=None, pragmas=(), check_same_thread=True):
+        """
+        SQLiteHandler __init__
+
+        Args:
+            sqlite_db (str): path of the database file
+            table_name (str): default table of the item methods
+            pragmas (tuple): PRAGMA statements run on the new connection
+            check_same_thread (bool): False to hand the connection to another thread
+
+        Raises:
+            throw an exception if sqlite_db doesn't exist
+        """
+        if sqlite_db is None:
+            raise Exception("Need to sqlite db")
+        self.conn = sqlite3.connect(sqlite_db, check_same_thread=check_same_thread)
+        for pragma in pragmas:
+            self.conn.execute(pragma)
+        self.cursor = self.conn.cursor()
+        self._table = table_name
+
+    def _table_name(self, collection_name):
+        if collection_name is not None:
+            self._table = collection_name
+        if self._table is None:
+            raise Exception("Need to table name")
+        return self._table
+
+    def execute(self, sql, params=()):
+        """
+        To run a statement, e.g. DDL
+
+        Returns:
+            Cursor :
+        """
+        return self.cursor.execute(sql, params)
+
+    def insert_item(self, data, db_name=None, collection_name=None):
+        """
+        To insert a row given as a dict of column -> value
+
+        Returns:
+            lastrowid :
+        """
+        table = self._table_name(collection_name)
+        return self.insert_rows(table, tuple(data), [tuple(data.values())])
+
+    def insert_items(self, datas, db_name=None, collection_name=None):
+        """
+        To insert rows given as dicts with the same columns
+
+        Returns:
+            lastrowid :
+        """
+        table = self._table_name(collection_name)
+        if not datas:
+            return None
+        fields = tuple(datas[0])
+        return self.insert_rows(table, fields, [tuple(x[y] for y in fields) for x in datas])
+
+    def insert_rows(self, table, fields, rows):
+        """
+        To insert tuples of fields with one executemany
+        """
+        self.cursor.executemany("INSERT INTO {}({}) VALUES({})".format(table, ",".join(fields),
+                                                                       ",".join("?" * len(fields))), rows)
+        return self.cursor.lastrowid
+
+    def find_items(self, condition=None, db_name=None, collection_name=None):
+        """
+        To search rows
+
+        Returns:
+            list : rows as dicts of column -> value
+        """
+        where, params = _where(condition)
+        cursor = self.conn.execute("SELECT * FROM {}{}".format(self._table_name(collection_name), where), params)
+        fields = [x[0] for x in cursor.description]
+        return [dict(zip(fields, x)) for x in cursor.fetchall()]
+
+    def find_item(self, condition=None, db_name=None, collection_name=None):
+        """
+        To search a row
+
+        Returns:
+            dict : first row found, None if there is none
+        """
+        res = self.find_items(condition, db_name, collection_name)
+        return res[0] if res else None
+
+    def delete_items(self, condition=None, db_name=None, collection_name=None):
+        """
+        To delete rows
+
+        Returns:
+            int : number of deleted rows
+        """
+        if condition is None:
+            raise Exception("Need to condition")
+        where, params = _where(condition)
+        return self.conn.execute("DELETE FROM {}{}".format(self._table_name(collection_name), where),
+                                 params).rowcount
+
+    def update_items(self, condition=None, update_value=None, db_name=None, collection_name=None):
+        """
+        To update rows
+
+        Returns:
+            int : number of updated rows
+        """
+        if condition is None:
+            raise Exception("Need to condition")
+        if update_value is None:
+            raise Exception("Need to update value")
+        update_value = update_value.get("$set", update_value)
+        where, params = _where(condition)
+        sql = "UPDATE {} SET {}{}".format(self._table_name(collection_name),
+                                          ",".join("{}=?".format(x) for x in update_value), where)
+        return self.conn.execute(sql, list(update_value.values()) + params).rowcount
+
+    def aggregate(self, pipeline=None, db_name=None, collection_name=None):
+        """
+        To aggregate values with a SQL query, the counterpart of a MongoDB pipeline
+
+        Returns:
+            list : result rows
+        """
+        if pipeline is None:
+            raise Exception("Need to pipeline")
+        return self.conn.execute(pipeline).fetchall()
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.cursor.close()
+        self.conn.close()
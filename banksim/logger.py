@@ -1,9 +1,7 @@
-import logging, os, sys
+import logging, os
 from logging.handlers import RotatingFileHandler
 
-cur_dir = os.path.abspath(os.curdir)
-sys.path.append(cur_dir)
-PROJECT_HOME = cur_dir
+PROJECT_HOME = os.path.abspath(os.curdir)
 
 def get_logger(name):
     """
@@ -12,7 +10,8 @@ def get_logger(name):
     """
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
-    rotate_handler = RotatingFileHandler(PROJECT_HOME + "/" + name + ".log", 'a', 1024*1024*5, 5)
+    # delay: the log file is opened by the first record, not at import
+    rotate_handler = RotatingFileHandler(PROJECT_HOME + "/" + name + ".log", 'a', 1024*1024*5, 5, delay=True)
     formatter = logging.Formatter('[%(levelname)s]-%(asctime)s-%(filename)s:%(lineno)s:%(message)s', datefmt="%m%d %H:%M:%S")
     rotate_handler.setFormatter(formatter)
     logger.addHandler(rotate_handler)
@@ -1,17 +1,19 @@
 from mesa import Model
 from mesa.space import NetworkGrid
 from mesa.time import RandomActivation
-from mesa.datacollection import DataCollector
 from datetime import datetime, timezone
-import traceback, random
-import sqlite3
-import networkx as nx
+import os
+import random
+import traceback
+import numpy as np
 import configparser
 
 from banksim.logger import get_logger
-from banksim.agent.saver import Saver
 from banksim.agent.bank import Bank
-from banksim.agent.loan import Loan
+from banksim.agent.loanbook import LoanBook
+from banksim.agent.saverpool import SaverPool
+from banksim.agent.ibloanbook import IbloanBook
+from banksim.agent.index import AgentIndex
 from banksim.bankingsystem.f1_init_market import initialize_deposit_base
 from banksim.bankingsystem.f1_init_market import initialize_loan_book
 from banksim.bankingsystem.f2_eval_solvency import main_evaluate_solvency
@@ -22,44 +24,105 @@ from banksim.bankingsystem.f6_expand_loan_book import main_reset_insolvent_loans
 from banksim.bankingsystem.f6_expand_loan_book import main_build_loan_book_locally
 from banksim.bankingsystem.f6_expand_loan_book import main_build_loan_book_globally
 from banksim.bankingsystem.f7_eval_liquidity import main_evaluate_liquidity
-from banksim.util.write_agent_activity import main_write_bank_ratios
-from banksim.util.write_agent_activity import convert_result2dataframe
-from banksim.util.write_agent_activity import main_write_interbank_links
-from banksim.util.write_sqlitedb import (
-    insert_simulation_table,
-    insert_agtbank_table,
-    init_database,
-)
+from banksim.util.write_agent_activity import BankRatioRecorder
+from banksim.util.write_agent_activity import InterbankLinkRecorder
+from banksim.util.phase_timer import PhaseTimer
+from banksim.db.base_handler import ResultSink
+from banksim.db.sink import create_sink
+from banksim.db.sqlitedb.shard import create_shard, shard_path
+from banksim.util.write_sqlitedb import BackgroundWriter, WriterError, init_database
 
 logger = get_logger("model")
 
 
 def get_sum_totasset(model):
-    return sum([x.total_assets for x in model.schedule.agents if isinstance(x, Bank)])
+    return sum([x.total_assets for x in model.banks])
+
+
+_last_start = (None, 0)  # process id and start time of the last simulation id, not shared with forked workers
+
+
+def new_simid():
+    """
+    Simulation ID: start time yymmddHHMMSSfff followed by the last three digits of the process id
+
+    Runs of parallel workers that start in the same millisecond differ in the process id, and a run that starts
+    in the same millisecond as the previous run of its process takes the next millisecond, so ids are unique
+    and increase with the start time.
+    """
+    global _last_start
+    pid = os.getpid()
+    start = int(datetime.now().strftime("%y%m%d%H%M%S%f")[:-3])
+    if _last_start[0] == pid and start <= _last_start[1]:
+        start = _last_start[1] + 1
+    _last_start = (pid, start)
+    return start * 1000 + pid % 1000
+
+
+# independent random streams of a run, one per phase that draws random numbers
+RNG_STREAMS = ("init", "solvency", "second_round", "risk_weight", "loan_market", "liquidity", "mesa")
 
 
 class BankSim(Model):
     simid = None  # Simulation ID for SQLITEDB primary key
     max_steps = 200
-    conn = None  # Sqlite connector
-    db_cursor = None  # Sqlite DB cursor
-    lst_bank_ratio = list()
-    lst_ibloan = list()
+    sink = None  # ResultSink of the run, wrapped in a BackgroundWriter with async_write
 
     def __init__(self, **params):
         super().__init__()
         config = configparser.ConfigParser()
         config.read("conf/config.ini")
         self.sqlite_db = config["SQLITEDB"]["file"]
+        self.sqlite_init_query = config["SQLITEDB"]["init_query"]
+        self.shard_dir = (
+            config.get("SQLITEDB", "shard_dir", fallback="") if params.get("shard_dir") is None
+            else params.get("shard_dir")
+        )  # directory of one SQLite file per run instead of SQLITEDB file, empty: no shards
+        self.sink_name = (
+            config.get("RESULT", "sink", fallback="sqlite") if params.get("sink") is None else params.get("sink")
+        )  # result sink with write_db: sqlite, mongodb, parquet, memory, null or a ResultSink instance
         self.height = 20
         self.width = 20
         self.is_init_db = (
-            False if params.get("write_db") is None else params.get("write_db")
+            False if params.get("init_db") is None else params.get("init_db")
         )
         self.is_write_db = (
             False if params.get("write_db") is None else params.get("write_db")
         )
+        self.write_agents = (
+            False if params.get("write_agents") is None else params.get("write_agents")
+        )  # True: write saver, loan and inter-bank loan rows every step, not only bank rows
+        self.commit_every = (
+            10 if params.get("commit_every") is None else params.get("commit_every")
+        )  # number of steps written to SQLITEDB per transaction, or to a Parquet file
+        self.parquet_dir = (
+            config.get("PARQUET", "dir", fallback="result_parquet") if params.get("parquet_dir") is None
+            else params.get("parquet_dir")
+        )  # dataset directory of the parquet sink
+        self.mongo_db = config.get("MONGODB", "db_name", fallback="banksim")
+        self.mongo_batch_size = (
+            config.getint("MONGODB", "batch_size", fallback=1000) if params.get("mongo_batch_size") is None
+            else params.get("mongo_batch_size")
+        )  # documents per insert_many of the mongodb sink
+        self.parquet_float32 = (
+            False if params.get("parquet_float32") is None else params.get("parquet_float32")
+        )  # True: store float columns of the Parquet dataset as float32
+        self.async_write = (
+            True if params.get("async_write") is None else params.get("async_write")
+        )  # True: write results on a background thread while the next steps run
+        self.write_queue_size = (
+            4 if params.get("write_queue_size") is None else params.get("write_queue_size")
+        )  # steps waiting for the background writer before step blocks
         self.max_steps = params["max_steps"]
+        self.record_interval = (
+            1 if params.get("record_interval") is None else params.get("record_interval")
+        )  # record the bank ratios of every record_interval-th step
+        self.time_phases = (
+            False if params.get("time_phases") is None else params.get("time_phases")
+        )  # True: record wall time per phase of step, see phase_timings, and write it to the result sink
+        self.profile_memory = (
+            False if params.get("profile_memory") is None else params.get("profile_memory")
+        )  # True: trace allocations with tracemalloc, see phase_timings and agent_footprint; implies time_phases
         self.initial_saver = params["initial_saver"]
         self.initial_loan = params["initial_loan"]
         self.initial_bank = params["initial_bank"]
@@ -71,146 +134,296 @@ class BankSim(Model):
         self.bankrupt_liquidation = (
             1  # 1: it is fire sale of assets, 0: bank liquidates loans at face value
         )
+        self.debug_aggregates = (
+            False if params.get("debug_aggregates") is None else params.get("debug_aggregates")
+        )  # True: cross-check the per-bank aggregates of loans and savers after every change
+        self.headless = (
+            True if params.get("headless") is None else params.get("headless")
+        )  # False: keep a Mesa RandomActivation scheduler of the banks and a DataCollector, as the visualization server does
+        self.materialize_graph = (
+            False if params.get("materialize_graph") is None else params.get("materialize_graph")
+        )  # True: keep G edges in sync with the inter-bank loans, only needed by the visualization
+        self.random_market_order = (
+            False if params.get("random_market_order") is None else params.get("random_market_order")
+        )  # True: banks visit the global loan market in random order every step
         self.car = params["car"]
         self.min_reserves_ratio = params["min_reserves_ratio"]
         self.initial_equity = params["initial_equity"]
-        self.G = nx.empty_graph(self.initial_bank)
-        self.grid = NetworkGrid(self.G)
-        self.schedule = RandomActivation(self)
-        self.datacollector = DataCollector({"BankAsset": get_sum_totasset})
+        self._G = None  # network of the banks, built on first use of G
+        self._grid = None  # NetworkGrid on G, built on first use of grid
+        self.steps = 0
+        # the phase functions drive every agent, so the scheduler is only kept for the visualization server
+        self.schedule = None if self.headless else RandomActivation(self)
+        self.banks = list()  # Bank agents in position order
+        self.loan_book = None  # columnar store of all loans, created at step 0
+        self.saver_pool = None  # columnar store of all savers, created at step 0
+        self.ibloan_book = IbloanBook(self.banks)  # inter-bank loans of the current step
+        self.agent_index = AgentIndex(self)  # per-bank lookups of the members of the stores above
+        # seed: int entropy of the run, drawn from the OS when not given; replica: index of the replica of a
+        # sweep, replicas of the same seed get independent streams that are common to every grid point
+        seed_sequence = np.random.SeedSequence(params.get("seed"))
+        self.replica = params.get("replica")
+        if self.replica is not None:
+            seed_sequence = seed_sequence.spawn(self.replica + 1)[self.replica]
+        self.seed = seed_sequence.entropy
+        self.rngs = {name: np.random.default_rng(x)
+                     for name, x in zip(RNG_STREAMS, seed_sequence.spawn(len(RNG_STREAMS)))}
+        # Mesa keeps Model.random on the class, so give every run its own seeded instance
+        self.random = random.Random(int(self.rngs["mesa"].integers(2 ** 63)))
+        self.ib_clearing_iterations = 0  # iterations of the last interbank clearing, see f3_second_round_effect
+        self.ib_clearing_converged = True
+        # per-run results, kept on the instance so that models built in the same process do not share them
+        self.bank_ratios = BankRatioRecorder(self.max_steps, self.record_interval)
+        self.timer = PhaseTimer(self.time_phases, self.profile_memory)
+        self.timer.begin()
+        self.timings_written = 0  # phase timing rows handed to the result sink
+        self.ib_links = InterbankLinkRecorder(self.max_steps)
+        # the collected series are only charted by the visualization server, and DataCollector imports pandas
+        self.datacollector = None
+        if not self.headless:
+            from mesa.datacollection import DataCollector
+            self.datacollector = DataCollector({"BankAsset": get_sum_totasset})
         print(f"max step: {self.max_steps}")
 
     def step(self):
-        if self.schedule.steps == 0:
+        started = self.timer.start()
+        if self.steps == 0:
 
             if self.is_init_db:
                 init_database()
                 logger.info("db initialization")
 
             if self.is_write_db:
-                self.conn = sqlite3.connect(self.sqlite_db)
-                self.db_cursor = self.conn.cursor()
-                self.simid = int(datetime.now().strftime("%y%m%d%H%M%S%f")[:-3])
+                self.simid = new_simid()
+                sqlite_db = self.sqlite_db
+                if self.shard_dir and self.sink_name == "sqlite":
+                    # a database file of its own, so parallel runs do not share the write lock
+                    sqlite_db = create_shard(shard_path(self.shard_dir, self.simid), self.sqlite_init_query)
+                if isinstance(self.sink_name, ResultSink):
+                    self.sink = self.sink_name
+                else:
+                    self.sink = create_sink(self.sink_name, self.write_agents, self.commit_every, sqlite_db,
+                                            self.parquet_dir, self.parquet_float32, self.mongo_db,
+                                            self.mongo_batch_size)
+                if self.async_write and self.sink.background:
+                    self.sink = BackgroundWriter(self.sink, self.write_queue_size)
                 title = "CAR {0:f}, Reserves Ratio {1:f}".format(
                     self.car, self.min_reserves_ratio
                 )
                 task = (self.simid, title, datetime.now(timezone.utc))
-                insert_simulation_table(self.db_cursor, task)
-
-            for i in range(self.initial_bank):
-                bank = Bank(
-                    {
-                        "unique_id": self.next_id(),
-                        "model": self,
-                        "equity": 100,
-                        "rfree": self.rfree,
-                        "car": self.car,
-                        "buffer_reserves_ratio": 1.5,
-                    }
-                )
-                self.grid.place_agent(bank, i)
-                self.schedule.add(bank)
+                self.sink.open(*task)
 
-            for i in range(self.initial_saver):
-                saver = Saver(
-                    {
-                        "unique_id": self.next_id(),
-                        "model": self,
-                        "balance": 1,
-                        "owns_account": False,
-                        "saver_solvent": True,
-                        "saver_exit": False,
-                        "withdraw_upperbound": 0.2,
-                        "exitprob_upperbound": 0.06,
-                    }
-                )
-                self.grid.place_agent(saver, random.choice(list(self.G.nodes)))
-                self.schedule.add(saver)
-
-            for i in range(self.initial_loan):
-                loan = Loan(
-                    {
-                        "unique_id": self.next_id(),
-                        "model": self,
-                        "rfree": self.rfree,
-                        "amount": 1,
-                        "loan_solvent": True,
-                        "loan_approved": False,
-                        "loan_dumped": False,
-                        "loan_liquidated": False,
-                        "pdf_upper": 0.1,
-                        "rcvry_rate": 0.4,
-                        "firesale_upper": 0.1,
-                    }
-                )
-                bank_id = random.choice(list(self.G.nodes))
-                loan.bank_id = bank_id
-                self.grid.place_agent(loan, bank_id)  # Evenly distributed
-                self.schedule.add(loan)
-
-            initialize_deposit_base(self.schedule)
-            initialize_loan_book(self.schedule, self.car, self.min_reserves_ratio)
+            self.create_agents()
+            initialize_deposit_base(self)
+            initialize_loan_book(self, self.car, self.min_reserves_ratio)
 
             self.running = True
-            self.datacollector.collect(self)
+            if self.datacollector is not None:
+                self.datacollector.collect(self)
+            started = self.timer.lap(self.steps, "initialize", started,
+                                     len(self.banks) + len(self.saver_pool) + len(self.loan_book))
 
-        if self.schedule.steps == self.max_steps:
+        if self.steps == self.max_steps:
             self.running = False
 
         # evaluate solvency of banks after loans experience default
         main_evaluate_solvency(
-            self.schedule, self.reserve_rates, self.bankrupt_liquidation, self.car
+            self, self.reserve_rates, self.bankrupt_liquidation, self.car, self.rngs["solvency"]
         )
+        started = self.timer.lap(self.steps, "evaluate_solvency", started, len(self.loan_book))
 
         # evaluate second round effects owing to cross_bank linkages
         # only interbank loans to cover shortages in reserves requirements are included
         main_second_round_effects(
-            self.schedule, self.bankrupt_liquidation, self.car, self.G
+            self, self.bankrupt_liquidation, self.car, self.rngs["second_round"]
         )
+        started = self.timer.lap(self.steps, "second_round_effects", started, len(self.banks))
 
         # Undercapitalized banks undertake risk_weight optimization
-        main_risk_weight_optimization(self.schedule, self.car)
+        main_risk_weight_optimization(self, self.car, self.rngs["risk_weight"])
+        started = self.timer.lap(self.steps, "risk_weight_optimization", started, len(self.loan_book))
 
         # banks that are well capitalized pay dividends
-        main_pay_dividends(self.schedule, self.car, self.min_reserves_ratio)
+        main_pay_dividends(self, self.car, self.min_reserves_ratio)
+        started = self.timer.lap(self.steps, "pay_dividends", started, len(self.banks))
 
         # Reset insolvent loans, i.e. rebirth lending opportunity
-        main_reset_insolvent_loans(self.schedule)
+        main_reset_insolvent_loans(self)
+        started = self.timer.lap(self.steps, "reset_insolvent_loans", started, len(self.loan_book))
 
         # Build up loan book with loans available in bank neighborhood
-        main_build_loan_book_locally(self.schedule, self.min_reserves_ratio, self.car)
+        main_build_loan_book_locally(self, self.min_reserves_ratio, self.car)
+        started = self.timer.lap(self.steps, "build_loan_book_locally", started, len(self.loan_book))
 
         # Build up loan book with loans available in other neighborhoods
-        main_build_loan_book_globally(self.schedule, self.car, self.min_reserves_ratio)
+        main_build_loan_book_globally(self, self.car, self.min_reserves_ratio, self.rngs["loan_market"])
+        started = self.timer.lap(self.steps, "build_loan_book_globally", started, len(self.loan_book))
 
         # main_raise_deposits_build_loan_book
         # Evaluate liquidity needs related to reserves requirements
         main_evaluate_liquidity(
-            self.schedule, self.car, self.min_reserves_ratio, self.bankrupt_liquidation
+            self, self.car, self.min_reserves_ratio, self.bankrupt_liquidation, self.rngs["liquidity"]
         )
+        started = self.timer.lap(self.steps, "evaluate_liquidity", started, len(self.saver_pool))
 
-        main_write_bank_ratios(
-            self.schedule, self.lst_bank_ratio, self.car, self.min_reserves_ratio
-        )
-        main_write_interbank_links(self.schedule, self.lst_ibloan)
+        self.bank_ratios.record(self.steps, self.banks, self.car, self.min_reserves_ratio)
+        self.ib_links.record(self.steps, self.ibloan_book)
+        started = self.timer.lap(self.steps, "record_ratios", started, len(self.banks) + len(self.ibloan_book))
 
         if self.is_write_db:
-            # Insert agent variables of current step into SQLITEDB
-            # insert_agtsaver_table(self.db_cursor, self.simid, self.schedule.steps,[x for x in self.schedule.agents if isinstance(x, Saver)])
-            # insert_agtloan_table(self.db_cursor, self.simid, self.schedule.steps, [x for x in self.schedule.agents if isinstance(x, Loan)])
-            # # It needs to log before the 2nd round effect begin because the function initializes
-            insert_agtbank_table(
-                self.db_cursor,
+            # Write agent variables of current step to the result sink
+            self.sink.write_step(
                 self.simid,
-                self.schedule.steps,
-                [x for x in self.schedule.agents if isinstance(x, Bank)],
+                self.steps,
+                self.banks,
+                self.saver_pool,
+                self.loan_book,
+                self.ibloan_book,
             )
-            # insert_agtibloan_table(self.db_cursor, self.simid, self.schedule.steps,
-            #                        [x for x in self.schedule.agents if isinstance(x, Ibloan)])
-            self.conn.commit()
+            if not self.running:
+                self.sink.flush()
+            agents = len(self.banks)
+            if self.write_agents:
+                agents += len(self.saver_pool) + len(self.loan_book) + len(self.ibloan_book)
+            started = self.timer.lap(self.steps, "write_results", started, agents)
 
-        self.schedule.step()
-        self.datacollector.collect(self)
+        if self.materialize_graph:
+            self.materialize_interbank_graph()
+            started = self.timer.lap(self.steps, "materialize_graph", started, len(self.ibloan_book))
+
+        self.steps += 1
+        if self.schedule is not None:
+            self.schedule.step()
+        if self.datacollector is not None:
+            self.datacollector.collect(self)
+
+    def create_agents(self):
+        """
+        Create the banks, the saver pool and the loan book of step 0, before f1 builds the market
+        """
+        traced = self.timer.traced()
+        for i in range(self.initial_bank):
+            bank = Bank(
+                {
+                    "unique_id": self.next_id(),
+                    "model": self,
+                    "equity": 100,
+                    "rfree": self.rfree,
+                    "car": self.car,
+                    "buffer_reserves_ratio": 1.5,
+                }
+            )
+            bank.pos = i
+            if self._grid is not None:
+                self._grid.place_agent(bank, i)
+            self.banks.append(bank)
+            if self.schedule is not None:
+                self.schedule.add(bank)
+        traced = self.timer.footprint("Bank", len(self.banks), traced)
+
+        self.saver_pool = SaverPool(
+            {
+                "unique_id": self.current_id + 1,
+                "size": self.initial_saver,
+                "n_banks": self.initial_bank,
+                "rng": self.rngs["init"],
+                "balance": 1,
+                "owns_account": False,
+                "saver_solvent": True,
+                "saver_exit": False,
+                "withdraw_upperbound": 0.2,
+                "exitprob_upperbound": 0.06,
+            }
+        )
+        self.current_id += self.initial_saver
+        self.saver_pool.debug_aggregates = self.debug_aggregates
+        # one vectorized draw of the bank of every saver
+        self.saver_pool.assign(np.arange(self.initial_saver),
+                               self.rngs["init"].integers(self.initial_bank, size=self.initial_saver))
+        traced = self.timer.footprint("Saver", len(self.saver_pool), traced)
+
+        self.loan_book = LoanBook(
+            {
+                "unique_id": self.current_id + 1,
+                "size": self.initial_loan,
+                "n_banks": self.initial_bank,
+                "rng": self.rngs["init"],
+                "rfree": self.rfree,
+                "amount": 1,
+                "loan_solvent": True,
+                "loan_approved": False,
+                "loan_dumped": False,
+                "loan_liquidated": False,
+                "pdf_upper": 0.1,
+                "rcvry_rate": 0.4,
+                "firesale_upper": 0.1,
+            }
+        )
+        self.current_id += self.initial_loan
+        # Evenly distributed
+        self.loan_book.debug_aggregates = self.debug_aggregates
+        self.loan_book.assign(np.arange(self.initial_loan),
+                              self.rngs["init"].integers(self.initial_bank, size=self.initial_loan))
+        self.timer.footprint("Loan", len(self.loan_book), traced)
+
+    @property
+    def G(self):
+        """
+        Empty graph of the banks, networkx is only imported on first use
+        """
+        if self._G is None:
+            import networkx as nx
+            self._G = nx.empty_graph(self.initial_bank)
+        return self._G
+
+    @property
+    def grid(self):
+        """
+        NetworkGrid of the banks on G, banks created before its first use are placed on it then
+        """
+        if self._grid is None:
+            self._grid = NetworkGrid(self.G)
+            for bank in self.banks:
+                self._grid.place_agent(bank, bank.pos)
+        return self._grid
+
+    def materialize_interbank_graph(self):
+        """
+        Mirror the inter-bank loans of the current step as edges of G for the network visualization
+        """
+        self.G.remove_edges_from(list(self.G.edges))
+        self.G.add_edges_from(self.ibloan_book.edges())
+
+    @property
+    def phase_timings(self):
+        """
+        Wall time, calls and agents per step and phase as a DataFrame, empty unless time_phases is set
+        """
+        return self.timer.frame()
+
+    @property
+    def agent_footprint(self):
+        """
+        Bytes held per agent type after step 0 as a DataFrame, empty unless profile_memory is set
+        """
+        return self.timer.footprint_frame()
+
+    def close_db(self):
+        """
+        Write the pending steps and phase timings, close the result sink and stop the tracing of profile_memory
+        """
+        try:
+            if self.sink is not None:
+                try:
+                    rows = self.timer.rows(self.simid)[self.timings_written:]
+                    if rows:
+                        self.sink.write_timings(self.simid, rows)
+                        self.timings_written += len(rows)
+                finally:
+                    self.sink.close()
+        finally:
+            # a failed sink must not leave tracemalloc tracing for the rest of the process
+            self.timer.end()
 
     def run_model(self, step_count=20):
         """
@@ -218,36 +431,31 @@ class BankSim(Model):
         :param step_count:
         :return:
         """
+        logger.info(" SEED: %d, replica: %s", self.seed, self.replica)
         for i in range(step_count):
             if i % 10 == 0 or (i + 1) == step_count:
                 logger.info(
                     " STEP: %3d - # of sovent bank: %2d",
                     i,
-                    len(
-                        [
-                            x
-                            for x in self.schedule.agents
-                            if isinstance(x, Bank) and x.bank_solvent
-                        ]
-                    ),
+                    len([x for x in self.banks if x.bank_solvent]),
                 )
             try:
                 self.step()
+            except WriterError:
+                # results are no longer persisted, so the run stops and the error reaches the caller
+                logger.error(traceback.format_exc())
+                try:
+                    self.close_db()
+                except WriterError:
+                    pass  # close raises the same failure of the writer again
+                raise
             except:
                 error = traceback.format_exc()
                 logger.error(error)
-            if (
-                len(
-                    [
-                        x
-                        for x in self.schedule.agents
-                        if isinstance(x, Bank) and x.bank_solvent
-                    ]
-                )
-                == 0
-            ):
+            if len([x for x in self.banks if x.bank_solvent]) == 0:
                 logger.info("All banks are bankrupt!")
                 break
-        # df_bank, df_ibloan = convert_result2dataframe(self.lst_bank_ratio, self.lst_ibloan)
+        self.close_db()
+        # df_bank, df_ibloan = convert_result2dataframe(self.bank_ratios, self.ib_links)
         # return df_bank, df_ibloan
         return True
@@ -28,6 +28,9 @@ canvas_network = NetworkModule(mesa_abba_network_portrayal, 500, 600, library='s
 chart_element = ChartModule([{"Label":"BankAsset","Color":"#AA0000"}])
 
 model_params = {"write_db": UserSettableParameter("checkbox",'Write DB',value=True),
+                "materialize_graph": True,
+                "headless": False,
+                "commit_every": 1,
                 "max_steps": UserSettableParameter("slider", "Max steps", 20, 10, 200, 1),
                 "initial_saver": UserSettableParameter("slider", "# of Saver", 10000, 10000, 20000, 100),
                 "initial_bank": UserSettableParameter("slider", "# of Bank", 10, 10, 20, 1),
@@ -35,7 +38,8 @@ model_params = {"write_db": UserSettableParameter("checkbox",'Write DB',value=Tr
                 "initial_equity": UserSettableParameter("slider", "Initial Equity of Bank", 100, 100, 200,1),
                 "car": UserSettableParameter("number", "Minimum capital adequacy ratio", value=0.08),
                 "rfree": UserSettableParameter("number","Risk Free Rate", value=0.01),
-                "min_reserves_ratio": UserSettableParameter("number","Minimum Reserve Ratio", value=0.03)
+                "min_reserves_ratio": UserSettableParameter("number","Minimum Reserve Ratio", value=0.03),
+                "random_market_order": UserSettableParameter("checkbox", "Random global loan market order", value=False)
                 }
 
 server = ModularServer(BankSim, [canvas_network, chart_element], "Banking system simulator", model_params)
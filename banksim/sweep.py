@@ -0,0 +1,167 @@
+"""
+Parallel parameter sweep of BankSim
+
+Runs every point of a parameter grid with replicas across a process pool and gathers the bank ratios
+of all runs into one tidy table, one row per run, step and bank.
+
+    $ python -m banksim.sweep --grid car=0.04,0.08,0.12,0.16 --grid min_reserves_ratio=0.03,0.045,0.06 \
+          --replicas 50 --steps 240 --output sweep.csv
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from banksim.logger import get_logger
+from banksim.model import BankSim
+from banksim.util.write_sqlitedb import WriterError
+
+logger = get_logger("sweep")
+
+# parameters of scenario.py, the ABBA paper setup
+BASE_PARAMS = {"init_db": False,
+               "write_db": False,
+               "max_steps": 240,
+               "initial_saver": 10000,
+               "initial_bank": 10,
+               "initial_loan": 20000,
+               "initial_equity": 100,
+               "rfree": 0.01,
+               "car": 0.08,
+               "min_reserves_ratio": 0.03
+               }
+
+# capital requirement x reserve ratio grid of scenario.py
+DEFAULT_GRID = {"car": [0.04, 0.08, 0.12, 0.16],
+                "min_reserves_ratio": [0.03, 0.045, 0.06]}
+
+
+def expand_grid(base_params, grid, replicas=1):
+    """
+    Run specifications of every grid point and replica
+
+    :param base_params: model parameters shared by all runs
+    :param grid: dict of parameter name -> list of values, crossed with each other
+    :param replicas: number of runs per grid point
+    :return: list of dicts with run_id, replica, the grid point and the full model parameters
+
+    The model parameters carry the replica index, so with a seed every replica draws its own random streams
+    and the same replica of every grid point draws the same ones (common random numbers).
+    """
+    names = list(grid)
+    res = list()
+    for point in itertools.product(*[grid[x] for x in names]):
+        for replica in range(replicas):
+            params = dict(base_params)
+            params.update(zip(names, point))
+            params["replica"] = replica
+            res.append({"run_id": len(res),
+                        "replica": replica,
+                        "point": dict(zip(names, point)),
+                        "params": params})
+    return res
+
+
+def run_one(spec, step_count=None):
+    """
+    Run one model and return its bank ratios as a tidy DataFrame
+
+    Every run builds its own BankSim in the worker process, so no state is shared between runs. A run whose
+    result sink fails, e.g. on a locked database, is logged and returns an empty DataFrame, so the other runs
+    of the sweep carry on.
+    """
+    params = spec["params"]
+    model = BankSim(**params)
+    try:
+        model.run_model(step_count=params["max_steps"] if step_count is None else step_count)
+    except WriterError:
+        logger.error("run %d failed: %s", spec["run_id"], traceback.format_exc())
+        return pd.DataFrame()
+    if not len(model.bank_ratios):
+        return pd.DataFrame()
+    df_bank = model.bank_ratios.frame().reset_index()
+    for name, value in reversed(list(spec["point"].items())):
+        if name not in df_bank:
+            df_bank.insert(0, name, value)
+    df_bank.insert(0, "replica", spec["replica"])
+    df_bank.insert(0, "seed", model.seed)
+    df_bank.insert(0, "run_id", spec["run_id"])
+    return df_bank
+
+
+def _run_one(args):
+    return run_one(*args)
+
+
+def run_sweep(base_params=None, grid=None, replicas=1, step_count=None, max_workers=None, seed=None):
+    """
+    Run a parameter grid with replicas on a process pool
+
+    :param base_params: model parameters shared by all runs, BASE_PARAMS by default
+    :param grid: dict of parameter name -> list of values, DEFAULT_GRID by default
+    :param replicas: number of runs per grid point
+    :param step_count: steps per run, max_steps of the run parameters by default
+    :param max_workers: size of the process pool, number of CPUs by default
+    :param seed: seed of the sweep, seed of base_params or fresh OS entropy by default
+    :return: tidy DataFrame of bank ratios with run_id, replica, grid point, step and bank columns, without
+             the runs whose result sink failed
+    """
+    base_params = dict(BASE_PARAMS if base_params is None else base_params)
+    if seed is not None:
+        base_params["seed"] = seed
+    elif base_params.get("seed") is None:
+        # one entropy for the whole sweep keeps it reproducible and the replicas common to all grid points
+        base_params["seed"] = np.random.SeedSequence().entropy
+    specs = expand_grid(base_params, DEFAULT_GRID if grid is None else grid, replicas)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(_run_one, [(x, step_count) for x in specs]))
+    frames = [x for x in frames if len(x)]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _parse_grid_arg(text):
+    name, values = text.split("=", 1)
+    return name, [_parse_value(x) for x in values.split(",")]
+
+
+def _parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return {"true": True, "false": False}.get(text.lower(), text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m banksim.sweep", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--grid", action="append", type=_parse_grid_arg, metavar="NAME=V1,V2,...",
+                        help="parameter values to sweep, repeat for a cross product (default: CAR x reserve ratio)")
+    parser.add_argument("--set", action="append", type=_parse_grid_arg, default=[], metavar="NAME=VALUE",
+                        help="override a base model parameter")
+    parser.add_argument("--replicas", type=int, default=1, help="runs per grid point")
+    parser.add_argument("--steps", type=int, default=None, help="steps per run (default: max_steps)")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the sweep (default: OS entropy)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--output", default="sweep.csv", help="result table, .csv or .parquet")
+    args = parser.parse_args(argv)
+
+    base_params = dict(BASE_PARAMS)
+    for name, values in args.set:
+        base_params[name] = values[0]
+    grid = dict(args.grid) if args.grid else DEFAULT_GRID
+    result = run_sweep(base_params, grid, args.replicas, args.steps, args.workers, args.seed)
+    if args.output.endswith(".parquet"):
+        result.to_parquet(args.output, index=False)
+    else:
+        result.to_csv(args.output, index=False)
+    print("{} rows of {} runs written to {}".format(len(result), result["run_id"].nunique() if len(result) else 0,
+                                                   args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import time
+import tracemalloc
+
+# columns of PhaseTimer.frame, the PhaseTiming table adds SimId
+PHASE_TIMING_COLUMNS = ("step", "phase", "seconds", "calls", "agents")
+# further columns of PhaseTimer.frame with memory: traced bytes after the phase and peak traced bytes during it
+PHASE_MEMORY_COLUMNS = ("memory", "peak")
+
+
+class PhaseTimer:
+    """
+    Wall time, calls and agents of the phases of BankSim.step
+
+    A phase is measured from the previous lap, or start, to its own lap:
+
+        t = timer.start()
+        main_evaluate_solvency(...)
+        t = timer.lap(step, "evaluate_solvency", t, len(loan_book))
+
+    When disabled, start and lap return at once and nothing is recorded.
+
+    With memory, allocations are traced by tracemalloc between begin and end; every lap also records the traced
+    bytes and their peak since the previous lap, and footprint records the bytes retained by new agents.
+    Tracing slows the model down several times, so times of a memory profile are not comparable to others.
+    Before Python 3.9 tracemalloc cannot reset its peak: the peak of a phase is then exact when the phase
+    raised the peak of the whole trace and the traced bytes after the phase otherwise, a lower bound.
+    """
+
+    def __init__(self, enabled=False, memory=False):
+        self.enabled = enabled or memory
+        self.memory = memory
+        self.records = list()  # (step, phase, seconds, calls, agents)
+        self.memory_records = list()  # (memory, peak) of each record
+        self.footprints = list()  # (agent, count, bytes)
+        self.tracing = False  # tracemalloc was started by begin
+        self.last_peak = 0  # peak of the whole trace at the previous start or lap, without reset_peak
+
+    def begin(self):
+        """
+        Start tracing allocations if memory is profiled and tracemalloc is not tracing yet
+        """
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+
+    def end(self):
+        """
+        Stop the tracing started by begin
+        """
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def start(self):
+        if not self.enabled:
+            return 0.0
+        if self.memory:
+            self._reset_peak()
+        return time.perf_counter()
+
+    def lap(self, step, phase, started, agents=0, calls=1):
+        """
+        Record a phase that ran since started and return the start of the next one
+
+        :param step: step of the model
+        :param phase: name of the phase
+        :param started: value of the previous start or lap
+        :param agents: number of agents the phase went through
+        :param calls: number of calls of the phase
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        self.records.append((step, phase, now - started, calls, agents))
+        if self.memory:
+            memory, peak = tracemalloc.get_traced_memory()
+            if not hasattr(tracemalloc, "reset_peak") and peak <= self.last_peak:
+                peak = memory
+            self.memory_records.append((memory, peak))
+            self._reset_peak()
+        return now
+
+    def _reset_peak(self):
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:
+            self.last_peak = tracemalloc.get_traced_memory()[1]
+
+    def traced(self):
+        """
+        Bytes traced by tracemalloc, 0 unless memory is profiled
+        """
+        return tracemalloc.get_traced_memory()[0] if self.memory and tracemalloc.is_tracing() else 0
+
+    def footprint(self, agent, count, started):
+        """
+        Record the bytes allocated and still held since started, the traced value before count agents were
+        created, and return the traced value for the next agent type
+        """
+        if not self.memory:
+            return 0
+        now = self.traced()
+        self.footprints.append((agent, count, now - started))
+        return now
+
+    def frame(self):
+        """
+        One row per step and phase, with the columns of PHASE_MEMORY_COLUMNS if memory is profiled
+        """
+        import pandas as pd
+        res = pd.DataFrame(self.records, columns=list(PHASE_TIMING_COLUMNS))
+        if self.memory:
+            res[list(PHASE_MEMORY_COLUMNS)] = pd.DataFrame(self.memory_records, columns=list(PHASE_MEMORY_COLUMNS),
+                                                           dtype="int64")
+        return res
+
+    def summary(self):
+        """
+        Totals per phase in order of first appearance, with the share of the measured time and, if memory is
+        profiled, the highest peak of traced bytes
+        """
+        frame = self.frame()
+        res = frame.groupby("phase", sort=False).agg(calls=("calls", "sum"), seconds=("seconds", "sum"),
+                                                     agents=("agents", "sum"))
+        res["seconds_per_call"] = res["seconds"] / res["calls"]
+        res["share"] = res["seconds"] / res["seconds"].sum()
+        if self.memory:
+            res["peak"] = frame.groupby("phase", sort=False)["peak"].max()
+        return res
+
+    def memory_by_step(self):
+        """
+        Traced bytes at the end of every step, their peak during the step and the growth over the previous step
+        """
+        res = self.frame().groupby("step").agg(memory=("memory", "last"), peak=("peak", "max"))
+        res["growth"] = res["memory"].diff()
+        return res
+
+    def footprint_frame(self):
+        """
+        Bytes held per agent type after its creation
+        """
+        import pandas as pd
+        res = pd.DataFrame(self.footprints, columns=["agent", "count", "bytes"])
+        res["bytes_per_agent"] = res["bytes"] / res["count"]
+        return res
+
+    def rows(self, simid):
+        """
+        Rows of the PhaseTiming table
+        """
+        return [(simid,) + x for x in self.records]
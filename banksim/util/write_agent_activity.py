@@ -1,47 +1,129 @@
-import pandas as pd
-
-from banksim.agent.bank import Bank
-from banksim.agent.ibloan import Ibloan
-
-
-def main_write_bank_ratios(schedule, lst_bank_ratio, car, min_reserves_ratio):
-    for bank in [x for x in schedule.agents if isinstance(x, Bank)]:
-        lst_bank_ratio.append([
-            #bank.pos,
-            car,                   # 0
-            min_reserves_ratio,    # 1
-            bank.capital_ratio,         # 2
-            bank.reserves_ratio,        # 3
-            bank.leverage_ratio,        # 4
-            bank.upper_bound_cratio,    # 5
-            bank.buffer_reserves_ratio, # 6
-            bank.bank_dividend,         # 7
-            bank.bank_cum_dividend,     # 8
-            bank.bank_loans,            # 9
-            #bank.interest_income,       # 10
-            #bank.interest_expense,      # 11
-            bank.bank_reserves,         # 12
-            bank.bank_deposits,         # 13
-            bank.equity,                # 14
-            bank.total_assets,          # 15
-            bank.rwassets,              # 16
-            bank.credit_failure,        # 17
-            bank.liquidity_failure      # 18
-            #len([x for x in self.schedule.agents if isinstance(x, Saver) and x.pos == bank.pos])
-        ])
-
-
-def main_write_interbank_links(schedule, lst_ibloan):
-    for ibloan in [x for x in schedule.agents if isinstance(x, Ibloan)]:
-        lst_ibloan.append([ibloan.ib_creditor.pos, ibloan.ib_debtor.pos, ibloan.ib_amount])
-
-
-def convert_result2dataframe(lst_bank_ratio, lst_ibloan):
-    df_bank = pd.DataFrame(lst_bank_ratio)
-    df_ibloan = pd.DataFrame(lst_ibloan)
-    df_bank.columns = ['car', 'minReservesRatio', 'capitalRatio', 'reservesRatio', 'leverageRatio',
-                       'upperReservesRatio',
-                       'bufferReservesRatio', 'bankDividend', 'bankCumDividend', 'bankLoans', 'bankReserves',
-                       'bankDeposits', 'equity', 'totalAssets', 'rwassets', 'creditFailure', 'liquidityFailure']
-    df_ibloan.columns = ['ibCreditor', 'ibDebtor', 'ibAmount']
-    return df_bank, df_ibloan
\ No newline at end of file
+import numpy as np
+
+
+# metrics of BankRatioRecorder, one value per bank and recorded step
+BANK_RATIO_COLUMNS = ('car', 'minReservesRatio', 'capitalRatio', 'reservesRatio', 'leverageRatio',
+                      'upperReservesRatio', 'bufferReservesRatio', 'bankDividend', 'bankCumDividend', 'bankLoans',
+                      'bankReserves', 'bankDeposits', 'equity', 'totalAssets', 'rwassets', 'creditFailure',
+                      'liquidityFailure')
+
+# columns of InterbankLinkRecorder, creditor and debtor are bank positions
+INTERBANK_LINK_COLUMNS = ('step', 'ibCreditor', 'ibDebtor', 'ibAmount')
+
+
+class BankRatioRecorder:
+    """
+    Bank ratios of a run in a preallocated array of shape (recorded steps, banks, metrics)
+
+    Steps are recorded every interval steps, so max_steps // interval rows are allocated with the first record
+    and filled in place; runs longer than max_steps double the array. Failure flags are stored as 0.0/1.0.
+    """
+
+    def __init__(self, max_steps, interval=1):
+        """
+        :param max_steps: number of steps of the run
+        :param interval: record every interval-th step, starting with step 0
+        """
+        self.interval = interval
+        self.capacity = max(1, -(-max_steps // interval))
+        self.data = None  # allocated with the number of banks at the first record
+        self.steps = np.empty(self.capacity, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def record(self, step, banks, car, min_reserves_ratio):
+        if step % self.interval != 0:
+            return
+        if self.data is None:
+            self.data = np.empty((self.capacity, len(banks), len(BANK_RATIO_COLUMNS)))
+        if self.size == len(self.data):
+            self.data = np.concatenate([self.data, np.empty_like(self.data)])
+            self.steps = np.concatenate([self.steps, np.empty_like(self.steps)])
+        row = self.data[self.size]
+        for i, bank in enumerate(banks):
+            row[i] = (car, min_reserves_ratio, bank.capital_ratio, bank.reserves_ratio, bank.leverage_ratio,
+                      bank.upper_bound_cratio, bank.buffer_reserves_ratio, bank.bank_dividend,
+                      bank.bank_cum_dividend, bank.bank_loans, bank.bank_reserves, bank.bank_deposits, bank.equity,
+                      bank.total_assets, bank.rwassets, bank.credit_failure, bank.liquidity_failure)
+        self.steps[self.size] = step
+        self.size += 1
+
+    @property
+    def values(self):
+        """
+        View of the recorded part of the array
+        """
+        if self.data is None:
+            return np.empty((0, 0, len(BANK_RATIO_COLUMNS)))
+        return self.data[:self.size]
+
+    def frame(self):
+        """
+        DataFrame on the recorded array without copying it, one row per step and bank indexed by (step, bank)
+        """
+        import pandas as pd
+        values = self.values
+        index = pd.MultiIndex.from_product([self.steps[:self.size], range(values.shape[1])], names=["step", "bank"])
+        return pd.DataFrame(values.reshape(-1, len(BANK_RATIO_COLUMNS)), index=index,
+                            columns=list(BANK_RATIO_COLUMNS), copy=False)
+
+    def to_xarray(self):
+        """
+        xarray DataArray on the recorded array with dimensions step, bank and metric
+        """
+        # xarray is an optional dependency, only needed for this view
+        import xarray as xr
+        values = self.values
+        return xr.DataArray(values, dims=("step", "bank", "metric"),
+                            coords={"step": self.steps[:self.size], "bank": np.arange(values.shape[1]),
+                                    "metric": list(BANK_RATIO_COLUMNS)})
+
+
+class InterbankLinkRecorder:
+    """
+    Interbank loans of a run in preallocated columns, one row per loan and step
+
+    Room for one loan per bank and step of the run is allocated with the first record and doubled when full,
+    and each step's edges are copied in with slice assignments.
+    """
+
+    def __init__(self, max_steps):
+        """
+        :param max_steps: number of steps of the run
+        """
+        self.max_steps = max(1, max_steps)
+        self.columns = None  # name of INTERBANK_LINK_COLUMNS -> array, allocated at the first record
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def record(self, step, ibloan_book):
+        if self.columns is None:
+            capacity = self.max_steps * max(1, len(ibloan_book.banks))
+            self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in
+                            zip(INTERBANK_LINK_COLUMNS, (np.int64, np.int64, np.int64, float))}
+        end = self.size + len(ibloan_book)
+        while end > len(self.columns["step"]):
+            self.columns = {name: np.concatenate([x, np.empty_like(x)]) for name, x in self.columns.items()}
+        for name, values in zip(INTERBANK_LINK_COLUMNS,
+                                (step, ibloan_book.creditor, ibloan_book.debtor, ibloan_book.amount)):
+            self.columns[name][self.size:end] = values
+        self.size = end
+
+    def frame(self):
+        """
+        DataFrame of the recorded loans with the columns of INTERBANK_LINK_COLUMNS
+        """
+        import pandas as pd
+        if self.columns is None:
+            return pd.DataFrame(columns=list(INTERBANK_LINK_COLUMNS))
+        return pd.DataFrame({name: x[:self.size] for name, x in self.columns.items()})
+
+
+def convert_result2dataframe(bank_ratios, ib_links):
+    df_bank = bank_ratios.frame().reset_index(drop=True)
+    df_ibloan = ib_links.frame().drop(columns="step")
+    return df_bank, df_ibloan
@@ -0,0 +1,216 @@
+import os
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from banksim.db.base_handler import ResultSink
+from banksim.util.write_sqlitedb import step_snapshot
+
+# AgtBank columns after AgtBankId, SimId and StepCnt, in the order of Bank.get_all_variables
+BANK_COLUMNS = ("BankId", "BankEquity", "BankDeposit", "BankLoan", "BankReserve", "BankAsset", "BankProvision",
+                "BankNProvision", "BankDepositRate", "BankIbCredit", "BankIbDebit", "BankNetInterestIncome",
+                "BankInterestIncome", "BankInterestExpense", "BankIbInterestIncome", "BankIbInterestExpense",
+                "BankIbNetInterestIncome", "BankIbCreditLoss", "BankRiskWgtAsset", "BankDividend", "BankCumDividend",
+                "BankDepositOutflow", "BankDepositInflow", "BankNetDepositflow", "BankDefaultedLoan", "BankSolvent",
+                "BankCapitalized", "BankCreditFailure", "BankLiquidityFailure")
+BANK_FLAGS = ("BankSolvent", "BankCapitalized", "BankCreditFailure", "BankLiquidityFailure")
+
+# table column -> column of the agent store, named as in banksim_sqlite.sql
+SAVER_COLUMNS = {"SaverId": "unique_id", "SaverBalance": "balance", "SaverWithdrawProb": "withdraw_prob",
+                 "SaverExitProb": "exit_prob", "SaverBankId": "bank_id", "SaverOwnAccount": "owns_account",
+                 "SaverSolvent": "saver_solvent", "SaverExit": "saver_exit"}
+LOAN_COLUMNS = {"LoanId": "unique_id", "LoanProbDefault": "pdef", "LoanAmount": "amount", "LoanRiskWgt": "rweight",
+                "LoanRiskWgtAmt": "rwamount", "LoanLgdAmt": "lgdamount", "LoanRecovery": "loan_recovery",
+                "LoanRcvryRate": "rcvry_rate", "LoanFireSaleLoss": "fire_sale_loss", "LoanRateQuote": "rate_quote",
+                "LoanPlusRate": "loan_plus_rate", "LoanInterestPymt": "interest_payment",
+                "LoanApproved": "loan_approved", "LoanSolvent": "loan_solvent", "LoanDumped": "loan_dumped",
+                "LoanLiquidated": "loan_liquidated", "LoanBankId": "bank_id"}
+IBLOAN_COLUMNS = {"IbLoanId": "unique_id", "IbLoanRate": "rate", "IbLoanAmount": "amount",
+                  "IbLoanCreditor": "creditor", "IbLoanDebtor": "debtor"}
+# low-cardinality columns stored with dictionary encoding
+DICTIONARY_COLUMNS = BANK_FLAGS + ("SaverBankId", "SaverOwnAccount", "SaverSolvent", "SaverExit", "LoanApproved",
+                                   "LoanSolvent", "LoanDumped", "LoanLiquidated", "LoanBankId", "IbLoanCreditor",
+                                   "IbLoanDebtor")
+
+
+def _column(values, float32):
+    """
+    Arrow array of a column: flags as int8 0/1 like the SQLite tables, floats optionally narrowed to float32
+    """
+    values = np.asarray(values)
+    if values.dtype == bool:
+        return pa.array(values.astype(np.int8))
+    if values.dtype.kind == "f" and float32:
+        return pa.array(values.astype(np.float32))
+    return pa.array(values)
+
+
+def _bank_table(numstep, rows, float32):
+    float_type = pa.float32() if float32 else pa.float64()
+    columns = list(zip(*rows)) if rows else [()] * (len(BANK_COLUMNS) + 4)
+    arrays = [pa.array(np.full(len(rows), numstep, dtype=np.int64))]
+    for name, values in zip(BANK_COLUMNS, columns[3:]):
+        if name == "BankId":
+            arrays.append(pa.array(values, type=pa.int64()))
+        elif name in BANK_FLAGS:
+            arrays.append(pa.array(values, type=pa.int8()))
+        else:
+            arrays.append(pa.array(values, type=float_type))
+    return pa.Table.from_arrays(arrays, names=("StepCnt",) + BANK_COLUMNS)
+
+
+def _agent_table(numstep, store, columns, float32):
+    arrays = [pa.array(np.full(len(store), numstep, dtype=np.int64))]
+    arrays.extend(_column(getattr(store, x), float32) for x in columns.values())
+    return pa.Table.from_arrays(arrays, names=["StepCnt"] + list(columns))
+
+
+def _ibloan_table(numstep, ibloan_book, float32):
+    table = _agent_table(numstep, ibloan_book, IBLOAN_COLUMNS, float32)
+    # creditor and debtor by bank unique_id, as in AgtIbLoan
+    bank_unique_id = np.array([x.unique_id for x in ibloan_book.banks], dtype=np.int64)
+    for name in ("IbLoanCreditor", "IbLoanDebtor"):
+        positions = table.column(name).to_numpy()
+        table = table.set_column(table.schema.get_field_index(name), name, pa.array(bank_unique_id[positions]))
+    return table
+
+
+class ParquetWriter(ResultSink):
+    """
+    Streaming writer of agent states into a Parquet dataset, the parquet result sink
+
+    Every table is a directory of files partitioned Hive-style by simulation id and step chunk,
+    <root>/<table>/SimId=<simid>/StepChunk=<chunk>/part-<writer>-0.parquet with chunk = step // step_chunk,
+    so scans of pyarrow.dataset or pandas.read_parquet prune partitions and row groups with filters on SimId,
+    StepChunk or StepCnt. Each step is appended as a row group to the open file of its chunk, so memory does
+    not grow with the number of steps. Flag columns are int8 with dictionary encoding; float32 narrows all
+    float columns.
+
+    Tables and columns are named as in banksim_sqlite.sql, without the synthetic Agt*Id keys and step dates.
+    <writer> is a random id of the writer, so writers that share a partition, e.g. parallel runs of the same
+    simulation id, add files next to each other instead of overwriting them.
+    """
+
+    background = True
+
+    def __init__(self, root, step_chunk=10, write_agents=False, float32=False, compression="snappy"):
+        """
+        :param root: directory of the dataset
+        :param step_chunk: number of steps per file
+        :param write_agents: False: bank rows only, True: saver, loan and interbank loan rows as well
+        :param float32: store float columns as float32
+        :param compression: Parquet compression codec
+        """
+        self.root = root
+        self.step_chunk = step_chunk
+        self.write_agents = write_agents
+        self.float32 = float32
+        self.compression = compression
+        self.simid = None
+        self.chunk = None
+        self.writers = dict()  # table -> pyarrow ParquetWriter of the current chunk
+        self.parts = dict()  # (table, simid, chunk) -> number of files written, a chunk reopened after commit
+        self.writer_id = uuid.uuid4().hex  # part file names of this writer, unique across writers and processes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, table, simid, chunk=None):
+        path = os.path.join(self.root, table, "SimId={}".format(simid))
+        if chunk is not None:
+            path = os.path.join(path, "StepChunk={}".format(chunk))
+        os.makedirs(path, exist_ok=True)
+        part = self.parts.get((table, simid, chunk), 0)
+        self.parts[(table, simid, chunk)] = part + 1
+        return os.path.join(path, "part-{}-{}.parquet".format(self.writer_id, part))
+
+    def open(self, simid, title, simdate):
+        self.insert_simulation((simid, title, simdate))
+
+    def insert_simulation(self, task):
+        simid, title, simdate = task
+        self.simid = simid
+        if not isinstance(simdate, datetime):
+            # datetime.fromisoformat needs Python 3.7
+            import pandas as pd
+            simdate = pd.Timestamp(str(simdate)).to_pydatetime()
+        table = pa.table({"Title": [title], "SimDate": pa.array([simdate], type=pa.timestamp("us", tz="UTC"))})
+        pq.write_table(table, self._path("Simulation", simid), compression=self.compression)
+
+    def snapshot(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        return step_snapshot(simid, numstep, banks, saver_pool, loan_book, ibloan_book, self.write_agents)
+
+    def write_step(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        """
+        Append the agent states of one step to the files of its chunk
+        """
+        snapshot = step_snapshot(simid, numstep, banks)
+        snapshot.update(savers=saver_pool, loans=loan_book, ibloans=ibloan_book)
+        self.write_snapshot(snapshot)
+
+    def write_snapshot(self, snapshot):
+        simid, numstep = snapshot["simid"], snapshot["numstep"]
+        chunk = numstep // self.step_chunk
+        if (simid, chunk) != (self.simid, self.chunk):
+            self.commit()
+            self.simid, self.chunk = simid, chunk
+        tables = {"AgtBank": _bank_table(numstep, snapshot["banks"], self.float32)}
+        if self.write_agents:
+            if snapshot.get("savers") is not None:
+                tables["AgtSaver"] = _agent_table(numstep, snapshot["savers"], SAVER_COLUMNS, self.float32)
+            if snapshot.get("loans") is not None:
+                tables["AgtLoan"] = _agent_table(numstep, snapshot["loans"], LOAN_COLUMNS, self.float32)
+            if snapshot.get("ibloans") is not None:
+                tables["AgtIbLoan"] = _ibloan_table(numstep, snapshot["ibloans"], self.float32)
+        for name, table in tables.items():
+            if name not in self.writers:
+                dictionary = [x for x in table.column_names if x in DICTIONARY_COLUMNS]
+                self.writers[name] = pq.ParquetWriter(self._path(name, simid, chunk), table.schema,
+                                                      compression=self.compression, use_dictionary=dictionary)
+            self.writers[name].write_table(table)
+
+    def write_timings(self, simid, rows):
+        columns = list(zip(*rows))
+        table = pa.table({"StepCnt": pa.array(columns[1], type=pa.int64()), "Phase": pa.array(columns[2]),
+                          "Seconds": pa.array(columns[3], type=pa.float64()),
+                          "Calls": pa.array(columns[4], type=pa.int64()),
+                          "Agents": pa.array(columns[5], type=pa.int64())})
+        pq.write_table(table, self._path("PhaseTiming", simid), compression=self.compression)
+
+    def commit(self):
+        """
+        Close the files of the current chunk, which makes them readable
+        """
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = dict()
+        self.chunk = None
+
+    def flush(self):
+        self.commit()
+
+    def close(self):
+        self.commit()
+
+
+def read_parquet_table(root, table, filters=None, columns=None):
+    """
+    Read a table of a ParquetWriter dataset as a DataFrame
+
+    :param root: directory of the dataset
+    :param table: AgtBank, AgtSaver, AgtLoan, AgtIbLoan, Simulation or PhaseTiming
+    :param filters: pyarrow.dataset expression or DNF list, e.g. [("SimId", "=", 1), ("StepCnt", "<", 20)],
+                    evaluated on partitions and row-group statistics before rows are read
+    :param columns: columns to read, all by default
+    """
+    keys = [("SimId", pa.int64())] if table in ("Simulation", "PhaseTiming") else [("SimId", pa.int64()), ("StepChunk", pa.int64())]
+    # explicit key types, inference reads simulation ids beyond int32 as strings
+    partitioning = ds.partitioning(pa.schema(keys), flavor="hive")
+    dataset = ds.dataset(os.path.join(root, table), format="parquet", partitioning=partitioning)
+    if isinstance(filters, list):
+        # public from pyarrow 10, the pyarrow 6 of Python 3.6 only has the private name
+        filters_to_expression = getattr(pq, "filters_to_expression", None) or pq._filters_to_expression
+        filters = filters_to_expression(filters)
+    return dataset.to_table(columns=columns, filter=filters).to_pandas()
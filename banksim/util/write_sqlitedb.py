@@ -1,9 +1,20 @@
 import os
+import queue
 import sqlite3
 import zipfile
+import threading
+import itertools
 import configparser
 from datetime import datetime,timezone
 
+import numpy as np
+
+from banksim.agent.ibloanbook import IbloanBook
+from banksim.agent.loanbook import LoanBook
+from banksim.agent.saverpool import SaverPool
+from banksim.db.base_handler import ResultSink
+from banksim.db.sqlitedb.sqlite_handler import SQLiteHandler
+
 
 def insert_simulation_table(cursor, task):
     """
@@ -18,30 +29,223 @@ def insert_simulation_table(cursor, task):
     return cursor.lastrowid
 
 
-def insert_agtbank_table(cursor, simid, numstep, banks):
+# columns of the agent tables in banksim_sqlite.sql, in the order of the agents' get_all_variables
+AGTBANK_FIELDS = ("AgtBankId", "SimId", "StepCnt", "BankId", "BankEquity", "BankDeposit", "BankLoan", "BankReserve",
+                  "BankAsset", "BankProvision", "BankNProvision", "BankDepositRate", "BankIbCredit", "BankIbDebit",
+                  "BankNetInterestIncome", "BankInterestIncome", "BankInterestExpense", "BankIbInterestIncome",
+                  "BankIbInterestExpense", "BankIbNetInterestIncome", "BankIbCreditLoss", "BankRiskWgtAsset",
+                  "BankDividend", "BankCumDividend", "BankDepositOutflow", "BankDepositInflow", "BankNetDepositflow",
+                  "BankDefaultedLoan", "BankSolvent", "BankCapitalized", "BankCreditFailure", "BankLiquidityFailure",
+                  "BankStepDate")
+AGTSAVER_FIELDS = ("AgtSaverId", "SimId", "StepCnt", "SaverId", "SaverBalance", "SaverWithdrawProb", "SaverExitProb",
+                   "SaverBankId", "SaverRegionId", "SaverOwnAccount", "SaverSolvent", "SaverExit", "SaverCurrent",
+                   "SaverStepDate")
+AGTLOAN_FIELDS = ("AgtLoanId", "SimId", "StepCnt", "LoanId", "LoanProbDefault", "LoanAmount", "LoanRiskWgt",
+                  "LoanRiskWgtAmt", "LoanLgdAmt", "LoanRecovery", "LoanRcvryRate", "LoanFireSaleLoss", "LoanRating",
+                  "LoanRateQuote", "LoanRateReservation", "LoanPlusRate", "LoanInterestPymt", "LoanRegionId",
+                  "LoanApproved", "LoanSolvent", "LoanDumped", "LoanLiquidated", "LoanBankId", "LoanStepDate")
+AGTIBLOAN_FIELDS = ("AgtIbLoanId", "SimId", "StepCnt", "IbLoanId", "IbLoanRate", "IbLoanAmount", "IbLoanCreditor",
+                    "IbLoanDebtor", "IbLoanStepDate")
+
+
+def _insert_sql(table, fields):
+    return "INSERT INTO {}({}) VALUES({})".format(table, ",".join(fields), ",".join("?" * len(fields)))
+
+
+AGTBANK_SQL = _insert_sql("AgtBank", AGTBANK_FIELDS)
+AGTSAVER_SQL = _insert_sql("AgtSaver", AGTSAVER_FIELDS)
+AGTLOAN_SQL = _insert_sql("AgtLoan", AGTLOAN_FIELDS)
+AGTIBLOAN_SQL = _insert_sql("AgtIbLoan", AGTIBLOAN_FIELDS)
+PHASETIMING_FIELDS = ("SimId", "StepCnt", "Phase", "Seconds", "Calls", "Agents")
+# PhaseTiming of banksim_sqlite.sql, for databases initialized before the table existed
+PHASETIMING_DDL = """CREATE TABLE IF NOT EXISTS [PhaseTiming] ([SimId] INTEGER NOT NULL, [StepCnt] INTEGER NOT NULL,
+    [Phase] NVARCHAR(50) NOT NULL, [Seconds] REAL NOT NULL, [Calls] INTEGER NOT NULL, [Agents] INTEGER NOT NULL,
+    CONSTRAINT [PK_PhaseTiming] PRIMARY KEY ([SimId],[StepCnt],[Phase]))"""
+
+# PRAGMAs for bulk loading: write-ahead log, fsync only at checkpoints, 64 MB page cache
+BULK_LOAD_PRAGMAS = ("PRAGMA journal_mode=WAL",
+                     "PRAGMA synchronous=NORMAL",
+                     "PRAGMA cache_size=-65536",
+                     "PRAGMA temp_store=MEMORY")
+
+
+# columns of the agent stores that the row builders read
+SAVER_COLUMNS = ("unique_id", "balance", "withdraw_prob", "exit_prob", "bank_id", "owns_account", "saver_solvent",
+                 "saver_exit")
+LOAN_COLUMNS = ("unique_id", "pdef", "amount", "rweight", "rwamount", "lgdamount", "loan_recovery", "rcvry_rate",
+                "fire_sale_loss", "rate_quote", "loan_plus_rate", "interest_payment", "loan_approved", "loan_solvent",
+                "loan_dumped", "loan_liquidated", "bank_id")
+IBLOAN_COLUMNS = ("unique_id", "rate", "amount", "creditor", "debtor")
+
+
+class WriterError(Exception):
     """
+    Failure of a background writer, raised in the simulation thread
+    """
+    pass
 
-    :param cursor:
-    :param banks:
-    :return:
+
+class ColumnSnapshot:
+    """
+    Copies of the columns of a SaverPool, LoanBook or IbloanBook
+
+    The row builders accept a snapshot in place of the store, so a step can be written while the model
+    already changes the store in the next step.
+    """
+
+    def __init__(self, store, columns):
+        self.size = len(store)
+        for name in columns:
+            setattr(self, name, getattr(store, name).copy())
+        self.banks = getattr(store, "banks", None)
+
+    def __len__(self):
+        return self.size
+
+
+def agent_row_id(numstep, unique_id):
+    """
+    Primary key of an agent row, the digits of 10000 + numstep followed by the digits of 10000 + unique_id
+
+    Same value as int(str(10000 + numstep) + str(10000 + unique_id)), computed with integer arithmetic.
+    unique_id may be an int or an integer array.
     """
+    agent = np.asarray(unique_id, dtype=np.int64) + 10000
+    shift = np.full(agent.shape, 10, dtype=np.int64)
+    for digits in range(2, 19):
+        shift[agent >= 10 ** (digits - 1)] = 10 ** digits
+    res = (10000 + numstep) * shift + agent
+    return int(res) if res.ndim == 0 else res
 
-    sql = '''INSERT INTO AgtBank(AgtBankId,SimId,StepCnt,BankId,BankEquity,BankDeposit,BankLoan,BankReserve,BankAsset,
-    BankProvision,BankNProvision,BankDepositRate,BankIbCredit,BankIbDebit,BankNetInterestIncome,BankInterestIncome,
-    BankInterestExpense,BankIbInterestIncome,BankIbInterestExpense,BankIbNetInterestIncome,BankIbCreditLoss,
-    BankRiskWgtAsset,BankDividend,BankCumDividend,BankDepositOutflow,BankDepositInflow,BankNetDepositflow,
-    BankDefaultedLoan,BankSolvent,BankCapitalized,BankCreditFailure,BankLiquidityFailure,BankStepDate) VALUES(
-    ?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'''
-    col_date = datetime.now(timezone.utc)
 
+def _step_date():
+    # the text sqlite3 stores for a datetime parameter, formatted once per step instead of once per row
+    return datetime.now(timezone.utc).isoformat(" ")
+
+
+def bank_rows(simid, numstep, banks, col_date=None):
+    """
+    AgtBank rows of a step as a list of tuples
+    """
+    col_date = _step_date() if col_date is None else col_date
+    res = list()
     for bank in banks:
         bank_vars = bank.get_all_variables()
-        bank_vars[0] = int(str(10000+numstep)+str(10000+bank_vars[3])) # AgtBankId
+        bank_vars[0] = agent_row_id(numstep, bank_vars[3])  # AgtBankId
         bank_vars[1] = simid
         bank_vars[2] = numstep
         bank_vars[32] = col_date
-        cursor.execute(sql, tuple(bank_vars))
+        res.append(tuple(bank_vars))
+    return res
+
+
+def saver_rows(simid, numstep, saver_pool, col_date=None):
+    """
+    AgtSaver rows of a step, assembled column by column from a SaverPool
+    """
+    col_date = _step_date() if col_date is None else col_date
+    size = len(saver_pool)
+    return list(zip(agent_row_id(numstep, saver_pool.unique_id).tolist(),
+                    itertools.repeat(simid, size),
+                    itertools.repeat(numstep, size),
+                    saver_pool.unique_id.tolist(),
+                    saver_pool.balance.tolist(),
+                    saver_pool.withdraw_prob.tolist(),
+                    saver_pool.exit_prob.tolist(),
+                    saver_pool.bank_id.tolist(),
+                    itertools.repeat(None, size),  # SaverRegionId
+                    saver_pool.owns_account.astype(np.int64).tolist(),
+                    saver_pool.saver_solvent.astype(np.int64).tolist(),
+                    saver_pool.saver_exit.astype(np.int64).tolist(),
+                    itertools.repeat(None, size),  # SaverCurrent
+                    itertools.repeat(col_date, size)))
+
+
+def loan_rows(simid, numstep, loan_book, col_date=None):
+    """
+    AgtLoan rows of a step, assembled column by column from a LoanBook
+    """
+    col_date = _step_date() if col_date is None else col_date
+    size = len(loan_book)
+    return list(zip(agent_row_id(numstep, loan_book.unique_id).tolist(),
+                    itertools.repeat(simid, size),
+                    itertools.repeat(numstep, size),
+                    loan_book.unique_id.tolist(),
+                    loan_book.pdef.tolist(),
+                    loan_book.amount.tolist(),
+                    loan_book.rweight.tolist(),
+                    loan_book.rwamount.tolist(),
+                    loan_book.lgdamount.tolist(),
+                    loan_book.loan_recovery.tolist(),
+                    loan_book.rcvry_rate.tolist(),
+                    loan_book.fire_sale_loss.tolist(),
+                    itertools.repeat(None, size),  # LoanRating
+                    loan_book.rate_quote.tolist(),
+                    itertools.repeat(None, size),  # LoanRateReservation
+                    loan_book.loan_plus_rate.tolist(),
+                    loan_book.interest_payment.tolist(),
+                    itertools.repeat(None, size),  # LoanRegionId
+                    loan_book.loan_approved.astype(np.int64).tolist(),
+                    loan_book.loan_solvent.astype(np.int64).tolist(),
+                    loan_book.loan_dumped.astype(np.int64).tolist(),
+                    loan_book.loan_liquidated.astype(np.int64).tolist(),
+                    loan_book.bank_id.tolist(),
+                    itertools.repeat(col_date, size)))
+
+
+def step_snapshot(simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None, write_agents=False):
+    """
+    State of one step to be written later: the bank rows and, with write_agents, copies of the agent columns
+    """
+    col_date = _step_date()
+    res = {"simid": simid, "numstep": numstep, "col_date": col_date,
+           "banks": bank_rows(simid, numstep, banks, col_date)}
+    if write_agents:
+        for name, store, columns in (("savers", saver_pool, SAVER_COLUMNS), ("loans", loan_book, LOAN_COLUMNS),
+                                     ("ibloans", ibloan_book, IBLOAN_COLUMNS)):
+            if store is not None:
+                res[name] = ColumnSnapshot(store, columns)
+    return res
+
+
+def ibloan_rows(simid, numstep, ibloan_book, col_date=None):
+    """
+    AgtIbLoan rows of a step, assembled column by column from an IbloanBook
+    """
+    col_date = _step_date() if col_date is None else col_date
+    size = len(ibloan_book)
+    bank_unique_id = np.array([x.unique_id for x in ibloan_book.banks], dtype=np.int64)
+    return list(zip(agent_row_id(numstep, ibloan_book.unique_id).tolist(),
+                    itertools.repeat(simid, size),
+                    itertools.repeat(numstep, size),
+                    ibloan_book.unique_id.tolist(),
+                    ibloan_book.rate.tolist(),
+                    ibloan_book.amount.tolist(),
+                    bank_unique_id[ibloan_book.creditor].tolist(),
+                    bank_unique_id[ibloan_book.debtor].tolist(),
+                    itertools.repeat(col_date, size)))
 
+
+def _agent_rows(simid, numstep, agents, col_date):
+    res = list()
+    for agent in agents:
+        agent_vars = agent.get_all_variables()
+        agent_vars[0] = agent_row_id(numstep, agent_vars[3])
+        agent_vars[1] = simid
+        agent_vars[2] = numstep
+        agent_vars[-1] = col_date
+        res.append(tuple(agent_vars))
+    return res
+
+
+def insert_agtbank_table(cursor, simid, numstep, banks):
+    """
+
+    :param cursor:
+    :param banks:
+    :return:
+    """
+    cursor.executemany(AGTBANK_SQL, bank_rows(simid, numstep, banks))
     return cursor.lastrowid
 
 
@@ -51,21 +255,14 @@ def insert_agtsaver_table(cursor, simid, numstep, savers):
     :param cursor:
     :param simid:
     :param numstep:
-    :param savers:
+    :param savers: SaverPool or iterable of Saver
     :return:
     """
-    sql = '''INSERT INTO AgtSaver(AgtSaverId,SimId,StepCnt,SaverId,SaverBalance,SaverWithdrawProb,SaverExitProb,SaverBankId,
-    SaverRegionId,SaverOwnAccount,SaverSolvent,SaverExit,SaverCurrent,SaverStepDate) Values(?,?,?,?,?,?,?,?,?,?,?,?,?,?)'''
-
-    col_date = datetime.now(timezone.utc)
-    for saver in savers:
-        saver_vars = saver.get_all_variables()
-        saver_vars[0] = int(str(10000+numstep)+str(10000+saver_vars[3])) # AgtSaverId
-        saver_vars[1] = simid
-        saver_vars[2] = numstep
-        saver_vars[13] = col_date
-        cursor.execute(sql,tuple(saver_vars))
-
+    if isinstance(savers, SaverPool):
+        rows = saver_rows(simid, numstep, savers)
+    else:
+        rows = _agent_rows(simid, numstep, savers, _step_date())
+    cursor.executemany(AGTSAVER_SQL, rows)
     return cursor.lastrowid
 
 
@@ -75,24 +272,14 @@ def insert_agtloan_table(cursor, simid, numstep, loans):
     :param cursor:
     :param simid:
     :param numstep:
-    :param loans:
+    :param loans: LoanBook or iterable of Loan
     :return:
     """
-
-    sql = '''INSERT INTO AgtLoan(AgtLoanId,SimId,StepCnt,LoanId,LoanProbDefault,LoanAmount,LoanRiskWgt,LoanRiskWgtAmt,
-    LoanLgdAmt,LoanRecovery,LoanRcvryRate,LoanFireSaleLoss,LoanRating,LoanRateQuote,LoanRateReservation,LoanPlusRate,
-    LoanInterestPymt,LoanRegionId,LoanApproved,LoanSolvent,LoanDumped,LoanLiquidated,LoanBankId,LoanStepDate) 
-    Values(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'''
-
-    col_date = datetime.now(timezone.utc)
-    for loan in loans:
-        loan_vars = loan.get_all_variables()
-        loan_vars[0] = int(str(10000 + numstep) + str(10000 + loan_vars[3]))  # AgtloanId
-        loan_vars[1] = simid
-        loan_vars[2] = numstep
-        loan_vars[-1] = col_date
-        cursor.execute(sql, tuple(loan_vars))
-
+    if isinstance(loans, LoanBook):
+        rows = loan_rows(simid, numstep, loans)
+    else:
+        rows = _agent_rows(simid, numstep, loans, _step_date())
+    cursor.executemany(AGTLOAN_SQL, rows)
     return cursor.lastrowid
 
 
@@ -102,23 +289,161 @@ def insert_agtibloan_table(cursor, simid, numstep, ibloans):
     :param cursor:
     :param simid:
     :param numstep:
-    :param ibloans:
+    :param ibloans: IbloanBook or iterable of Ibloan
     :return:
     """
+    if isinstance(ibloans, IbloanBook):
+        rows = ibloan_rows(simid, numstep, ibloans)
+    else:
+        rows = _agent_rows(simid, numstep, ibloans, _step_date())
+    cursor.executemany(AGTIBLOAN_SQL, rows)
+    return cursor.lastrowid
 
-    sql = '''INSERT INTO AgtIbLoan(AgtIbLoanId,SimId,StepCnt,IbLoanId,IbLoanRate,IbLoanAmount,IbLoanCreditor,
-    IbLoanDebtor,IbLoanStepDate) Values(?,?,?,?,?,?,?,?,?)'''
 
-    col_date = datetime.now(timezone.utc)
-    for loan in ibloans:
-        loan_vars = loan.get_all_variables()
-        loan_vars[0] = int(str(10000 + numstep) + str(10000 + loan_vars[3]))  # AgtloanId
-        loan_vars[1] = simid
-        loan_vars[2] = numstep
-        loan_vars[-1] = col_date
-        cursor.execute(sql, tuple(loan_vars))
+class SQLiteWriter(ResultSink):
+    """
+    Bulk writer of agent states into the SQLite result database, the sqlite result sink
 
-    return cursor.lastrowid
+    Rows of a step are assembled as tuples and inserted with one executemany per table through a
+    SQLiteHandler. The connection is tuned for bulk loading by BULK_LOAD_PRAGMAS and commits once every
+    commit_every steps; close() commits the rest.
+    """
+
+    background = True
+
+    def __init__(self, sqlite_db, commit_every=10, write_agents=False):
+        """
+        :param sqlite_db: path of the SQLite database, initialized by init_database
+        :param commit_every: number of steps written per transaction
+        :param write_agents: False: bank rows only, True: saver, loan and interbank loan rows as well
+        """
+        # the connection may be handed to a BackgroundWriter thread, which is then its only user
+        self.handler = SQLiteHandler(sqlite_db, pragmas=BULK_LOAD_PRAGMAS, check_same_thread=False)
+        self.conn = self.handler.conn
+        self.commit_every = commit_every
+        self.write_agents = write_agents
+        self.pending_steps = 0
+
+    def open(self, simid, title, simdate):
+        self.insert_simulation((simid, title, simdate))
+
+    def insert_simulation(self, task):
+        res = insert_simulation_table(self.handler.cursor, task)
+        self.handler.commit()
+        return res
+
+    def snapshot(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        return step_snapshot(simid, numstep, banks, saver_pool, loan_book, ibloan_book, self.write_agents)
+
+    def write_step(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        """
+        Insert the agent rows of one step, committing when commit_every steps are pending
+        """
+        col_date = _step_date()
+        self.write_snapshot({"simid": simid, "numstep": numstep, "col_date": col_date,
+                             "banks": bank_rows(simid, numstep, banks, col_date),
+                             "savers": saver_pool, "loans": loan_book, "ibloans": ibloan_book})
+
+    def write_snapshot(self, snapshot):
+        simid, numstep, col_date = snapshot["simid"], snapshot["numstep"], snapshot["col_date"]
+        self.insert_rows("AgtBank", AGTBANK_FIELDS, snapshot["banks"])
+        if self.write_agents:
+            for name, table, fields, rows in (("savers", "AgtSaver", AGTSAVER_FIELDS, saver_rows),
+                                              ("loans", "AgtLoan", AGTLOAN_FIELDS, loan_rows),
+                                              ("ibloans", "AgtIbLoan", AGTIBLOAN_FIELDS, ibloan_rows)):
+                if snapshot.get(name) is not None:
+                    self.insert_rows(table, fields, rows(simid, numstep, snapshot[name], col_date))
+        self.pending_steps += 1
+        if self.pending_steps >= self.commit_every:
+            self.commit()
+
+    def write_timings(self, simid, rows):
+        self.handler.execute(PHASETIMING_DDL)
+        self.insert_rows("PhaseTiming", PHASETIMING_FIELDS, rows)
+        self.commit()
+
+    def commit(self):
+        self.handler.commit()
+        self.pending_steps = 0
+
+    def flush(self):
+        self.commit()
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.handler.close()
+        self.pending_steps = 0
+        self.conn = None
+
+
+class BackgroundWriter(ResultSink):
+    """
+    Runs the writes of a result sink, e.g. a SQLiteWriter, on a dedicated thread
+
+    write_step takes a snapshot of the step and puts it on a bounded queue, so the simulation carries on
+    while the thread drains the queue into the sink. When max_pending snapshots are waiting, write_step
+    blocks until the thread catches up. A failure of the thread is raised as WriterError by the next
+    write_step, flush or close; later snapshots are discarded. close() writes everything still queued and
+    closes the sink, also after a failure, before it raises the first error of the thread.
+    """
+
+    def __init__(self, writer, max_pending=4):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._drain, name="banksim-db-writer", daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    # closed after a failure too, so the connection and its WAL files are released
+                    self.writer.close()
+                    return
+                if self.error is None:
+                    method, args = task
+                    getattr(self.writer, method)(*args)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _check(self):
+        if self.error is not None:
+            raise WriterError("DB writer failed: {}".format(self.error)) from self.error
+
+    def _put(self, method, *args):
+        self._check()
+        if not self.thread.is_alive():
+            raise WriterError("DB writer is closed")
+        self.queue.put((method, args))
+
+    def open(self, simid, title, simdate):
+        self._put("open", simid, title, simdate)
+
+    def write_step(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        self._put("write_snapshot", self.writer.snapshot(simid, numstep, banks, saver_pool, loan_book, ibloan_book))
+
+    def write_timings(self, simid, rows):
+        self._put("write_timings", simid, rows)
+
+    def flush(self):
+        """
+        Wait until every queued step is written and flushed by the sink
+        """
+        self._put("flush")
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._check()
 
 
 def init_database():
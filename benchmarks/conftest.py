@@ -0,0 +1,56 @@
+"""
+Fixtures of the benchmark suite
+
+The suite needs pytest-benchmark and runs apart from the unit tests:
+
+    python -m pytest benchmarks --benchmark-autosave
+    python -m pytest benchmarks -k agents1e4 --benchmark-json=bench.json
+"""
+import pytest
+
+from banksim.model import BankSim
+
+AGENTS = (10 ** 4, 10 ** 5, 10 ** 6)  # savers and loans, one third savers as in the default model
+BANKS = (10, 100, 1000)
+SEED = 1
+
+
+def scale_id(scale):
+    agents, banks = scale
+    return "agents1e{}-banks{}".format(len(str(agents)) - 1, banks)
+
+
+def model_params(agents, banks):
+    return {"init_db": False,
+            "write_db": False,
+            "max_steps": 10,
+            "initial_saver": agents // 3,
+            "initial_bank": banks,
+            "initial_loan": agents - agents // 3,
+            "initial_equity": 100,
+            "rfree": 0.01,
+            "car": 0.08,
+            "min_reserves_ratio": 0.03,
+            "seed": SEED
+            }
+
+
+@pytest.fixture(params=[(x, y) for x in AGENTS for y in BANKS], ids=scale_id)
+def scale(request):
+    return request.param
+
+
+@pytest.fixture
+def make_model(scale):
+    """
+    Factory of models of the scale: stepped=False gives the agents of step 0 before f1, stepped=True the state
+    after one full step
+    """
+    def make(stepped=True):
+        model = BankSim(**model_params(*scale))
+        if stepped:
+            model.step()
+        else:
+            model.create_agents()
+        return model
+    return make
@@ -0,0 +1,61 @@
+"""
+Scaling exponents of a pytest-benchmark result of the benchmark suite
+
+For every phase the median time is fitted as time ~ agents^a at each number of banks, and as time ~ banks^b
+at each number of agents. An exponent near 1 is linear scaling, near 2 quadratic.
+
+    python benchmarks/scaling.py bench.json --max-exponent 1.5
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def load_benchmarks(path):
+    """
+    Median seconds per phase, agents and banks of a pytest-benchmark JSON file
+    """
+    with open(path) as fin:
+        data = json.load(fin)
+    return pd.DataFrame([{"phase": x["extra_info"]["phase"], "agents": x["extra_info"]["agents"],
+                          "banks": x["extra_info"]["banks"], "median": x["stats"]["median"]}
+                         for x in data["benchmarks"]])
+
+
+def scaling_exponents(df):
+    """
+    Least-squares slope of log median time against log agents and against log banks
+
+    :param df: frame of load_benchmarks
+    :return: DataFrame of phase, by (agents or banks), at (the fixed value of the other one), exponent
+    """
+    res = list()
+    for by, at in (("agents", "banks"), ("banks", "agents")):
+        for (phase, value), group in df.groupby(["phase", at]):
+            if group[by].nunique() < 2:
+                continue
+            slope = np.polyfit(np.log(group[by]), np.log(group["median"]), 1)[0]
+            res.append({"phase": phase, "by": by, "at": "{}={}".format(at, value), "exponent": slope})
+    return pd.DataFrame(res, columns=["phase", "by", "at", "exponent"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("json", help="result of --benchmark-json or --benchmark-autosave")
+    parser.add_argument("--max-exponent", type=float, default=None,
+                        help="exit with status 1 if an exponent exceeds this value")
+    args = parser.parse_args(argv)
+
+    res = scaling_exponents(load_benchmarks(args.json))
+    print(res.to_string(index=False, float_format="{:.2f}".format))
+    if args.max_exponent is not None and (res["exponent"] > args.max_exponent).any():
+        print("scaling exponent above {}".format(args.max_exponent))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Import time of banksim.model against a wall-clock budget
+
+The budget holds on an idle node; the unit suite only checks that the heavy dependencies are imported lazily
+(tests/test_import.py).
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+# cumulative microseconds of `import banksim.model` reported by python -X importtime, best of RUNS
+IMPORT_BUDGET = 200000
+RUNS = 5
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module):
+    """
+    Cumulative microseconds of the import of module, parsed from the python -X importtime report
+    """
+    # a fresh interpreter outside of the repository, which finds banksim through PYTHONPATH only
+    with tempfile.TemporaryDirectory() as tmp:
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd=tmp,
+                             env=dict(os.environ, PYTHONPATH=ROOT), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    for line in res.stderr.splitlines():
+        fields = [x.strip() for x in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise Exception("{} is not in the importtime report".format(module))
+
+
+def test_import_budget():
+    best = min(import_time("banksim.model") for _ in range(RUNS))
+    assert best <= IMPORT_BUDGET, "import banksim.model took {} us".format(best)
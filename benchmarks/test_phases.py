@@ -0,0 +1,87 @@
+"""
+Benchmarks of f1 initialization, the phases f2 to f7 of a step and the SQLite write
+
+Every round times one call on a fresh model of the scale built by setup, so rounds see the same state.
+"""
+import pytest
+
+from banksim.bankingsystem.f1_init_market import initialize_deposit_base, initialize_loan_book
+from banksim.bankingsystem.f2_eval_solvency import main_evaluate_solvency
+from banksim.bankingsystem.f3_second_round_effect import main_second_round_effects
+from banksim.bankingsystem.f4_optimize_risk_weight import main_risk_weight_optimization
+from banksim.bankingsystem.f5_pay_dividends import main_pay_dividends
+from banksim.bankingsystem.f6_expand_loan_book import (main_reset_insolvent_loans, main_build_loan_book_locally,
+                                                       main_build_loan_book_globally)
+from banksim.bankingsystem.f7_eval_liquidity import main_evaluate_liquidity
+from banksim.db.sqlitedb.shard import create_shard
+from banksim.util.write_sqlitedb import SQLiteWriter
+
+ROUNDS = 3
+
+
+def f1_init_market(model):
+    initialize_deposit_base(model)
+    initialize_loan_book(model, model.car, model.min_reserves_ratio)
+
+
+def f2_eval_solvency(model):
+    main_evaluate_solvency(model, model.reserve_rates, model.bankrupt_liquidation, model.car, model.rngs["solvency"])
+
+
+def f3_second_round_effect(model):
+    main_second_round_effects(model, model.bankrupt_liquidation, model.car, model.rngs["second_round"])
+
+
+def f4_optimize_risk_weight(model):
+    main_risk_weight_optimization(model, model.car, model.rngs["risk_weight"])
+
+
+def f5_pay_dividends(model):
+    main_pay_dividends(model, model.car, model.min_reserves_ratio)
+
+
+def f6_expand_loan_book(model):
+    main_reset_insolvent_loans(model)
+    main_build_loan_book_locally(model, model.min_reserves_ratio, model.car)
+    main_build_loan_book_globally(model, model.car, model.min_reserves_ratio, model.rngs["loan_market"])
+
+
+def f7_eval_liquidity(model):
+    main_evaluate_liquidity(model, model.car, model.min_reserves_ratio, model.bankrupt_liquidation,
+                            model.rngs["liquidity"])
+
+
+def _extra_info(benchmark, phase, scale):
+    # read by benchmarks/scaling.py
+    agents, banks = scale
+    benchmark.group = phase
+    benchmark.extra_info.update(phase=phase, agents=agents, banks=banks)
+
+
+@pytest.mark.parametrize("phase", [f1_init_market, f2_eval_solvency, f3_second_round_effect, f4_optimize_risk_weight,
+                                   f5_pay_dividends, f6_expand_loan_book, f7_eval_liquidity],
+                         ids=lambda x: x.__name__)
+def test_phase(benchmark, scale, make_model, phase):
+    stepped = phase is not f1_init_market
+
+    def setup():
+        return (make_model(stepped),), {}
+
+    benchmark.pedantic(phase, setup=setup, rounds=ROUNDS, iterations=1)
+    _extra_info(benchmark, phase.__name__, scale)
+
+
+def test_sqlite_write(benchmark, scale, make_model, tmp_path):
+    model = make_model()
+    shards = iter(range(ROUNDS + 1))
+
+    def setup():
+        sqlite_db = create_shard(str(tmp_path / "{}.sqlite".format(next(shards))))
+        return (SQLiteWriter(sqlite_db, write_agents=True),), {}
+
+    def write(writer):
+        writer.write_step(1, 0, model.banks, model.saver_pool, model.loan_book, model.ibloan_book)
+        writer.close()
+
+    benchmark.pedantic(write, setup=setup, rounds=ROUNDS, iterations=1)
+    _extra_info(benchmark, "sqlite_write", scale)
@@ -24,6 +24,8 @@ DROP TABLE IF EXISTS [AgtLoan];
 
 DROP TABLE IF EXISTS [AgtIbLoan];
 
+DROP TABLE IF EXISTS [PhaseTiming];
+
 
 /****************************************************************
 	Create Tables
@@ -143,3 +145,16 @@ CREATE TABLE [AgtIbLoan]
 	FOREIGN KEY ([SimId]) REFERENCES [Simulation] ([SimId])
 				ON DELETE NO ACTION ON UPDATE NO ACTION 
 );
+
+CREATE TABLE [PhaseTiming]
+(
+	[SimId] INTEGER NOT NULL,
+	[StepCnt] INTEGER NOT NULL,
+	[Phase] NVARCHAR(50) NOT NULL,	-- phase of BankSim.step
+	[Seconds] REAL NOT NULL,		-- wall time of the phase
+	[Calls] INTEGER NOT NULL,		-- number of calls of the phase
+	[Agents] INTEGER NOT NULL,		-- number of agents the phase went through
+	CONSTRAINT [PK_PhaseTiming] PRIMARY KEY ([SimId],[StepCnt],[Phase]),
+	FOREIGN KEY ([SimId]) REFERENCES [Simulation] ([SimId])
+				ON DELETE NO ACTION ON UPDATE NO ACTION 
+);
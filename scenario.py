@@ -1,10 +1,8 @@
 # coding: utf-8
 
-import itertools
-import concurrent.futures
-
 from banksim.logger import get_logger
 from banksim.model import BankSim
+from banksim.sweep import BASE_PARAMS, DEFAULT_GRID, run_sweep
 from banksim.util.write_sqlitedb import init_database
 from banksim.agent.bank import Bank
 
@@ -25,34 +23,13 @@ def main(rep_count=1):
 
     init_database()
 
-    for i in range(rep_count):
-        model_params = {"init_db": False,
-                        "write_db": True,
-                        "max_steps": 240,
-                        "initial_saver": 10000,
-                        "initial_bank": 10,
-                        "initial_loan": 20000,
-                        "initial_equity": 100,
-                        "rfree": 0.01
-                        }
-
-        lst_capital_req = [0.04, 0.08, 0.12, 0.16]
-        lst_reserve_ratio = [0.03, 0.045, 0.06]
-        combination_car_res = list(itertools.product(lst_capital_req, lst_reserve_ratio))
-
-        lst_model_params = list()
-        for x in combination_car_res:
-            model_params["car"] = x[0]
-            model_params["min_reserves_ratio"] = x[1]
-            lst_model_params.append(model_params.copy())
+    model_params = dict(BASE_PARAMS)
+    model_params["write_db"] = True
 
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            model_finish_cnt = 0
-            for res in executor.map(exec_banksim_model, lst_model_params):
-                if res:
-                    model_finish_cnt = model_finish_cnt + 1
-                    if model_finish_cnt % 10 == 0:
-                        logger.info('Number of completed scenario: %3d', model_finish_cnt)
+    # capital requirement x reserve ratio grid, rep_count replicas per point, on all cores
+    result = run_sweep(model_params, DEFAULT_GRID, replicas=rep_count, step_count=240)
+    logger.info('Number of completed scenario: %3d', result["run_id"].nunique() if len(result) else 0)
+    return result
 
 # Bank status
 # for x in [x for x in model.schedule.agents if isinstance(x, Bank)]:
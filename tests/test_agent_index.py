@@ -0,0 +1,97 @@
+"""
+Test for the per-bank agent index
+
+"""
+import sys
+import unittest
+
+from banksim.model import BankSim
+from banksim.agent.saverpool import UNASSIGNED_BANK_ID
+
+
+class TestAgentIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": False,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03,
+                        "seed": 3
+                        }
+        cls.model = BankSim(**cls.model_params)
+        for i in range(5):
+            cls.model.step()
+
+    def test_loans_match_view_scan(self):
+        agent_index = self.model.agent_index
+        for bank in agent_index.banks:
+            for approved in (True, False):
+                for solvent in (True, False):
+                    expected = [x.unique_id for x in self.model.loan_book if x.bank_id == bank.pos and
+                                x.loan_approved == approved and x.loan_solvent == solvent]
+                    rows = agent_index.loans(bank.pos, approved, solvent)
+                    self.assertEqual(self.model.loan_book.unique_id[rows].tolist(), expected)
+        self.assertEqual(len(agent_index.loans()), len(self.model.loan_book))
+
+    def test_savers_match_view_scan(self):
+        agent_index = self.model.agent_index
+        saver_pool = self.model.saver_pool
+        for bank in agent_index.banks:
+            expected = [x.unique_id for x in saver_pool if x.bank_id == bank.pos and x.owns_account]
+            self.assertEqual(saver_pool.unique_id[agent_index.savers(bank.pos, owns_account=True)].tolist(),
+                             expected)
+            expected = [x.unique_id for x in saver_pool if x.bank_id == bank.pos]
+            self.assertEqual(saver_pool.unique_id[agent_index.savers(bank.pos)].tolist(), expected)
+        expected = [x.unique_id for x in saver_pool if x.bank_id == UNASSIGNED_BANK_ID]
+        self.assertEqual(saver_pool.unique_id[agent_index.unassigned_savers()].tolist(), expected)
+
+    def test_members_follow_bookings(self):
+        model = BankSim(**dict(self.model_params, debug_aggregates=True))
+        model.step()
+        loan_book, saver_pool = model.loan_book, model.saver_pool
+        loans = model.agent_index.loans(0)
+        loan_book.liquidate(loans)
+        self.assertEqual(len(model.agent_index.loans(0)), 0)
+        loan_book.approve(loans[:3], 1)
+        self.assertTrue(set(loans[:3].tolist()) <= set(model.agent_index.loans(1, approved=True).tolist()))
+        savers = model.agent_index.savers(0)
+        saver_pool.withdraw(savers)
+        self.assertEqual(len(model.agent_index.savers(0)), 0)
+        self.assertEqual(model.agent_index.unassigned_savers()[-len(savers):].tolist(), savers.tolist())
+        saver_pool.open_account(savers, 2)
+        for store in (loan_book, saver_pool):
+            store.check_aggregates()
+            self.assertEqual([store.members_of(x).tolist() for x in range(store.n_banks)],
+                             [x.tolist() for x in store.recompute_members()])
+
+    def test_ibloans_match_view_scan(self):
+        agent_index = self.model.agent_index
+        ibloan_book = self.model.ibloan_book
+        start = len(ibloan_book)
+        for creditor, debtor in ((0, 1), (0, 2), (3, 1), (0, 1), (2, 0)):
+            ibloan_book.add(len(ibloan_book), creditor, debtor, 1.0, 0.01)
+        for bank in agent_index.banks:
+            expected = [x.unique_id for x in ibloan_book if x.ib_creditor is bank]
+            self.assertEqual(ibloan_book.unique_id[agent_index.ibloans(creditor=bank.pos)].tolist(), expected)
+            expected = [x.unique_id for x in ibloan_book if x.ib_debtor is bank]
+            self.assertEqual(ibloan_book.unique_id[agent_index.ibloans(debtor=bank.pos)].tolist(), expected)
+        self.assertEqual(len(agent_index.ibloans()), len(ibloan_book))
+        for x in ibloan_book:
+            rows = agent_index.ibloans(creditor=x.ib_creditor.pos, debtor=x.ib_debtor.pos)
+            expected = [y.unique_id for y in ibloan_book if y.ib_creditor is x.ib_creditor and
+                        y.ib_debtor is x.ib_debtor]
+            self.assertEqual(ibloan_book.unique_id[rows].tolist(), expected)
+        self.assertEqual(agent_index.ibloans(creditor=0, debtor=1).tolist(), [start, start + 3])
+        ibloan_book.clear()
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAgentIndex)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
@@ -0,0 +1,42 @@
+"""
+Test for the lazily imported dependencies of banksim.model
+
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# imported on first use only
+LAZY_MODULES = ("pandas", "networkx", "scipy", "mesa.datacollection", "pymongo", "pyarrow")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(*args, cwd=None):
+    """
+    Run a fresh interpreter that finds banksim through PYTHONPATH only, in cwd or an empty directory
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        # stdout and stderr pipes instead of capture_output and text, which need Python 3.7
+        return subprocess.run([sys.executable] + list(args), cwd=tmp if cwd is None else cwd, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+class TestImport(unittest.TestCase):
+
+    def test_lazy_modules(self):
+        res = run_python("-c", "import sys, banksim.model; print(' '.join(sys.modules))")
+        loaded = set(res.stdout.split())
+        self.assertEqual([x for x in LAZY_MODULES if x in loaded], [])
+
+    def test_no_log_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            run_python("-c", "import banksim.model", cwd=tmp)
+            self.assertEqual(os.listdir(tmp), [])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestImport)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
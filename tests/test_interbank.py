@@ -0,0 +1,120 @@
+"""
+Test for the interbank clearing engine
+
+"""
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+
+from banksim.model import BankSim
+from banksim.agent.ibloanbook import IbloanBook
+from banksim.bankingsystem import f3_second_round_effect
+from banksim.bankingsystem.f3_second_round_effect import InterbankExposures, main_second_round_effects
+
+
+class TestInterbank(unittest.TestCase):
+
+    def test_exposures(self):
+        creditor = np.array([0, 0, 1, 2, 0])
+        debtor = np.array([1, 2, 2, 0, 1])
+        amount = np.array([10.0, 5.0, 3.0, 4.0, 2.0])
+        rate = np.full(5, 0.01)
+        exposures = InterbankExposures(4, creditor, debtor, amount, rate)
+        self.assertEqual(exposures.principal[0, 1], 12.0)
+        self.assertEqual(exposures.principal_lent.tolist(), [17.0, 3.0, 4.0, 0.0])
+        self.assertEqual(exposures.principal_borrowed.tolist(), [4.0, 12.0, 8.0, 0.0])
+        self.assertEqual(sorted(exposures.creditors(2).tolist()), [0, 1])
+        self.assertEqual(exposures.creditors(3).tolist(), [])
+        income, loss = exposures.lent_to(0, np.array([True, False, True, True]))
+        self.assertAlmostEqual(income, 5.0 * 1.01)
+        self.assertAlmostEqual(loss, 12.0)
+
+    def test_ibloan_book(self):
+        banks = ["bank0", "bank1", "bank2"]
+        ibloan_book = IbloanBook(banks, capacity=2)
+        for i in range(5):
+            ibloan_book.add(100 + i, i % 3, (i + 1) % 3, float(i), 0.01)
+        self.assertEqual(len(ibloan_book), 5)
+        self.assertEqual(ibloan_book.amount.tolist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(ibloan_book.edges()[:2], [(0, 1), (1, 2)])
+        self.assertEqual([x.unique_id for x in ibloan_book], [100, 101, 102, 103, 104])
+        self.assertEqual(ibloan_book[2].ib_creditor, "bank2")
+        self.assertEqual(ibloan_book[2].ib_debtor, "bank0")
+        ibloan_book.clear()
+        self.assertEqual(len(ibloan_book), 0)
+        self.assertEqual(list(ibloan_book), [])
+
+    def test_clearing_converges(self):
+        model = BankSim(**{"init_db": False,
+                           "write_db": False,
+                           "max_steps": 10,
+                           "initial_saver": 1000,
+                           "initial_bank": 10,
+                           "initial_loan": 2000,
+                           "initial_equity": 100,
+                           "rfree": 0.01,
+                           "car": 0.08,
+                           "min_reserves_ratio": 0.03
+                           })
+        for i in range(5):
+            model.step()
+            self.assertTrue(model.ib_clearing_converged)
+            self.assertLessEqual(model.ib_clearing_iterations, model.initial_bank)
+
+    def test_clearing_cascade(self):
+        # A fails on its own repayment, its creditor B fails on the loss on A, and B's creditor C on the loss on B;
+        # D is exposed to both B and C and E only borrows, with all interbank rates at 0.25
+        model = BankSim(**{"init_db": False,
+                           "write_db": False,
+                           "max_steps": 10,
+                           "initial_saver": 30,
+                           "initial_bank": 5,
+                           "initial_loan": 60,
+                           "initial_equity": 100,
+                           "rfree": 0.01,
+                           "car": 0.08,
+                           "min_reserves_ratio": 0.03,
+                           "seed": 1
+                           })
+        model.create_agents()
+        c, b, a, d, e = model.banks  # positions 0 to 4, so creditors are settled before their debtors fail
+        for bank, equity, reserves in zip(model.banks, (20, 2, 100, 100, 100), (100, 100, 10, 100, 1000)):
+            bank.equity = equity
+            bank.bank_reserves = reserves
+            bank.bank_loans = 0
+            bank.bank_provisions = 0
+            bank.rwassets = 100
+        for i, (creditor, debtor, amount) in enumerate([(b, a, 40), (c, b, 40), (d, b, 8), (d, c, 8), (b, e, 100),
+                                                        (c, e, 20), (d, e, 40)]):
+            model.ibloan_book.add(i, creditor.pos, debtor.pos, float(amount), 0.25)
+
+        failed = list()  # position, equity and reserves of every bank as it fails, before its unwinding
+
+        def unwind(model, bankrupt_liquidation, bank, rng):
+            failed.append((bank.pos, bank.equity, bank.bank_reserves))
+            unwind_loans(model, bankrupt_liquidation, bank, rng)
+
+        unwind_loans = f3_second_round_effect.process_unwind_loans_insolvent_bank
+        with mock.patch.object(f3_second_round_effect, "process_unwind_loans_insolvent_bank", unwind):
+            iterations, converged = main_second_round_effects(model, 1, model.car, model.rngs["second_round"])
+
+        self.assertTrue(converged)
+        # A and B fail in the first two iterations, C and D are re-settled in the third, D once more in the fourth
+        self.assertEqual(iterations, 4)
+        # A: -10 interest on 40 borrowed; B: +35 interest lent -40 lost on A; C: +15 interest lent -40 lost on B
+        self.assertEqual(failed, [(a.pos, 90.0, -40.0), (b.pos, -3.0, 235.0), (c.pos, -5.0, 135.0)])
+        self.assertEqual([x.bank_solvent for x in model.banks], [False, False, False, True, True])
+        # D books +14 interest lent and loses 8 on B and 8 on C once, although it is re-settled after each failure
+        self.assertEqual(d.equity, 98.0)
+        self.assertEqual(d.bank_reserves, 154.0)
+        self.assertEqual([x.ib_credit_loss_4log for x in model.banks], [40.0, 40.0, 0.0, 16.0, 0.0])
+        # E repays 160 borrowed and 40 interest
+        self.assertEqual(e.equity, 60.0)
+        self.assertEqual(e.bank_reserves, 800.0)
+        self.assertEqual(len(model.ibloan_book), 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestInterbank)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
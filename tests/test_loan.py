@@ -4,10 +4,12 @@ Test for loan initialization
 """
 import sys
 import unittest
+from types import SimpleNamespace
 import numpy as np
 
 from banksim.model import BankSim
-from banksim.agent.loan import Loan
+from banksim.bankingsystem.f2_eval_solvency import draw_loan_defaults
+from banksim.bankingsystem.f6_expand_loan_book import LoanMarket
 
 
 class TestLoan(unittest.TestCase):
@@ -29,12 +31,69 @@ class TestLoan(unittest.TestCase):
 
     def test_loan(self):
         self.model.step()
-        loans = [x.bank_id for x in self.model.schedule.agents if isinstance(x, Loan)]
+        loans = [x.bank_id for x in self.model.loan_book]
         number_per_bank = [loans.count(x) for x in set(loans)]
         print(number_per_bank)
         # Numbers of loans per Banks should be similar
         self.assertEquals(np.sum(number_per_bank), self.model_params["initial_loan"])
 
+    def test_loan_book_groups(self):
+        model = BankSim(**self.model_params)
+        model.step()
+        loan_book = model.loan_book
+        for approved in (True, False):
+            mask = loan_book.mask(approved=approved, solvent=True)
+            loans_by_bank = loan_book.group_by_bank(mask)
+            for bank_id, loans in enumerate(loans_by_bank):
+                expected = [i for i in range(len(loan_book)) if mask[i] and loan_book.bank_id[i] == bank_id]
+                self.assertEqual(loans.tolist(), expected)
+                self.assertAlmostEqual(loan_book.bank_sum(loan_book.amount, mask)[bank_id], len(expected))
+
+    def test_draw_loan_defaults(self):
+        model = BankSim(**self.model_params)
+        model.step()
+        loan_book = model.loan_book
+        solvent_banks = [x for x in model.banks if x.bank_solvent]
+        before = loan_book.mask(approved=True, solvent=True)
+        credit_loss = draw_loan_defaults(model, solvent_banks, model.rngs["solvency"])
+        defaulted = before & ~loan_book.loan_solvent
+        for bank in solvent_banks:
+            in_bank = loan_book.bank_id == bank.pos
+            loans = [x for x in loan_book if x.loan_approved and x.loan_solvent and x.bank_id == bank.pos]
+            self.assertAlmostEqual(credit_loss["amount"][bank.pos], loan_book.amount[defaulted & in_bank].sum())
+            self.assertAlmostEqual(credit_loss["lgdamount"][bank.pos], loan_book.lgdamount[defaulted & in_bank].sum())
+            self.assertAlmostEqual(credit_loss["provisions"][bank.pos], sum([x.pdef * x.lgdamount for x in loans]))
+            self.assertAlmostEqual(credit_loss["interest_payment"][bank.pos],
+                                   sum([x.interest_payment for x in loans]))
+
+    def test_loan_market(self):
+        rng = np.random.default_rng(1)
+        pdef = rng.uniform(high=0.1, size=5000)
+        amount = rng.choice([1.0, 2.0, 5.0], size=5000)
+        loan_book = SimpleNamespace(amount=amount, rwamount=(0.5 + pdef * 5.0) * amount, pdef=pdef,
+                                    lgdamount=0.6 * amount)
+        provision = pdef * loan_book.lgdamount
+        loan_market = LoanMarket(loan_book, np.arange(5000))
+        offered = list(range(5000))
+        for start_equity in (100, 60):
+            # the scalar loop of main_build_loan_book_globally over the loans still on offer
+            equity, rwa, reserves, loans, provisions = start_equity, 400.0, 900.0, 300.0, 5.0
+            expected = list()
+            for i in offered:
+                a, rw, p = amount[i], loan_book.rwamount[i], provision[i]
+                if (equity - p) / (rwa + rw) > 0.08 and (reserves - p - a) / 1000.0 > 0.045:
+                    rwa, equity, reserves = rwa + rw, equity - p, reserves - a - p
+                    loans, provisions = loans + a, provisions + p
+                    expected.append(i)
+            offered = sorted(set(offered) - set(expected))
+            interim = {"equity": start_equity, "rwa": 400.0, "reserves": 900.0, "deposits": 1000.0,
+                       "loans": 300.0, "provisions": 5.0}
+            taken = loan_market.originate(interim, 0.08, 0.045, window=64)
+            self.assertEqual(taken.tolist(), expected)
+            self.assertEqual(len(loan_market), len(offered))
+            self.assertEqual((interim["equity"], interim["rwa"], interim["reserves"], interim["loans"],
+                              interim["provisions"]), (equity, rwa, reserves, loans, provisions))
+
 
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(TestLoan)
@@ -0,0 +1,91 @@
+"""
+Test for the memory profile and the memory budget per agent
+
+"""
+import sys
+import tracemalloc
+import unittest
+
+from banksim.model import BankSim
+from banksim.util.phase_timer import PhaseTimer
+
+# bytes held per agent after step 0, measured by tracemalloc
+AGENT_BUDGET = {"Bank": 768, "Saver": 64, "Loan": 160}
+# bytes the traced memory may grow by per step after step 0
+STEP_GROWTH_BUDGET = 64 * 1024
+
+
+class TestMemory(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": False,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03,
+                        "seed": 5
+                        }
+        cls.model = BankSim(profile_memory=True, **cls.model_params)
+        cls.model.run_model(step_count=4)
+
+    def test_agent_budget(self):
+        footprint = self.model.agent_footprint.set_index("agent")
+        self.assertEqual(footprint["count"].to_dict(), {"Bank": 10, "Saver": 1000, "Loan": 2000})
+        for agent, budget in AGENT_BUDGET.items():
+            self.assertLessEqual(footprint.loc[agent, "bytes_per_agent"], budget, agent)
+
+    def test_compact_agents(self):
+        bank = self.model.banks[0]
+        self.assertEqual(set(vars(bank)), {"unique_id", "model", "pos"})
+        self.assertEqual(len(bank.get_all_variables()), 33)
+        for view in (self.model.saver_pool[0], self.model.loan_book[0]):
+            self.assertFalse(hasattr(view, "__dict__"))
+
+    def test_step_growth(self):
+        by_step = self.model.timer.memory_by_step()
+        self.assertEqual(by_step.index.tolist(), [0, 1, 2, 3])
+        self.assertTrue((by_step["peak"] >= by_step["memory"]).all())
+        self.assertLessEqual(by_step["growth"].max(), STEP_GROWTH_BUDGET)
+
+    def test_peak_per_phase(self):
+        summary = self.model.timer.summary()
+        self.assertTrue((summary["peak"] > 0).all())
+        self.assertIn("peak", self.model.phase_timings)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_peak_without_reset(self):
+        # tracemalloc.reset_peak is new in Python 3.9
+        reset_peak = tracemalloc.reset_peak
+        del tracemalloc.reset_peak
+        try:
+            timer = PhaseTimer(memory=True)
+            timer.begin()
+            started = timer.start()
+            block = bytearray(1 << 20)
+            started = timer.lap(0, "allocate", started)
+            del block
+            timer.lap(0, "free", started)
+            timer.end()
+        finally:
+            tracemalloc.reset_peak = reset_peak
+        frame = timer.frame().set_index("phase")
+        self.assertGreaterEqual(frame.loc["allocate", "peak"], 1 << 20)
+        # the peak of the trace was reached in the first phase, the second one reports its traced bytes
+        self.assertEqual(frame.loc["free", "peak"], frame.loc["free", "memory"])
+
+    def test_disabled(self):
+        model = BankSim(**self.model_params)
+        model.run_model(step_count=1)
+        self.assertTrue(model.agent_footprint.empty)
+        self.assertNotIn("peak", model.phase_timings)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMemory)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
@@ -0,0 +1,144 @@
+"""
+Test for headless stepping and seeding
+
+"""
+import sys
+import unittest
+import numpy as np
+import pytest
+
+from banksim.model import BankSim
+from banksim.agent.ibloanbook import IbloanBook
+from banksim.util.write_agent_activity import (BANK_RATIO_COLUMNS, INTERBANK_LINK_COLUMNS, InterbankLinkRecorder,
+                                               convert_result2dataframe)
+
+
+class TestModel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": False,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03
+                        }
+
+    def test_headless_matches_scheduler(self):
+        models = [BankSim(seed=1, **self.model_params), BankSim(seed=1, headless=False, **self.model_params)]
+        for model in models:
+            for i in range(5):
+                model.step()
+        headless, scheduled = models
+        self.assertIsNone(headless.schedule)
+        self.assertEqual(headless.steps, 5)
+        self.assertEqual(scheduled.schedule.steps, 5)
+        self.assertEqual(scheduled.schedule.agents, scheduled.banks)
+        for a, b in zip(headless.banks, scheduled.banks):
+            self.assertEqual(a.get_all_variables()[3:], b.get_all_variables()[3:])
+
+    def test_seed_reproducible(self):
+        runs = [BankSim(seed=7, **self.model_params), BankSim(seed=7, **self.model_params),
+                BankSim(seed=7, replica=1, **self.model_params)]
+        for model in runs:
+            model.run_model(step_count=5)
+        first, second, replica = runs
+        self.assertEqual(first.seed, 7)
+        np.testing.assert_array_equal(first.bank_ratios.values, second.bank_ratios.values)
+        self.assertFalse(np.array_equal(first.bank_ratios.values, replica.bank_ratios.values))
+        np.testing.assert_array_equal(first.saver_pool.withdraw_prob, second.saver_pool.withdraw_prob)
+        self.assertEqual(first.random.random(), second.random.random())
+        self.assertIsNot(first.random, second.random)
+
+    def test_init_db_param(self):
+        # write_db alone must not re-initialize the result database
+        params = dict(self.model_params, write_db=True)
+        self.assertFalse(BankSim(**params).is_init_db)
+        self.assertTrue(BankSim(**dict(params, init_db=True)).is_init_db)
+        self.assertFalse(BankSim(**dict(params, write_db=False, init_db=False)).is_init_db)
+
+    def test_seed_drawn_when_missing(self):
+        model = BankSim(**self.model_params)
+        self.assertIsInstance(model.seed, int)
+        again = BankSim(seed=model.seed, **self.model_params)
+        np.testing.assert_array_equal(model.rngs["solvency"].random(10), again.rngs["solvency"].random(10))
+
+    def test_bank_ratio_recorder(self):
+        model = BankSim(record_interval=2, **dict(self.model_params, max_steps=4))
+        model.run_model(step_count=7)
+        recorder = model.bank_ratios
+        self.assertEqual(recorder.steps[:len(recorder)].tolist(), [0, 2, 4, 6])
+        self.assertEqual(recorder.values.shape, (4, len(model.banks), len(BANK_RATIO_COLUMNS)))
+        frame = recorder.frame()
+        self.assertEqual(list(frame.columns), list(BANK_RATIO_COLUMNS))
+        self.assertEqual(frame.index.names, ["step", "bank"])
+        self.assertTrue(np.shares_memory(frame.to_numpy(), recorder.data))
+        self.assertEqual(frame.loc[(2, 1), "equity"], recorder.values[1, 1, BANK_RATIO_COLUMNS.index("equity")])
+        self.assertTrue((frame["car"] == 0.08).all())
+
+    def test_bank_ratios_to_xarray(self):
+        xr = pytest.importorskip("xarray")
+        model = BankSim(**self.model_params)
+        model.run_model(step_count=3)
+        res = model.bank_ratios.to_xarray()
+        self.assertIsInstance(res, xr.DataArray)
+        self.assertEqual(res.dims, ("step", "bank", "metric"))
+        self.assertEqual(res.sizes["step"], 3)
+        self.assertEqual(float(res.sel(step=2, bank=1, metric="equity")),
+                         model.bank_ratios.values[2, 1, BANK_RATIO_COLUMNS.index("equity")])
+
+    def test_interbank_link_recorder(self):
+        model = BankSim(seed=2, **self.model_params)
+        expected = list()
+        for i in range(6):
+            model.step()
+            ibloan_book = model.ibloan_book
+            expected.extend(zip([i] * len(ibloan_book), ibloan_book.creditor.tolist(), ibloan_book.debtor.tolist(),
+                                ibloan_book.amount.tolist()))
+        links = model.ib_links
+        self.assertEqual(len(links), len(expected))
+        frame = links.frame()
+        self.assertEqual(list(frame.columns), list(INTERBANK_LINK_COLUMNS))
+        self.assertEqual(list(frame.itertuples(index=False, name=None)), expected)
+        # one slot per bank and step is preallocated, more loans grow the columns
+        self.assertGreaterEqual(len(links.columns["step"]), model.max_steps * model.initial_bank)
+        df_bank, df_ibloan = convert_result2dataframe(model.bank_ratios, links)
+        self.assertEqual(list(df_ibloan.columns), ["ibCreditor", "ibDebtor", "ibAmount"])
+        self.assertEqual(len(df_ibloan), len(expected))
+
+        ibloan_book = IbloanBook(["bank0", "bank1", "bank2"])
+        for i in range(5):
+            ibloan_book.add(i, i % 3, (i + 1) % 3, float(i), 0.01)
+        links = InterbankLinkRecorder(max_steps=1)
+        links.record(0, ibloan_book)
+        links.record(1, ibloan_book)
+        self.assertEqual(len(links.columns["step"]), 12)
+        self.assertEqual(links.frame()["step"].tolist(), [0] * 5 + [1] * 5)
+        self.assertEqual(links.frame()["ibAmount"].tolist(), [0.0, 1.0, 2.0, 3.0, 4.0] * 2)
+
+    def test_phase_timings(self):
+        self.assertTrue(BankSim(**self.model_params).phase_timings.empty)
+        model = BankSim(seed=1, time_phases=True, sink="memory", **dict(self.model_params, write_db=True))
+        model.run_model(step_count=3)
+        timings = model.phase_timings
+        self.assertEqual(list(timings.columns), ["step", "phase", "seconds", "calls", "agents"])
+        self.assertEqual(timings.loc[timings["step"] == 0, "phase"].iloc[0], "initialize")
+        self.assertEqual(len(timings[timings["phase"] == "write_results"]), 3)
+        self.assertTrue((timings["seconds"] >= 0).all())
+        self.assertEqual(timings.loc[timings["phase"] == "evaluate_liquidity", "agents"].tolist(), [1000] * 3)
+        summary = model.timer.summary()
+        self.assertEqual(summary.loc["evaluate_solvency", "calls"], 3)
+        self.assertAlmostEqual(summary["share"].sum(), 1)
+        stored = model.sink.frame("PhaseTiming")
+        self.assertEqual(len(stored), len(timings))
+        self.assertTrue((stored["SimId"] == model.simid).all())
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestModel)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
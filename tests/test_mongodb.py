@@ -0,0 +1,88 @@
+"""
+Test for the mongodb result sink, run against mongomock
+
+"""
+import sys
+import unittest
+from unittest import mock
+
+import mongomock
+
+from banksim.db.mongodb import mongodb_handler
+from banksim.db.mongodb.mongodb_handler import MongoDBHandler, close_clients, get_client
+from banksim.db.mongodb.mongodb_sink import MongoSink
+from banksim.model import BankSim
+
+
+class TestMongoDB(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": True,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03,
+                        "seed": 5
+                        }
+
+    def setUp(self):
+        patcher = mock.patch.object(mongodb_handler, "MongoClient", mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(close_clients)
+        close_clients()
+
+    def test_pooled_client(self):
+        first = MongoDBHandler(db_name="test", collection_name="Simulation")
+        second = MongoDBHandler(db_name="test", collection_name="AgtBank")
+        self.assertIs(first._client, second._client)
+        self.assertIs(first._client, get_client("mongodb://127.0.0.1:27017"))
+
+    def test_insert_batches(self):
+        handler = MongoDBHandler(db_name="test", collection_name="AgtBank")
+        with mock.patch.object(mongomock.collection.Collection, "insert_many",
+                               autospec=True, side_effect=mongomock.collection.Collection.insert_many) as insert:
+            count = handler.insert_batches([{"BankId": x} for x in range(2500)], batch_size=1000)
+        self.assertEqual(count, 2500)
+        self.assertEqual([len(x.args[1]) for x in insert.call_args_list], [1000, 1000, 500])
+        self.assertTrue(all(x.kwargs["ordered"] is False for x in insert.call_args_list))
+        self.assertEqual(handler._collection.count_documents({}), 2500)
+
+    def test_sink_buffers_steps(self):
+        model = BankSim(**dict(self.model_params, write_db=False))
+        model.step()
+        handler = MongoDBHandler(db_name="test", collection_name="Simulation")
+        sink = MongoSink(handler, batch_size=25)
+        sink.open(1, "test", "2020-01-01 00:00:00")
+        collection = handler._client["test"]["AgtBank"]
+        for step in range(2):
+            sink.write_step(1, step, model.banks)
+        self.assertEqual(collection.count_documents({}), 0)
+        sink.write_step(1, 2, model.banks)
+        self.assertEqual(collection.count_documents({}), 25)
+        self.assertEqual(len(sink.buffers["AgtBank"]), 5)
+        sink.close()
+        self.assertEqual(collection.count_documents({}), 30)
+        self.assertEqual(collection.count_documents({"StepCnt": 2}), 10)
+        self.assertIn("SimId_1_StepCnt_1_BankId_1", collection.index_information())
+
+    def test_model_writes_mongodb(self):
+        model = BankSim(sink="mongodb", write_agents=True, mongo_batch_size=500, **self.model_params)
+        model.run_model(step_count=3)
+        db = get_client("mongodb://127.0.0.1:27017")[model.mongo_db]
+        self.assertEqual(db["Simulation"].count_documents({"SimId": model.simid}), 1)
+        self.assertEqual(db["AgtBank"].count_documents({"SimId": model.simid}), 3 * len(model.banks))
+        self.assertEqual(db["AgtSaver"].count_documents({"SimId": model.simid}), 3 * len(model.saver_pool))
+        self.assertEqual(len(db["AgtLoan"].distinct("StepCnt")), 3)
+        self.assertIn("SimId_1_StepCnt_1_SaverBankId_1", db["AgtSaver"].index_information())
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMongoDB)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
@@ -0,0 +1,100 @@
+"""
+Test for the Parquet result writer
+
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from banksim.model import BankSim
+from banksim.util.write_parquet import ParquetWriter, read_parquet_table
+
+
+class TestParquet(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": False,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03,
+                        "seed": 5
+                        }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "result")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_steps(self):
+        model = BankSim(**self.model_params)
+        writer = ParquetWriter(self.root, step_chunk=2, write_agents=True, float32=True)
+        writer.insert_simulation((1, "test", "2020-01-01 09:30:00+09:00"))
+        for i in range(5):
+            model.step()
+            writer.write_step(1, i, model.banks, model.saver_pool, model.loan_book, model.ibloan_book)
+        writer.close()
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, "AgtLoan", "SimId=1"))),
+                         ["StepChunk=0", "StepChunk=1", "StepChunk=2"])
+        savers = read_parquet_table(self.root, "AgtSaver", filters=[("StepChunk", "=", 2)])
+        self.assertEqual(len(savers), 1000)
+        self.assertEqual(savers["SimId"].unique().tolist(), [1])
+        self.assertEqual(savers["SaverBalance"].dtype, np.float32)
+        np.testing.assert_array_equal(savers["SaverBankId"], model.saver_pool.bank_id)
+        np.testing.assert_array_equal(savers["SaverOwnAccount"], model.saver_pool.owns_account.astype(np.int8))
+        banks = read_parquet_table(self.root, "AgtBank", filters=[("StepCnt", ">=", 3)], columns=["StepCnt", "BankId"])
+        self.assertEqual(sorted(banks["StepCnt"].unique().tolist()), [3, 4])
+        self.assertEqual(banks["BankId"].tolist()[:10], [x.unique_id for x in model.banks])
+        simulation = read_parquet_table(self.root, "Simulation")
+        self.assertEqual(simulation["Title"].tolist(), ["test"])
+        self.assertEqual(str(simulation["SimDate"][0]), "2020-01-01 00:30:00+00:00")
+
+    def test_commit_keeps_chunk(self):
+        model = BankSim(**self.model_params)
+        writer = ParquetWriter(self.root, step_chunk=10)
+        for i in range(4):
+            model.step()
+            writer.write_step(1, i, model.banks)
+            writer.commit()
+        writer.close()
+        self.assertEqual(len(read_parquet_table(self.root, "AgtBank")), 4 * 10)
+
+    def test_writers_share_partition(self):
+        model = BankSim(**self.model_params)
+        model.step()
+        for i in range(2):
+            # e.g. two runs that got the same simulation id
+            writer = ParquetWriter(self.root, step_chunk=10)
+            writer.insert_simulation((1, "run {}".format(i), "2020-01-01 00:00:00+00:00"))
+            writer.write_step(1, 0, model.banks)
+            writer.close()
+        self.assertEqual(len(os.listdir(os.path.join(self.root, "AgtBank", "SimId=1", "StepChunk=0"))), 2)
+        self.assertEqual(len(read_parquet_table(self.root, "AgtBank")), 2 * 10)
+        self.assertEqual(sorted(read_parquet_table(self.root, "Simulation")["Title"]), ["run 0", "run 1"])
+
+    def test_model_writes_parquet(self):
+        params = dict(self.model_params, write_db=True, write_agents=True, sink="parquet", parquet_dir=self.root,
+                      commit_every=4)
+        model = BankSim(**params)
+        model.run_model(step_count=6)
+        loans = read_parquet_table(self.root, "AgtLoan", filters=[("SimId", "=", model.simid)])
+        self.assertEqual(len(loans), 6 * 2000)
+        last = loans[loans["StepCnt"] == 5].sort_values("LoanId")
+        np.testing.assert_array_equal(last["LoanApproved"], model.loan_book.loan_approved.astype(np.int8))
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestParquet)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
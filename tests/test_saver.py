@@ -0,0 +1,99 @@
+"""
+Test for the columnar saver population
+
+"""
+import sys
+import unittest
+import numpy as np
+
+from banksim.model import BankSim
+from banksim.agent.saverpool import UNASSIGNED_BANK_ID
+from banksim.bankingsystem.f7_eval_liquidity import process_deposit_withdrawal
+from banksim.bankingsystem.f7_eval_liquidity import process_deposit_reassignment
+
+
+class TestSaver(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": False,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03
+                        }
+        cls.model = BankSim(**cls.model_params)
+        for i in range(5):
+            cls.model.step()
+
+    def test_saver_pool_groups(self):
+        saver_pool = self.model.saver_pool
+        mask = saver_pool.mask(owns_account=True)
+        for bank_id, savers in enumerate(saver_pool.group_by_bank(mask)):
+            expected = [x.unique_id for x in saver_pool if x.owns_account and x.bank_id == bank_id]
+            self.assertEqual(saver_pool.unique_id[savers].tolist(), expected)
+            self.assertEqual(saver_pool.bank_members(bank_id, owns_account=True).tolist(), savers.tolist())
+
+    def test_deposit_flows(self):
+        model = BankSim(**self.model_params)
+        model.step()
+        saver_pool = model.saver_pool
+        solvent_banks = [x for x in model.banks if x.bank_solvent]
+        for bank in solvent_banks:
+            bank.deposit_outflow = 0
+        process_deposit_withdrawal(model, model.rngs["liquidity"])
+        withdrawn = saver_pool.bank_id == UNASSIGNED_BANK_ID
+        self.assertAlmostEqual(sum([x.deposit_outflow for x in solvent_banks]), saver_pool.balance[withdrawn].sum())
+        self.assertFalse(saver_pool.owns_account[withdrawn].any())
+
+        process_deposit_reassignment(model, model.rngs["liquidity"])
+        self.assertFalse((saver_pool.bank_id == UNASSIGNED_BANK_ID).any())
+        self.assertTrue(saver_pool.owns_account[withdrawn].all())
+        self.assertAlmostEqual(sum([x.deposit_inflow for x in solvent_banks]),
+                               sum([x.deposit_outflow for x in solvent_banks]))
+
+    def test_aggregates(self):
+        params = dict(self.model_params, debug_aggregates=True)
+        model = BankSim(**params)
+        for i in range(3):
+            model.step()
+        for book in (model.saver_pool, model.loan_book):
+            for name, expected in book.recompute_aggregates().items():
+                np.testing.assert_allclose(getattr(book, name), expected, atol=1e-9)
+        saver_pool = model.saver_pool
+        for bank in model.banks:
+            savers = saver_pool.bank_members(bank.pos, owns_account=True)
+            self.assertAlmostEqual(saver_pool.account_balance[bank.pos], saver_pool.balance[savers].sum())
+
+    def test_view_assignment(self):
+        model = BankSim(**self.model_params)
+        model.step()
+        loan_book = model.loan_book
+        loan = loan_book[int(np.flatnonzero(loan_book.mask(approved=True, solvent=True))[0])]
+        count = loan_book.approved_count[loan.bank_id]
+        loan.loan_solvent = False
+        self.assertEqual(loan_book.approved_count[loan.bank_id], count - 1)
+        loan.loan_solvent = True
+        loan.amount = 3.0
+        loan.bank_id = (loan.bank_id + 1) % model.initial_bank
+        loan_book.check_aggregates()
+
+        saver_pool = model.saver_pool
+        saver = saver_pool[int(np.flatnonzero(saver_pool.mask(owns_account=True))[0])]
+        bank_id = saver.bank_id
+        balance = saver_pool.account_balance[bank_id]
+        saver.balance = saver.balance + 5.0
+        self.assertAlmostEqual(saver_pool.account_balance[bank_id], balance + 5.0)
+        saver.owns_account = False
+        saver.bank_id = (bank_id + 1) % model.initial_bank
+        saver_pool.check_aggregates()
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSaver)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
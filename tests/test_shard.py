@@ -0,0 +1,82 @@
+"""
+Test for the sharded SQLite results
+
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from banksim.__main__ import main
+from banksim.db.sqlitedb.shard import create_shard, list_shards, merge_shards, query_shards
+from banksim.model import BankSim
+
+
+class TestShard(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": True,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03,
+                        "seed": 5
+                        }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.shard_dir = os.path.join(self.tmpdir.name, "shards")
+        self.models = list()
+        for car in (0.04, 0.08):
+            model = BankSim(sink="sqlite", shard_dir=self.shard_dir, write_agents=True, time_phases=True,
+                            **dict(self.model_params, car=car))
+            model.run_model(step_count=3)
+            self.models.append(model)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_shard_per_run(self):
+        shards = list_shards(self.shard_dir)
+        self.assertEqual(len(shards), 2)
+        self.assertTrue(all(os.path.basename(x).startswith(str(y.simid)) for x, y in zip(shards, self.models)))
+        with self.assertRaises(Exception):
+            create_shard(shards[0])
+        res = query_shards(self.shard_dir, "SELECT SimId, COUNT(*) AS Rows FROM AgtBank WHERE StepCnt < ? "
+                                           "GROUP BY SimId", (2,))
+        self.assertEqual(res["SimId"].tolist(), [x.simid for x in self.models])
+        self.assertEqual(res["Rows"].tolist(), [2 * 10, 2 * 10])
+
+    def test_merge(self):
+        archive = os.path.join(self.tmpdir.name, "archive.sqlite")
+        for argv in ([], ["db"]):
+            with self.assertRaises(SystemExit):
+                main(argv)
+        main(["db", "merge", archive, self.shard_dir])
+        conn = sqlite3.connect(archive)
+        counts = [conn.execute("SELECT COUNT(*) FROM " + x).fetchone()[0]
+                  for x in ("Simulation", "AgtBank", "AgtSaver", "AgtLoan", "PhaseTiming")]
+        self.assertEqual(counts, [2, 2 * 3 * 10, 2 * 3 * 1000, 2 * 3 * 2000,
+                                  sum(len(x.phase_timings) for x in self.models)])
+        indexes = [x[0] for x in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertIn("IX_AgtBank_Step", indexes)
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM AgtLoan WHERE SimId = 1 AND StepCnt = 2").fetchall()
+        self.assertIn("IX_AgtLoan_Step", str(plan))
+        conn.close()
+        # the runs are in the archive already
+        with self.assertRaises(Exception):
+            merge_shards(archive, self.shard_dir)
+        self.assertEqual(merge_shards(os.path.join(self.tmpdir.name, "other.sqlite"), self.shard_dir, remove=True), 2)
+        self.assertEqual(list_shards(self.shard_dir), [])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestShard)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
@@ -0,0 +1,66 @@
+"""
+Test for the result sinks
+
+"""
+import sys
+import unittest
+
+import numpy as np
+
+from banksim.db.sink import MemorySink, NullSink, create_sink
+from banksim.model import BankSim
+
+
+class TestSink(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": True,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03,
+                        "seed": 5
+                        }
+
+    def test_create_sink(self):
+        self.assertIsInstance(create_sink("null"), NullSink)
+        self.assertTrue(create_sink("memory", write_agents=True).write_agents)
+        with self.assertRaises(Exception):
+            create_sink("csv")
+
+    def test_memory_sink(self):
+        model = BankSim(sink="memory", write_agents=True, **self.model_params)
+        model.run_model(step_count=3)
+        self.assertIsInstance(model.sink, MemorySink)
+        self.assertEqual(len(model.sink.simulations), 1)
+        banks = model.sink.frame("AgtBank")
+        self.assertEqual(len(banks), 3 * 10)
+        self.assertEqual(banks["SimId"].unique().tolist(), [model.simid])
+        loans = model.sink.frame("AgtLoan")
+        last = loans[loans["StepCnt"] == 2]
+        np.testing.assert_array_equal(last["LoanBankId"], model.loan_book.bank_id)
+        self.assertEqual(list(last.iloc[7, 3:-1]), model.loan_book[7].get_all_variables()[3:-1])
+
+    def test_sink_instance(self):
+        sink = MemorySink()
+        model = BankSim(sink=sink, **self.model_params)
+        model.run_model(step_count=2)
+        self.assertIs(model.sink, sink)
+        self.assertEqual(len(sink.frame("AgtBank")), 2 * 10)
+        self.assertEqual(len(sink.frame("AgtSaver")), 0)
+
+    def test_null_sink(self):
+        model = BankSim(sink="null", **self.model_params)
+        model.run_model(step_count=2)
+        self.assertIsInstance(model.sink, NullSink)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSink)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
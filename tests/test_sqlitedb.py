@@ -0,0 +1,147 @@
+"""
+Test for the bulk SQLite writer
+
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+from banksim.model import BankSim
+from banksim.db.base_handler import DBHandler
+from banksim.db.sqlitedb.sqlite_handler import SQLiteHandler
+from banksim.util.write_sqlitedb import BackgroundWriter, SQLiteWriter, WriterError, agent_row_id
+
+
+class TestSQLiteDB(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": False,
+                        "max_steps": 10,
+                        "initial_saver": 1000,
+                        "initial_bank": 10,
+                        "initial_loan": 2000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03,
+                        "seed": 5
+                        }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sqlite_db = os.path.join(self.tmpdir.name, "result.sqlite")
+        conn = sqlite3.connect(self.sqlite_db)
+        with open("conf/banksim_sqlite.sql") as fin:
+            conn.executescript(fin.read())
+        conn.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_agent_row_id(self):
+        for unique_id in (1, 89999, 90000, 123456):
+            self.assertEqual(agent_row_id(3, unique_id), int(str(10003) + str(10000 + unique_id)))
+
+    def test_sqlite_handler(self):
+        handler = SQLiteHandler(self.sqlite_db, table_name="Simulation")
+        handler.insert_item({"SimId": 1, "Title": "first", "SimDate": "2020-01-01"})
+        handler.insert_items([{"SimId": 2, "Title": "second", "SimDate": "2020-01-02"},
+                              {"SimId": 3, "Title": "third", "SimDate": "2020-01-03"}])
+        self.assertEqual(handler.find_item({"SimId": 2})["Title"], "second")
+        self.assertEqual(handler.update_items({"SimId": 3}, {"$set": {"Title": "last"}}), 1)
+        self.assertEqual([x["Title"] for x in handler.find_items()], ["first", "second", "last"])
+        self.assertEqual(handler.delete_items({"SimId": 1}), 1)
+        self.assertEqual(handler.aggregate("SELECT COUNT(*) FROM Simulation"), [(2,)])
+        self.assertIsNone(handler.find_item({"SimId": 1}))
+        handler.close()
+
+    def test_write_steps(self):
+        model = BankSim(**self.model_params)
+        writer = SQLiteWriter(self.sqlite_db, commit_every=2, write_agents=True)
+        writer.insert_simulation((1, "test", "2020-01-01 00:00:00"))
+        n_ibloans = 0
+        for i in range(3):
+            model.step()
+            n_ibloans += len(model.ibloan_book)
+            writer.write_step(1, i, model.banks, model.saver_pool, model.loan_book, model.ibloan_book)
+        self.assertEqual(writer.pending_steps, 1)
+        self.assertIsInstance(writer.handler, DBHandler)
+        self.assertEqual(writer.conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        writer.close()
+
+        conn = sqlite3.connect(self.sqlite_db)
+        counts = [conn.execute("SELECT COUNT(*) FROM " + x).fetchone()[0]
+                  for x in ("AgtBank", "AgtSaver", "AgtLoan", "AgtIbLoan")]
+        self.assertEqual(counts, [3 * 10, 3 * 1000, 3 * 2000, n_ibloans])
+        # the last step's rows hold the same values as the agent views
+        for table, key, agents in (("AgtSaver", "SaverId", model.saver_pool), ("AgtLoan", "LoanId", model.loan_book),
+                                   ("AgtBank", "BankId", model.banks)):
+            for agent in [agents[0], agents[7]]:
+                row = conn.execute("SELECT * FROM {} WHERE StepCnt = 2 AND {} = ?".format(table, key),
+                                   (agent.unique_id,)).fetchone()
+                self.assertEqual(row[0], agent_row_id(2, agent.unique_id))
+                self.assertEqual(list(row[3:-1]), agent.get_all_variables()[3:-1])
+        conn.close()
+
+    def test_background_writer(self):
+        model = BankSim(**self.model_params)
+        writer = BackgroundWriter(SQLiteWriter(self.sqlite_db, commit_every=10, write_agents=True), max_pending=2)
+        writer.open(1, "test", "2020-01-01 00:00:00")
+        balance = list()
+        for i in range(4):
+            model.step()
+            balance.append(model.saver_pool.balance[:5].tolist())
+            writer.write_step(1, i, model.banks, model.saver_pool, model.loan_book, model.ibloan_book)
+        writer.flush()
+        conn = sqlite3.connect(self.sqlite_db)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM AgtLoan").fetchone()[0], 4 * 2000)
+        # rows hold the state of the step they were queued in
+        for i in range(4):
+            rows = conn.execute("SELECT SaverBalance FROM AgtSaver WHERE StepCnt = ? ORDER BY SaverId LIMIT 5",
+                                (i,)).fetchall()
+            self.assertEqual([x[0] for x in rows], balance[i])
+        conn.close()
+        writer.close()
+        self.assertFalse(writer.thread.is_alive())
+
+    def test_background_writer_error(self):
+        model = BankSim(**self.model_params)
+        model.step()
+        writer = BackgroundWriter(SQLiteWriter(self.sqlite_db, write_agents=True))
+        for i in range(2):
+            # the second step violates the primary key of the first
+            writer.write_step(1, 0, model.banks, model.saver_pool, model.loan_book, model.ibloan_book)
+        with self.assertRaises(WriterError):
+            writer.flush()
+        with self.assertRaises(WriterError):
+            writer.write_step(1, 1, model.banks)
+        with self.assertRaises(WriterError):
+            writer.close()
+        self.assertFalse(writer.thread.is_alive())
+        # the failed sink is closed all the same
+        self.assertIsNone(writer.writer.conn)
+        self.assertFalse(os.path.exists(self.sqlite_db + "-wal"))
+        self.assertFalse(os.path.exists(self.sqlite_db + "-shm"))
+
+    def test_run_model_raises_writer_error(self):
+        model = BankSim(**dict(self.model_params, write_db=True, profile_memory=True))
+        model.sqlite_db = self.sqlite_db
+        model.step()
+        model.sink.write_step(model.simid, 1, model.banks)  # collides with the rows of the next step
+        with self.assertRaises(WriterError) as cm:
+            model.run_model(step_count=3)
+        # the error of the failed step, not a second one raised by close
+        self.assertNotIsInstance(cm.exception.__context__, WriterError)
+        self.assertFalse(model.sink.thread.is_alive())
+        self.assertIsNone(model.sink.writer.conn)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSQLiteDB)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)
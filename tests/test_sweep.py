@@ -0,0 +1,99 @@
+"""
+Test for the parameter sweep runner
+
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from banksim.model import BankSim, new_simid
+from banksim.db.sink import NullSink
+from banksim.db.sqlitedb.shard import list_shards, merge_shards
+from banksim.sweep import expand_grid, run_sweep
+
+
+class LockedSink(NullSink):
+    """
+    Background sink whose writes fail like those to a locked database
+    """
+    background = True
+
+    def snapshot(self, simid, numstep, banks, saver_pool=None, loan_book=None, ibloan_book=None):
+        return numstep
+
+    def write_snapshot(self, snapshot):
+        raise Exception("database is locked")
+
+
+class TestSweep(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_params = {"init_db": False,
+                        "write_db": False,
+                        "max_steps": 3,
+                        "initial_saver": 500,
+                        "initial_bank": 5,
+                        "initial_loan": 1000,
+                        "initial_equity": 100,
+                        "rfree": 0.01,
+                        "car": 0.08,
+                        "min_reserves_ratio": 0.03
+                        }
+
+    def test_expand_grid(self):
+        specs = expand_grid(self.model_params, {"car": [0.04, 0.08], "initial_bank": [5, 6, 7]}, replicas=2)
+        self.assertEqual(len(specs), 12)
+        self.assertEqual([x["run_id"] for x in specs], list(range(12)))
+        self.assertEqual([x["replica"] for x in specs[:4]], [0, 1, 0, 1])
+        self.assertEqual(specs[2]["params"]["initial_bank"], 6)
+        self.assertEqual(specs[2]["point"], {"car": 0.04, "initial_bank": 6})
+        self.assertEqual(specs[3]["params"]["replica"], 1)
+        self.assertEqual(self.model_params["car"], 0.08)
+
+    def test_results_per_instance(self):
+        first, second = BankSim(**self.model_params), BankSim(**self.model_params)
+        first.run_model(step_count=2)
+        self.assertEqual(len(first.bank_ratios.frame()), 2 * 5)
+        self.assertEqual(len(second.bank_ratios), 0)
+
+    def test_run_sweep(self):
+        grid = {"car": [0.04, 0.08], "initial_bank": [5, 6]}
+        result = run_sweep(self.model_params, grid, replicas=2, step_count=2, max_workers=2, seed=3)
+        self.assertEqual(sorted(result["run_id"].unique()), list(range(8)))
+        self.assertEqual(list(result.columns[:6]), ["run_id", "seed", "replica", "initial_bank", "step", "bank"])
+        self.assertTrue((result["seed"] == 3).all())
+        self.assertIn("car", result.columns)
+        rows = result.groupby("run_id").size()
+        self.assertEqual(rows.tolist(), [2 * 5, 2 * 5, 2 * 6, 2 * 6] * 2)
+        run = result[result["run_id"] == 2]
+        self.assertEqual(run["bank"].tolist(), list(range(6)) * 2)
+        self.assertEqual(run["step"].tolist(), [0] * 6 + [1] * 6)
+
+    def test_sharded_sweep(self):
+        simids = [new_simid() for i in range(1000)]
+        self.assertEqual(simids, sorted(set(simids)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            params = dict(self.model_params, write_db=True, sink="sqlite", shard_dir=os.path.join(tmpdir, "shards"))
+            run_sweep(params, {"car": [0.04, 0.08, 0.12]}, replicas=8, step_count=2, max_workers=8, seed=1)
+            shards = list_shards(params["shard_dir"])
+            self.assertEqual(len(shards), 24)
+            archive = os.path.join(tmpdir, "archive.sqlite")
+            self.assertEqual(merge_shards(archive, shards), 24)
+            conn = sqlite3.connect(archive)
+            try:
+                self.assertEqual(conn.execute("SELECT COUNT(DISTINCT SimId) FROM AgtBank").fetchone()[0], 24)
+            finally:
+                conn.close()
+
+    def test_failed_run(self):
+        params = dict(self.model_params, write_db=True)
+        result = run_sweep(params, {"sink": ["null", LockedSink()]}, replicas=2, step_count=2, max_workers=2, seed=3)
+        self.assertEqual(sorted(result["run_id"].unique()), [0, 1])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSweep)
+    unittest.TextTestRunner(verbosity=2, stream=sys.stderr).run(suite)